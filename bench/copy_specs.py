@@ -0,0 +1,43 @@
+"""
+Times copying a spec DAG whose nodes are reachable along many paths.
+
+Run it with:
+
+    spack python bench/copy_specs.py
+
+The DAG has six layers.  The root depends on all four nodes of the
+next layer, and each of those on all four nodes of the layer below,
+so there are 21 nodes and 1024 paths from the root to a leaf.  A copy
+that duplicates shared nodes has more nodes than the original.
+"""
+import timeit
+
+from spack.spec import Spec
+
+layers = 6
+width = 4
+
+below = []
+for layer in reversed(range(1, layers)):
+    below = [Spec('node%d_%d' % (layer, i), *below) for i in range(width)]
+root = Spec('root', *below)
+
+
+def count_nodes(spec):
+    """Number of distinct node objects in spec's DAG."""
+    seen = {}
+    stack = [spec]
+    while stack:
+        node = stack.pop()
+        if id(node) not in seen:
+            seen[id(node)] = node
+            stack.extend(node.dependencies.values())
+    return len(seen)
+
+
+number = 20
+seconds = min(timeit.repeat(root.copy, number=number, repeat=3)) / number
+print "Copying a %d-node DAG with %d root-to-leaf paths:" % (
+    count_nodes(root), width ** (layers - 1))
+print "  %.2f ms, copy has %d nodes" % (
+    seconds * 1e3, count_nodes(root.copy()))
@@ -0,0 +1,85 @@
+"""
+Times importing package classes and making package instances.
+
+Run it with:
+
+    spack python bench/load_packages.py
+
+This writes 1,000 generated packages to a temporary packages directory
+inside spack's module path, and removes it afterwards.  Each package
+has 4 versions, up to 3 depends_on, one provides and one @when method.
+"""
+import os
+import time
+import shutil
+import tempfile
+
+import spack
+import spack.packages as packages
+from spack.spec import Spec
+
+count = 1000
+instance_count = 5000
+
+package_template = '''\
+from spack import *
+
+class %(class_name)s(Package):
+    homepage = "http://www.example.com"
+    url      = "http://www.example.com/%(name)s-1.0.tar.gz"
+
+    versions = { '1.0' : 'foobarbaz',
+                 '1.1' : 'foobarbaz',
+                 '1.2' : 'foobarbaz',
+                 '2.0' : 'foobarbaz' }
+
+%(depends)s
+    provides('%(name)s-api@1:', when='@1:')
+
+    def install(self, spec, prefix):
+        pass
+
+    @when('@2:')
+    def install(self, spec, prefix):
+        pass
+'''
+
+
+def package_name(i):
+    return 'pkg%04d' % i
+
+
+def write_packages(path):
+    open(os.path.join(path, '__init__.py'), 'w').close()
+    for i in range(count):
+        name = package_name(i)
+        deps = [package_name(i / d) for d in (2, 3, 5) if i / d < i]
+        with open(os.path.join(path, name + '.py'), 'w') as f:
+            f.write(package_template % {
+                'name'       : name,
+                'class_name' : packages.class_name_for_package_name(name),
+                'depends'    : ''.join("    depends_on('%s')\n" % dep
+                                       for dep in sorted(set(deps))) })
+
+
+path = tempfile.mkdtemp(dir=spack.module_path)
+try:
+    write_packages(path)
+    spack.packages_path = path
+    names = [package_name(i) for i in range(count)]
+
+    start = time.time()
+    classes = [packages.get_class_for_package_name(name) for name in names]
+    import_time = time.time() - start
+
+    specs = [Spec(names[i % count] + '@1.0') for i in range(instance_count)]
+    start = time.time()
+    for i, spec in enumerate(specs):
+        classes[i % count](spec)
+    instance_time = time.time() - start
+finally:
+    shutil.rmtree(path, True)
+
+print "%d generated packages:" % count
+print "  import all classes:   %.2f s" % import_time
+print "  %d instances:      %.2f s" % (instance_count, instance_time)
@@ -0,0 +1,52 @@
+"""
+Times building Specs from strings, which exercises the spec lexer and
+parser and the cache of parsed specs.
+
+Run it with:
+
+    spack python bench/parse_specs.py
+
+"cold" parses strings that have not been seen before, and "cached"
+parses the same strings over and over.  Run it at an older revision
+to compare.
+"""
+import timeit
+
+from spack.spec import Spec
+
+templates = [
+    'mpileaks@1.{0}',
+    'mpileaks@1.{0} %gcc@4.7.2 +debug',
+    'mpileaks@1.{0}%gcc@4.7 ^callpath@1.2:1.4 ^mpich@3: =chaos_5_x86_64_ib',
+    'libdwarf@2013{0} ^libelf@0.8.13 %intel@12.1',
+    'mvapich_foo@{0} ^_openmpi@1.2:1.4,1.6%intel@12.1+debug~qt_4 '
+    '^stackwalker@8.1_1e']
+
+rounds = 2000
+
+
+def per_spec(seconds):
+    return seconds / (rounds * len(templates)) * 1e6
+
+
+# Fresh numbers on each repeat, so the strings are always new.
+offset = [0]
+def parse_cold():
+    offset[0] += rounds
+    for i in xrange(offset[0], offset[0] + rounds):
+        for template in templates:
+            Spec(template.format(i))
+
+
+strings = [template.format(0) for template in templates]
+def parse_cached():
+    for i in xrange(rounds):
+        for string in strings:
+            Spec(string)
+
+
+cold = min(timeit.repeat(parse_cold, number=1, repeat=3))
+cached = min(timeit.repeat(parse_cached, number=1, repeat=3))
+print "Spec() on %d representative strings:" % len(templates)
+print "  cold:    %8.1f us/spec" % per_spec(cold)
+print "  cached:  %8.1f us/spec" % per_spec(cached)
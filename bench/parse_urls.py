@@ -0,0 +1,69 @@
+"""
+Times finding package names and versions in URLs.
+
+Run it with:
+
+    spack python bench/parse_urls.py
+
+The URLs are the ones in spack's url_parse tests.  "cold" clears the
+parse caches before each pass, where there are any, and re's own cache
+of compiled patterns, which a long listing overflows.  "warm" doesn't.
+The listing is 1800 links made by cycling through the same URLs, as
+on a page where many links repeat.  It is parsed with
+parse_names_and_versions() where that exists, and with a loop over
+parse_name_and_version() where it doesn't.
+"""
+import os
+import re
+import timeit
+
+import spack
+import spack.url as url
+
+test_file = os.path.join(spack.module_path, 'test', 'url_parse.py')
+with open(test_file) as f:
+    corpus = re.findall(r"'(https?://[^']+)'", f.read())
+
+listing = [corpus[i % len(corpus)] for i in range(1800)]
+
+
+def clear_caches():
+    re.purge()
+    for name in ('_version_cache', '_name_cache'):
+        cache = getattr(url, name, None)
+        if cache is not None:
+            cache.clear()
+
+
+def parse_all(paths):
+    for path in paths:
+        try:
+            url.parse_name_and_version(path)
+        except url.UndetectableVersionError:
+            pass
+
+
+def parse_listing():
+    if hasattr(url, 'parse_names_and_versions'):
+        list(url.parse_names_and_versions(listing))
+    else:
+        parse_all(listing)
+
+
+def per_url(function, paths, cold):
+    def run():
+        if cold:
+            clear_caches()
+        function()
+    number = 5
+    seconds = min(timeit.repeat(run, number=number, repeat=3)) / number
+    return seconds / len(paths) * 1e6
+
+
+print "Per URL (us):"
+print "  %d URLs in the corpus, cold caches: %8.1f" % (
+    len(corpus), per_url(lambda: parse_all(corpus), corpus, True))
+print "  %d URLs in the corpus, warm caches: %8.1f" % (
+    len(corpus), per_url(lambda: parse_all(corpus), corpus, False))
+print "  %d-link listing, cold caches:     %8.1f" % (
+    len(listing), per_url(parse_listing, listing, True))
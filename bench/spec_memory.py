@@ -0,0 +1,70 @@
+"""
+Measures the memory used by spec DAGs read back from spec files, and
+whether dropping them leaves reference cycles for the garbage
+collector.
+
+Run it with:
+
+    spack python bench/spec_memory.py
+
+Each mock package is concretized and written out with to_dict().  The
+results are then read back 10,000 times round-robin with from_dict()
+and frozen, the way installed specs are read by all_specs().  Memory
+is the growth of the resident set size, so run it in a fresh process.
+"""
+import gc
+import os
+import json
+import resource
+
+import spack
+import spack.packages as packages
+from spack.spec import Spec
+from spack.test.mock_packages_test import mock_packages_path
+
+count = 10000
+
+
+def rss():
+    """Resident set size of this process, in bytes."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+        return pages * resource.getpagesize()
+    except IOError:
+        # ru_maxrss is the peak, which only grows while specs are loaded.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def count_nodes(spec):
+    """Number of distinct node objects in spec's DAG."""
+    seen = set()
+    stack = [spec]
+    while stack:
+        node = stack.pop()
+        if id(node) not in seen:
+            seen.add(id(node))
+            stack.extend(node.dependencies.values())
+    return len(seen)
+
+
+spack.packages_path = mock_packages_path
+spec_files = [json.dumps(Spec(name + '=x86_64').concretized().to_dict())
+              for name in sorted(packages.all_package_names())]
+gc.collect()
+
+start = rss()
+specs = []
+for i in xrange(count):
+    spec = Spec.from_dict(json.loads(spec_files[i % len(spec_files)]))
+    spec.freeze()
+    specs.append(spec)
+used = rss() - start
+nodes = sum(count_nodes(spec) for spec in specs)
+
+del specs, spec
+left = gc.collect()
+
+print "Read %d spec files with %d nodes in total:" % (count, nodes)
+print "  %.1f MB (%d bytes/node), %d objects left for gc" % (
+    used / 1e6, used / nodes, left)
@@ -0,0 +1,65 @@
+"""
+Times building, combining and intersecting large VersionLists.
+
+Run it with:
+
+    spack python bench/version_lists.py
+
+Lists are made of random versions and ranges from a fixed seed, so
+every run and every revision works on the same lists.  The last case
+is about eight times larger; with quadratic intersection it takes a
+while.
+"""
+import random
+import timeit
+
+from spack.version import VersionList
+
+rand = random.Random(42)
+
+
+def random_version():
+    return '%d.%d.%d' % (
+        rand.randint(0, 99), rand.randint(0, 99), rand.randint(0, 99))
+
+
+def random_range():
+    """A short range, so that ranges in a list rarely merge."""
+    major, minor, patch = [rand.randint(0, 99) for i in range(3)]
+    return '%d.%d.%d:%d.%d.%d' % (
+        major, minor, patch, major, minor, patch + rand.randint(1, 5))
+
+
+def versions(n):
+    return [random_version() for i in range(n)]
+
+
+def ranges(n):
+    return [random_range() for i in range(n)]
+
+
+def best(function, repeat=3):
+    """Best time for one call to function, in ms."""
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1e3
+
+
+plain, other = VersionList(versions(600)), VersionList(versions(300))
+range_strings = ranges(500)
+with_ranges = VersionList(range_strings)
+more_ranges = VersionList(ranges(500))
+large, large_other = VersionList(versions(5000)), VersionList(versions(2500))
+
+def report(label, ms):
+    print "  %-36s %10.1f" % (label, ms)
+
+print "Timings (ms):"
+report("intersection, %d x %d" % (len(plain), len(other)),
+       best(lambda: plain.intersection(other)))
+report("intersection with %d ranges" % len(with_ranges),
+       best(lambda: plain.intersection(with_ranges)))
+report("construction, %d ranges" % len(range_strings),
+       best(lambda: VersionList(range_strings)))
+report("union, %d x %d ranges" % (len(with_ranges), len(more_ranges)),
+       best(lambda: with_ranges.union(more_ranges)))
+report("intersection, %d x %d" % (len(large), len(large_other)),
+       best(lambda: large.intersection(large_other), repeat=1))
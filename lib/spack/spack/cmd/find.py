@@ -22,6 +22,7 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
+import sys
 import collections
 import argparse
 from StringIO import StringIO
@@ -112,7 +113,8 @@ def find(parser, args):
 
             elif args.full_specs:
                 for spec in specs:
-                    print spec.tree(indent=4, format='$_$@$+', color=True),
+                    spec.tree(indent=4, format='$_$@$+', color=True,
+                              stream=sys.stdout)
             else:
                 for abbrv in abbreviated:
                     print "    %s" % abbrv
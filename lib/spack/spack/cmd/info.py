@@ -28,6 +28,7 @@ import textwrap
 import spack
 import spack.packages as packages
 from spack.colify import colify
+from spack.version import Version
 
 description = "Get detailed information on a particular package"
 
@@ -36,7 +37,7 @@ def setup_parser(subparser):
 
 
 def info(parser, args):
-    package = packages.get(args.name)
+    package = packages.info(args.name)
     print "Package:   ", package.name
     print "Homepage:  ", package.homepage
     print "Download:  ", package.url
@@ -45,29 +46,29 @@ def info(parser, args):
     print "Safe versions:  "
 
     if package.versions:
-        colify(reversed(sorted(package.versions)), indent=4)
+        colify(reversed(sorted(Version(v) for v in package.versions)), indent=4)
     else:
         print "None.  Use spack versions %s to get a list of downloadable versions." % package.name
 
     print
     print "Dependencies:"
     if package.dependencies:
-        colify(package.dependencies, indent=4)
+        colify(sorted(package.dependencies), indent=4)
     else:
         print "    None"
 
     print
     print "Virtual packages: "
     if package.provided:
-        for spec, when in package.provided.items():
+        for spec, when in package.provided:
             print "    %s provides %s" % (when, spec)
     else:
         print "    None"
 
     print
     print "Description:"
-    if package.__doc__:
-        doc = re.sub(r'\s+', ' ', package.__doc__)
+    if package.doc:
+        doc = re.sub(r'\s+', ' ', package.doc)
         lines = textwrap.wrap(doc, 72)
         for line in lines:
             print "    " + line
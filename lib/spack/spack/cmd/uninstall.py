@@ -26,6 +26,7 @@ import argparse
 
 import spack.cmd
 import spack.tty as tty
+import spack.spec
 import spack.packages as packages
 
 description="Remove an installed package"
@@ -46,7 +47,7 @@ def uninstall(parser, args):
 
     # For each spec provided, make sure it refers to only one package.
     # Fail and ask user to be unambiguous if it doesn't
-    pkgs = []
+    installed_specs = []
     for spec in specs:
         matching_specs = packages.get_installed(spec)
         if len(matching_specs) > 1:
@@ -56,14 +57,15 @@ def uninstall(parser, args):
         elif len(matching_specs) == 0:
             tty.die("%s does not match any installed packages." % spec)
 
-        installed_spec = matching_specs[0]
-        pkgs.append(packages.get(installed_spec))
+        installed_specs.append(matching_specs[0])
 
-    # Sort packages to be uninstalled by the number of installed dependents
-    # This ensures we do things in the right order
-    def num_installed_deps(pkg):
-        return len(pkg.installed_dependents)
-    pkgs.sort(key=num_installed_deps)
+    # Uninstall packages before the packages they depend on.  Installed
+    # specs are read separately, so compare nodes by hash, not identity.
+    selected = set(spec.sha1() for spec in installed_specs)
+    ordered = spack.spec.traverse_specs(
+        installed_specs, order='topo', reverse=True,
+        key=lambda spec: spec.sha1())
+    pkgs = [packages.get(spec) for spec in ordered if spec.sha1() in selected]
 
     # Uninstall packages in order now.
     for pkg in pkgs:
@@ -0,0 +1,108 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+import time
+import multiprocessing
+
+import spack.spec
+import spack.packages as packages
+import spack.tty as tty
+
+description = "Check packages for errors, in parallel"
+
+def setup_parser(subparser):
+    subparser.add_argument(
+        '-j', '--jobs', type=int, dest='jobs',
+        default=multiprocessing.cpu_count(),
+        help="Number of processes to check packages with")
+    subparser.add_argument(
+        'packages', nargs='*', metavar='PACKAGE',
+        help="Packages to check.  Default is all of them.")
+
+
+def validate_one(pkg_name):
+    """Check one package.  Returns its name, how long it took, its
+       errors and its PackageInfo.  This runs in worker processes, so
+       anything that goes wrong, even a call to tty.die() while loading
+       a broken dependency, is reported as an error."""
+    start = time.time()
+    try:
+        errors, info = packages.validate_package(pkg_name)
+    except Exception, e:
+        errors, info = ["Unexpected error: %s" % e], None
+    except SystemExit:
+        errors, info = ["Spack exited while checking this package."], None
+    return pkg_name, time.time() - start, errors, info
+
+
+def known_packages(infos):
+    """Names of all packages and of the virtual packages they provide,
+       from the PackageInfos of packages just checked if those are all
+       of them, or else from the package index."""
+    names = set(packages.all_package_names())
+    if not names.issubset(infos):
+        return names | set(packages.provider_index().providers)
+
+    for info in infos.values():
+        if info:
+            names.update(spack.spec.Spec(provided).name
+                         for provided, provider in info.provided)
+    return names
+
+
+def validate(parser, args):
+    names = args.packages or sorted(packages.all_package_names())
+    jobs = max(1, min(args.jobs, len(names)))
+
+    start = time.time()
+    if jobs == 1:
+        results = [validate_one(name) for name in names]
+    else:
+        pool = multiprocessing.Pool(jobs)
+        chunksize = max(1, len(names) / (jobs * 8))
+        results = pool.map(validate_one, names, chunksize)
+        pool.close()
+        pool.join()
+
+    # Dependencies can only be checked once it's known what all the
+    # packages provide.
+    known = known_packages(dict((name, info) for name, s, e, info in results))
+
+    failed = 0
+    for name, seconds, errors, info in results:
+        if info:
+            errors.extend("Depends on unknown package %s" % dep
+                          for dep in sorted(info.dependencies)
+                          if dep not in known)
+
+        print "%-30s %8.3fs  %s" % (name, seconds, "FAILED" if errors else "ok")
+        for error in errors:
+            print "    " + error
+        if errors:
+            failed += 1
+
+    tty.msg("Checked %d packages in %.2fs with %d processes."
+            % (len(names), time.time() - start, jobs))
+    if failed:
+        tty.die("%d of %d packages have errors." % (failed, len(names)))
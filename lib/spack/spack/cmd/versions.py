@@ -23,15 +23,87 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
 import os
+import threading
+from Queue import Queue, Empty
+
+import spack
 import spack.packages as packages
+import spack.tty as tty
 from spack.colify import colify
 
 description ="List available versions of a package"
 
 def setup_parser(subparser):
-    subparser.add_argument('package', metavar='PACKAGE', help='Package to list versions for')
+    subparser.add_argument('-p', '--probe', action='store_true', dest='probe',
+                           help='Find new versions by probing for their archives')
+    subparser.add_argument('-r', '--refresh', action='store_true', dest='refresh',
+                           help='Look for versions again even if they are cached')
+    subparser.add_argument('-a', '--all', action='store_true', dest='all',
+                           help='Update cached versions of all packages')
+    subparser.add_argument('-j', '--jobs', type=int, dest='jobs',
+                           default=spack.versions_concurrency,
+                           help='Number of packages to update at once with --all')
+    subparser.add_argument('package', metavar='PACKAGE', nargs='?',
+                           help='Package to list versions for')
+
+
+def update_all(refresh, jobs):
+    """Look for versions of every package whose cached versions are
+       stale, or of every package if refresh is true, with at most jobs
+       packages at a time.  Prints how many versions each one has."""
+    names = Queue()
+    for name in sorted(packages.all_package_names()):
+        names.put(name)
+
+    lock = threading.Lock()
+    failed = []
+
+    def work():
+        while True:
+            try:
+                name = names.get_nowait()
+            except Empty:
+                return
+
+            try:
+                pkg = packages.get(name)
+                versions = None if refresh else pkg.cached_available_versions()
+                if versions is None:
+                    versions = pkg.find_available_versions()
+            except (Exception, SystemExit), e:
+                # One broken package shouldn't stop the rest, but it
+                # still has to make the command fail.
+                with lock:
+                    failed.append(name)
+                    tty.warn("Couldn't find versions of %s: %s" % (name, e))
+                continue
+
+            with lock:
+                tty.msg("%s: %d versions" % (name, len(versions or [])))
+
+    workers = [threading.Thread(target=work) for i in range(max(1, jobs))]
+    for worker in workers:
+        worker.daemon = True
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    if failed:
+        tty.die("Couldn't find versions of %d packages." % len(failed))
 
 
 def versions(parser, args):
+    if args.all:
+        if args.package:
+            tty.die("spack versions --all takes no package.")
+        update_all(args.refresh, args.jobs)
+        return
+
+    if not args.package:
+        tty.die("spack versions requires a package argument.")
+
     pkg = packages.get(args.package)
-    colify(reversed(pkg.fetch_available_versions()))
+    if args.probe:
+        colify(reversed(pkg.probe_available_versions()))
+    else:
+        colify(reversed(pkg.fetch_available_versions(refresh=args.refresh)))
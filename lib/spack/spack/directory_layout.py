@@ -27,12 +27,19 @@ import os
 import os.path
 import exceptions
 import hashlib
+import json
 
 from spack.spec import Spec
 from spack.util.filesystem import *
 from spack.error import SpackError
 
 
+"""Version of the structured format that write_spec() uses for spec
+   files.  Bump this whenever the layout of the stored data, or the way
+   stored hashes are computed, changes."""
+spec_file_format = 1
+
+
 def _check_concrete(spec):
     """If the spec is not concrete, raise a ValueError"""
     if not spec.concrete:
@@ -145,23 +152,42 @@ class SpecHashDirectoryLayout(DirectoryLayout):
 
         if spec.dependencies:
             path += "-"
-            sha1 = spec.dependencies.sha1()
+            sha1 = spec.dependencies.install_hash()
             path += sha1[:self.prefix_size]
 
         return path
 
 
     def write_spec(self, spec, path):
-        """Write a spec out to a file."""
+        """Write a spec out to a file, as JSON in the structured format
+           produced by Spec.to_dict()."""
+        data = { 'spec_format' : spec_file_format,
+                 'spec'        : spec.to_dict() }
         with closing(open(path, 'w')) as spec_file:
-            spec_file.write(spec.tree(ids=False, cover='nodes'))
+            json.dump(data, spec_file, sort_keys=True, separators=(',', ':'))
 
 
     def read_spec(self, path):
-        """Read the contents of a file and parse them as a spec"""
+        """Read a spec from a file.  Structured spec files are loaded
+           directly, without parsing.  Older installs store the text of
+           spec.tree() instead, and those are still parsed as specs.
+           Installed specs don't change, so the spec returned is frozen."""
         with closing(open(path)) as spec_file:
-            string = spec_file.read().replace('\n', '')
-            return Spec(string)
+            string = spec_file.read()
+
+        if not string.lstrip().startswith('{'):
+            return Spec(string.replace('\n', '')).freeze()
+
+        try:
+            data = json.loads(string)
+            version = data['spec_format']
+            if version > spec_file_format:
+                raise InvalidSpecFileError(
+                    path, "unknown spec file format %s" % version)
+            spec = Spec.from_dict(data['spec'])
+        except (ValueError, KeyError, TypeError, IndexError), e:
+            raise InvalidSpecFileError(path, str(e))
+        return spec.freeze()
 
 
     def make_path_for_spec(self, spec):
@@ -226,6 +252,13 @@ class InconsistentInstallDirectoryError(DirectoryLayoutError):
         super(InconsistentInstallDirectoryError, self).__init__(message)
 
 
+class InvalidSpecFileError(DirectoryLayoutError):
+    """Raised when a spec file can't be read."""
+    def __init__(self, path, message):
+        super(InvalidSpecFileError, self).__init__(
+            "Invalid spec file %s: %s" % (path, message))
+
+
 class InstallDirectoryAlreadyExistsError(DirectoryLayoutError):
     """Raised when make_path_for_sec is called unnecessarily."""
     def __init__(self, path):
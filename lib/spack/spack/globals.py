@@ -46,6 +46,10 @@ test_path      = new_path(module_path, "test")
 
 var_path       = new_path(prefix, "var", "spack")
 stage_path     = new_path(var_path, "stage")
+listing_cache_path = new_path(var_path, "cache", "listings")
+probe_cache_path   = new_path(var_path, "cache", "probes")
+index_cache_path   = new_path(var_path, "cache", "indices")
+versions_cache_path = new_path(var_path, "cache", "versions")
 
 install_path   = new_path(prefix, "opt")
 
@@ -118,6 +122,35 @@ sys_type = None
 #
 mirrors = []
 
+# Maximum number of pages to fetch at once when spidering the web for
+# available versions of packages.
+spider_concurrency = 16
+
+# Most archives that 'spack versions --probe' checks for when it guesses
+# versions of a package that has no page listing them.
+max_probes = 256
+
+# Listing pages fetched to find versions of packages are cached in
+# listing_cache_path, and the results of probing for archives in
+# probe_cache_path.  Cached pages are used as-is for this many seconds;
+# after that, spack asks the server whether they've changed.
+listing_cache_ttl = 24 * 60 * 60
+
+# Size in bytes that each cache is trimmed to after it's used.
+listing_cache_size = 64 * 2**20
+
+# Versions of packages found on the web are cached in
+# versions_cache_path, and are looked for again after this many seconds.
+versions_cache_ttl = 24 * 60 * 60
+
+# Maximum number of packages that 'spack versions --all' looks for
+# versions of at once.  Each of them spiders with spider_concurrency.
+versions_concurrency = 4
+
+# If this is true, spack never goes to the network to list versions
+# and uses whatever is in the listing cache, however old.
+offline = False
+
 # Important environment variables
 SPACK_NO_PARALLEL_MAKE = 'SPACK_NO_PARALLEL_MAKE'
 SPACK_LIB = 'SPACK_LIB'
@@ -44,15 +44,71 @@ depending on the scenario, regular old conditionals might be clearer,
 so package authors should use their judgement.
 """
 import sys
+import types
 import functools
 import collections
 
+import spack
 import spack.architecture
 import spack.error
 from spack.util.lang import *
 from spack.spec import parse_anonymous_spec, Spec
 
 
+"""Most dispatch results each multimethod remembers for concrete specs."""
+_dispatch_cache_size = 256
+
+
+class _WhenTable(object):
+    """Decision table for the @when conditions of a SpecMultiMethod.
+
+       A condition can only match a package spec with the same name, an
+       architecture that is either unset or equal, and a compiler with
+       the same name, if both have one.  Conditions are grouped by each
+       of these, so that candidates() rejects conditions that differ in
+       any of them without calling satisfies().
+    """
+    def __init__(self, specs):
+        self.by_name = {}
+        by_arch = {}
+        by_compiler = {}
+        for i, spec in enumerate(specs):
+            self.by_name.setdefault(spec.name, []).append(i)
+            by_arch.setdefault(spec.architecture, set()).add(i)
+            by_compiler.setdefault(_compiler_name(spec), set()).add(i)
+
+        self.arch_allows = self._allowed(by_arch)
+        self.compiler_allows = self._allowed(by_compiler)
+
+
+    @staticmethod
+    def _allowed(groups):
+        """Dict from each value to the conditions it can match.
+           Conditions without a value match anything, so they are in
+           every group, and under the key None for values not seen."""
+        unrestricted = groups.pop(None, set())
+        allowed = dict((value, indices | unrestricted)
+                       for value, indices in groups.iteritems())
+        allowed[None] = unrestricted
+        return allowed
+
+
+    def candidates(self, spec):
+        """Indices, in order, of the conditions that may match spec."""
+        indices = self.by_name.get(spec.name, [])
+        for allows, value in ((self.arch_allows, spec.architecture),
+                              (self.compiler_allows, _compiler_name(spec))):
+            # A spec without a value can match any condition.
+            if value is not None:
+                allowed = allows.get(value, allows[None])
+                indices = [i for i in indices if i in allowed]
+        return indices
+
+
+def _compiler_name(spec):
+    return spec.compiler.name if spec.compiler else None
+
+
 class SpecMultiMethod(object):
     """This implements a multi-method for Spack specs.  Packages are
        instantiated with a particular spec, and you may want to
@@ -91,6 +147,8 @@ class SpecMultiMethod(object):
     def __init__(self, default=None):
         self.method_list = []
         self.default = default
+        self._table = None
+        self._dispatch_cache = LRUCache(_dispatch_cache_size)
         if default:
             functools.update_wrapper(self, default)
 
@@ -98,6 +156,8 @@ class SpecMultiMethod(object):
     def register(self, spec, method):
         """Register a version of a method for a particular sys_type."""
         self.method_list.append((spec, method))
+        self._table = None
+        self._dispatch_cache.clear()
 
         if not hasattr(self, '__name__'):
             functools.update_wrapper(self, method)
@@ -106,18 +166,52 @@ class SpecMultiMethod(object):
 
 
     def __get__(self, obj, objtype):
-        """This makes __call__ support instance methods."""
-        return functools.partial(self.__call__, obj)
+        """This makes __call__ support instance methods.  The bound
+           method is stored on the instance, so later lookups don't
+           make a new one."""
+        if obj is None:
+            return self
+
+        bound = types.MethodType(self, obj, objtype)
+        if getattr(objtype, self.__name__, None) is self:
+            try:
+                obj.__dict__[self.__name__] = bound
+            except AttributeError:
+                pass
+        return bound
+
+
+    def _dispatch(self, spec):
+        """The first registered method whose spec matches spec, or None."""
+        if self._table is None:
+            self._table = _WhenTable([s for s, m in self.method_list])
+
+        for i in self._table.candidates(spec):
+            when_spec, method = self.method_list[i]
+            if when_spec.satisfies(spec):
+                return method
+        return None
 
 
     def __call__(self, package_self, *args, **kwargs):
         """Find the first method with a spec that matches the
            package's spec.  If none is found, call the default
            or if there is none, then raise a NoSuchMethodError.
+           Concrete specs can't change, so which method they get is
+           cached by their hash.
         """
-        for spec, method in self.method_list:
-            if spec.satisfies(package_self.spec):
-                return method(package_self, *args, **kwargs)
+        spec = package_self.spec
+        if spec.concrete:
+            key = (spec.sha1(), spack.packages_path)
+            method = self._dispatch_cache.get(key, False)
+            if method is False:
+                method = self._dispatch(spec)
+                self._dispatch_cache[key] = method
+        else:
+            method = self._dispatch(spec)
+
+        if method:
+            return method(package_self, *args, **kwargs)
 
         if self.default:
             return self.default(package_self, *args, **kwargs)
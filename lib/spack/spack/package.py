@@ -36,9 +36,12 @@ README.
 import inspect
 import os
 import re
+import sys
 import subprocess
 import platform as py_platform
 import shutil
+import json
+import time
 
 from spack import *
 import spack.spec
@@ -50,13 +53,82 @@ import multiprocessing
 import url
 
 import spack.util.crypto as crypto
+import spack.util.traverse as traverse
 from spack.version import *
 from spack.stage import Stage
 from spack.util.lang import *
-from spack.util.web import get_pages
+from spack.util.web import spider, probe
 from spack.util.environment import *
 
 
+"""Version of the format of the available versions cache files.  Bump
+   this when the way they are stored changes."""
+versions_cache_format = 1
+
+
+def _package_dependencies(pkg):
+    """Packages for the non-virtual dependencies of pkg, in name order."""
+    return [packages.get(name) for name in sorted(pkg.dependencies)
+            if not pkg.dependencies[name].virtual]
+
+
+def _class_dependencies(pkg_class):
+    """Classes of the non-virtual dependencies of pkg_class, in name order."""
+    deps = pkg_class.dependencies
+    return [packages.get_class_for_package_name(name) for name in sorted(deps)
+            if not deps[name].virtual]
+
+
+def _dependency_snapshot(pkg_class):
+    """The dependency specs of a package class, in name order.  The spec
+       objects are kept so that changes are detected by identity.
+    """
+    return sorted(pkg_class.dependencies.items())
+
+
+def _closure_is_current(snapshot):
+    """True if none of the package classes in a snapshot taken by
+       validate_dependencies() has been replaced or had its
+       dependencies changed since the snapshot was taken.
+    """
+    for pkg_class, deps in snapshot:
+        module = sys.modules.get(pkg_class.__module__)
+        if getattr(module, pkg_class.__name__, None) is not pkg_class:
+            return False
+
+        current = pkg_class.dependencies
+        if len(current) != len(deps):
+            return False
+        for name, spec in deps:
+            if current.get(name) is not spec:
+                return False
+    return True
+
+
+def _class_versions(pkg_class, name):
+    """The versions dict of a package class with its keys made into
+       Versions.  This is done once per class and cached on it; it is
+       redone if the class's versions attribute is replaced.
+    """
+    raw = getattr(pkg_class, 'versions', {})
+    cached = pkg_class.__dict__.get('_versioned')
+    if cached is not None and cached[0] is raw:
+        return cached[1]
+
+    if not isinstance(raw, dict):
+        raise ValueError("versions attribute of package %s must be a dict!"
+                         % name)
+
+    try:
+        versions = { Version(v):h for v,h in raw.items() }
+    except ValueError:
+        raise ValueError("Keys of versions dict in package %s must be versions!"
+                         % name)
+
+    pkg_class._versioned = (raw, versions)
+    return versions
+
+
 class Package(object):
     """This is the superclass for all spack packages.
 
@@ -338,21 +410,12 @@ class Package(object):
         # This is set by scraping a web page.
         self._available_versions = None
 
-        # versions should be a dict from version to checksum, for safe versions
-        # of this package.  If it's not present, make it an empty dict.
-        if not hasattr(self, 'versions'):
-            self.versions = {}
-
-        if not isinstance(self.versions, dict):
-            raise ValueError("versions attribute of package %s must be a dict!"
-                             % self.name)
+        # VersionList of the keys of the versions dict, made when needed.
+        self._version_list = None
 
-        # Version-ize the keys in versions dict
-        try:
-            self.versions = { Version(v):h for v,h in self.versions.items() }
-        except ValueError:
-            raise ValueError("Keys of versions dict in package %s must be versions!"
-                             % self.name)
+        # versions should be a dict from version to checksum, for safe versions
+        # of this package.  Its keys are Version-ized once per class.
+        self.versions = dict(_class_versions(self.__class__, self.name))
 
         # stage used to build this package.
         self._stage = None
@@ -436,42 +499,38 @@ class Package(object):
         m.prefix  = self.prefix
 
 
-    def preorder_traversal(self, visited=None, **kwargs):
-        """This does a preorder traversal of the package's dependence DAG."""
-        virtual = kwargs.get("virtual", False)
-
-        if visited is None:
-            visited = set()
+    def preorder_traversal(self, **kwargs):
+        """This does a preorder traversal of the package's dependence DAG.
+           Packages are yielded once each.  With virtual=True, this yields
+           the specs of the virtual dependencies of the packages instead.
 
-        if self.name in visited:
-            return
-        visited.add(self.name)
+           Currently, we do not descend into virtual dependencies, as this
+           makes doing a sensible traversal much harder.  We just assume that
+           ANY of the virtual deps will work, which might not be true (due to
+           conflicts or unsatisfiable specs).  For now this is ok but we might
+           want to reinvestigate if we start using a lot of complicated virtual
+           dependencies
+           TODO: reinvestigate this.
+        """
+        virtual = kwargs.get("virtual", False)
+        pkgs = traverse.preorder(
+            [self], _package_dependencies, key=lambda pkg: pkg.name)
 
         if not virtual:
-            yield self
-
-        for name in sorted(self.dependencies.keys()):
-            spec = self.dependencies[name]
-
-            # currently, we do not descend into virtual dependencies, as this
-            # makes doing a sensible traversal much harder.  We just assume that
-            # ANY of the virtual deps will work, which might not be true (due to
-            # conflicts or unsatisfiable specs).  For now this is ok but we might
-            # want to reinvestigate if we start using a lot of complicated virtual
-            # dependencies
-            # TODO: reinvestigate this.
-            if spec.virtual:
-                if virtual:
-                    yield spec
-                continue
-
-            for pkg in packages.get(name).preorder_traversal(visited, **kwargs):
-                yield pkg
+            return pkgs
+        return (spec for pkg in pkgs
+                for name, spec in sorted(pkg.dependencies.items())
+                if spec.virtual)
 
 
     def validate_dependencies(self):
         """Ensure that this package and its dependencies all have consistent
-           constraints on them.
+           constraints on them, and return a DependencyMap of the merged
+           constraints on every package in the dependency closure.
+
+           The merged closure is cached on the package class, and it is
+           rebuilt when any package class in the closure is reloaded or
+           has its dependencies changed.  Callers must not modify it.
 
            NOTE that this will NOT find sanity problems through a virtual
            dependency.  Virtual deps complicate the problem because we
@@ -483,16 +542,28 @@ class Package(object):
 
            TODO: investigate validating virtual dependencies.
         """
+        cls = type(self)
+        cached = cls.__dict__.get('_merged_dependencies')
+        if cached and cached[0] == spack.packages_path:
+            if _closure_is_current(cached[1]):
+                return cached[2]
+
         # This algorithm just attempts to merge all the constraints on the same
         # package together, loses information about the source of the conflict.
         # What we'd really like to know is exactly which two constraints
         # conflict, but that algorithm is more expensive, so we'll do it
         # the simple, less informative way for now.
         merged = spack.spec.DependencyMap()
+        snapshot = []
 
         try:
-            for pkg in self.preorder_traversal():
-                for name, spec in pkg.dependencies.iteritems():
+            # Only the classes' dependencies are needed, so this walks
+            # classes instead of making a package for each of them.
+            classes = traverse.preorder(
+                [cls], _class_dependencies, key=lambda c: c.__module__)
+            for pkg_class in classes:
+                snapshot.append((pkg_class, _dependency_snapshot(pkg_class)))
+                for name, spec in pkg_class.dependencies.iteritems():
                     if name not in merged:
                         merged[name] = spec.copy()
                     else:
@@ -503,6 +574,9 @@ class Package(object):
                 "Package %s has inconsistent dependency constraints: %s"
                 % (self.name, e.message))
 
+        cls._merged_dependencies = (spack.packages_path, snapshot, merged)
+        return merged
+
 
     def provides(self, vpkg_name):
         """True if this package provides a virtual package with the specified name."""
@@ -598,9 +672,15 @@ class Package(object):
         self.stage.chdir_to_archive()
 
 
-    def do_install(self):
+    def do_install(self, **kwargs):
         """This class should call this version of the install method.
            Package implementations should override install().
+
+           Options:
+           dependencies[=True]
+               Whether to install this package's dependencies first.
+               do_install_dependencies() installs a whole DAG in order,
+               so it sets this to False for each package it installs.
         """
         if not self.spec.concrete:
             raise ValueError("Can only install concrete packages.")
@@ -610,7 +690,7 @@ class Package(object):
             tty.pkg(self.prefix)
             return
 
-        if not self.ignore_dependencies:
+        if kwargs.get('dependencies', True) and not self.ignore_dependencies:
             self.do_install_dependencies()
 
         self.do_stage()
@@ -675,9 +755,17 @@ class Package(object):
 
 
     def do_install_dependencies(self):
-        # Pass along paths of dependencies here
-        for dep in self.spec.dependencies.values():
-            dep.package.do_install()
+        # Install all dependencies leaves-first, so that each is built
+        # after everything it depends on.  Each one is installed without
+        # its own dependencies, which are already done, so none is
+        # visited twice, and the ones reported as already installed
+        # were installed before this started.
+        for dep in self.spec.traverse(order='topo', root=False):
+            if dep.package.installed:
+                tty.msg("%s is already installed." % dep.name)
+                tty.pkg(dep.package.prefix)
+            else:
+                dep.package.do_install(dependencies=False)
 
 
     @property
@@ -736,34 +824,112 @@ class Package(object):
         tty.msg("Successfully cleaned %s" % self.name)
 
 
-    def fetch_available_versions(self):
-        # If not, then try to fetch using list_url
-        if not self._available_versions:
-            try:
-                self._available_versions = find_versions_of_archive(
-                    self.url,
-                    list_url=self.list_url,
-                    list_depth=self.list_depth,
-                    wildcard=self.default_version.wildcard())
-
-                if not self._available_versions:
-                    tty.warn("Found no versions for %s" % self.name,
-                             "Check the list_url and list_depth attribute on the "
-                             + self.name + " package.",
-                             "Use them to tell Spack where to look for versions.")
+    def fetch_available_versions(self, refresh=False):
+        """Versions of this package that can be downloaded.  Versions
+           found before are cached on disk, and the cache is used for
+           spack.versions_cache_ttl seconds.  If refresh is true, or the
+           cache is stale, they're looked for on the web again.  Finding
+           no versions is cached too, so that packages without any don't
+           go to the web every time."""
+        if self._available_versions is not None and not refresh:
+            return self._available_versions
 
+        versions = None if refresh else self.cached_available_versions()
+        if versions is None:
+            try:
+                versions = self.find_available_versions()
             except spack.error.NoNetworkConnectionError, e:
                 tty.die("Package.fetch_available_versions couldn't connect to:",
                         e.url, e.message)
+        self._available_versions = versions
+
+        if not self._available_versions:
+            tty.warn("Found no versions for %s" % self.name,
+                     "Check the list_url and list_depth attribute on the "
+                     + self.name + " package.",
+                     "Use them to tell Spack where to look for versions.")
 
         return self._available_versions
 
 
+    def find_available_versions(self):
+        """Look for versions of this package on the web, without using
+           the versions cache, and cache the versions found.  Raises
+           NoNetworkConnectionError if list_url can't be reached.
+
+           This only lists archives.  Probing for them sends a request
+           per guessed version, so it is only done when asked for, with
+           probe_available_versions()."""
+        versions = find_versions_of_archive(
+            self.url,
+            list_url=self.list_url,
+            list_depth=self.list_depth,
+            wildcard=self.default_version.wildcard())
+
+        self._cache_available_versions(versions)
+        return versions
+
+
+    def probe_available_versions(self):
+        """Look for versions after the ones in the versions dict by probing
+           for their archives.  This works for packages that have no page
+           listing their archives.  At most spack.max_probes archives are
+           probed."""
+        return find_versions_by_probing(self.url_for_version, self.versions)
+
+
+    @property
+    def versions_cache_file(self):
+        return new_path(spack.versions_cache_path, "%s.json" % self.name)
+
+
+    def cached_available_versions(self):
+        """VersionList of the versions in this package's versions cache,
+           which may be empty, or None if nothing is cached or the cached
+           versions are stale.  Versions cached
+           for a different url or list_url are ignored.  When spack is
+           offline, stale versions are still used."""
+        try:
+            with open(self.versions_cache_file) as f:
+                cached = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if (cached.get('format') != versions_cache_format or
+            cached.get('url') != self.__class__.url or
+            cached.get('list_url') != self.list_url):
+            return None
+
+        age = time.time() - cached.get('time', 0)
+        if age >= spack.versions_cache_ttl and not spack.offline:
+            return None
+
+        return VersionList([Version(v) for v in cached['versions']])
+
+
+    def _cache_available_versions(self, versions):
+        data = { 'format'   : versions_cache_format,
+                 'url'      : self.__class__.url,
+                 'list_url' : self.list_url,
+                 'time'     : time.time(),
+                 'versions' : [str(v) for v in versions] }
+        try:
+            write_atomically(self.versions_cache_file, json.dumps(data))
+        except (IOError, OSError), e:
+            # The cache is only an optimization.
+            tty.warn("Couldn't cache versions of %s: %s" % (self.name, e))
+
+
     @property
     def available_versions(self):
         # If the package overrode available_versions, then use that.
+        # The list is kept until the versions dict is replaced.
         if self.versions is not None:
-            return VersionList(self.versions.keys())
+            cached = self._version_list
+            if cached is None or cached[0] is not self.versions:
+                cached = (self.versions, VersionList(self.versions.keys()))
+                self._version_list = cached
+            return cached[1]
         else:
             vlist = self.fetch_available_versions()
             if not vlist:
@@ -771,6 +937,16 @@ class Package(object):
             return vlist
 
 
+def _archive_version_strings(pages, url_regex, wildcard):
+    """Yield the version strings of archive links in a stream of
+       (url, page) pairs, as each page arrives."""
+    for site, page in pages:
+        for s in url_regex.findall(page):
+            match = wildcard.search(s)
+            if match:
+                yield match.group(0)
+
+
 def find_versions_of_archive(archive_url, **kwargs):
     list_url   = kwargs.get('list_url', None)
     list_depth = kwargs.get('list_depth', 1)
@@ -781,21 +957,83 @@ def find_versions_of_archive(archive_url, **kwargs):
     if not wildcard:
         wildcard = url.parse_version(archive_url).wildcard()
 
-    versions = VersionList()
-    url_regex = os.path.basename(url.wildcard_version(archive_url))
+    url_regex = re.compile(os.path.basename(url.wildcard_version(archive_url)))
+    wildcard = re.compile(wildcard)
 
-    page_map = get_pages(list_url, depth=list_depth)
+    # Match pages as the spider fetches them, and only keep the distinct
+    # version strings.  The VersionList is built from them in one go.
+    pages = spider(list_url, depth=list_depth)
+    strings = set(_archive_version_strings(pages, url_regex, wildcard))
+    return VersionList([Version(v) for v in strings])
 
-    for site, page in page_map.iteritems():
-        strings = re.findall(url_regex, page)
-
-        for s in strings:
-            match = re.search(wildcard, s)
-            if match:
-                v = match.group(0)
-                versions.add(Version(v))
 
-    return versions
+def _next_versions(version, steps=1):
+    """Versions that could come after version: each of its leading
+       numeric components incremented in turn by 1 up to steps, with the
+       ones after it reset to zero.  e.g., 1.2.3 gives 2.0.0, 1.3.0 and
+       1.2.4, and 1.0b2 gives 2.0 and 1.1.
+    """
+    segments = version.version
+    n = 0
+    while n < len(segments) and type(segments[n]) == int:
+        n += 1
+
+    for i in range(n):
+        for step in range(1, steps + 1):
+            parts = segments[:i] + (segments[i] + step,) + (0,) * (n - i - 1)
+            string = str(parts[0]) + ''.join(
+                sep + str(part)
+                for sep, part in zip(version.separators, parts[1:]))
+            yield Version(string)
+
+
+def find_versions_by_probing(url_for_version, known, **kwargs):
+    """Find versions of a package by guessing them and checking whether
+       their archives exist.  Candidates are made from the known versions
+       with _next_versions, and their URLs, from url_for_version, are
+       probed concurrently.  Candidates that exist are used to make more
+       candidates in the next round, for at most `rounds` rounds.
+
+       Each component is tried up to `lookahead` steps ahead at once, so
+       that gaps in the numbering are skipped, and so that long runs of
+       releases take fewer rounds of requests.
+
+       No more than `max_probes` candidates are probed in all, which
+       defaults to spack.max_probes, and probing stops after a round
+       that finds no new versions.
+
+       Returns a VersionList of the known versions and the ones found.
+       Other keyword arguments are passed on to spack.util.web.probe.
+    """
+    probe_args = dict(kwargs)
+    max_rounds = probe_args.pop('rounds', 32)
+    lookahead  = probe_args.pop('lookahead', 4)
+    max_probes = probe_args.pop('max_probes', spack.max_probes)
+
+    tried = set(known)
+    found = list(tried)
+    frontier = found
+    probes = 0
+    for i in range(max_rounds):
+        candidates = {}
+        for version in frontier:
+            for candidate in _next_versions(version, lookahead):
+                if probes + len(candidates) >= max_probes:
+                    break
+                if candidate not in tried:
+                    tried.add(candidate)
+                    candidates[url_for_version(candidate)] = candidate
+        if not candidates:
+            break
+
+        probes += len(candidates)
+        exists = probe(candidates, **probe_args)
+        frontier = [candidates[u] for u in candidates if exists.get(u)]
+        if not frontier:
+            break
+        found.extend(frontier)
+
+    return VersionList(found)
 
 
 class MakeExecutable(Executable):
@@ -28,13 +28,20 @@ import sys
 import string
 import inspect
 import glob
+import json
+import hashlib
+import threading
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
 
 import spack
 import spack.error
 import spack.spec
+import spack.url
+import spack.validate
 import spack.tty as tty
-from spack.util.filesystem import new_path
-from spack.util.lang import list_modules
+from spack.util.filesystem import new_path, write_atomically
+from spack.util.lang import list_modules, LRUCache
 
 # Valid package names can contain '-' but can't start with it.
 valid_package_re = r'^\w[\w-]*$'
@@ -42,7 +49,29 @@ valid_package_re = r'^\w[\w-]*$'
 # Don't allow consecutive [_-] in package names
 invalid_package_re = r'[_-][_-]+'
 
-instances = {}
+"""Most package instances that get() keeps for frozen specs."""
+instance_cache_size = 512
+
+"""Package instances for frozen specs, keyed by the identity of the spec
+   and packages path.  Each entry holds its spec, so the spec's id can't
+   be reused while the entry exists."""
+instances = LRUCache(instance_cache_size)
+
+"""Package classes, keyed by packages path and package name."""
+_classes = {}
+
+"""Guards instances and _classes, so build threads can share them."""
+_cache_lock = threading.RLock()
+
+"""Version of the format of the package index files.  Bump this when
+   the way they are stored changes."""
+index_cache_format = 2
+
+"""PackageInfo of each package, for each packages path."""
+_package_indices = {}
+
+"""Index of what all packages provide, for each packages path."""
+_provider_indices = {}
 
 
 def _autospec(function):
@@ -55,22 +84,87 @@ def _autospec(function):
     return converter
 
 
+def _bounds(version):
+    """Keys for where a Version or VersionRange starts and ends.  Two of
+       them overlap exactly when each one starts no later than the other
+       ends.  Open ends are lower and higher than any version."""
+    start, end = version.lowest(), version.highest()
+    return ((0,) if start is None else (1, start.key),
+            (2,) if end is None else (1, end.key))
+
+
+class _ProvidedIntervals(object):
+    """Interval index of the specs that provide one virtual package, by
+       the versions of it that they provide.  Each Version or
+       VersionRange in a provided spec is an interval, and the intervals
+       are kept sorted both by where they start and by where they end.
+       Finding the intervals that overlap a range bisects both lists, and
+       filters whichever slice of candidates is smaller.
+    """
+    def __init__(self, provided_specs):
+        intervals = []
+        for spec in provided_specs:
+            for version in spec.versions:
+                low, high = _bounds(version)
+                intervals.append((low, high, spec))
+
+        self.by_low = sorted(intervals, key=itemgetter(0))
+        self.lows = [low for low, high, spec in self.by_low]
+        self.by_high = sorted(intervals, key=itemgetter(1))
+        self.highs = [high for low, high, spec in self.by_high]
+
+
+    def overlapping(self, versions):
+        """List of the provided specs that have some version that
+           overlaps the VersionList versions."""
+        # Specs are mutable, and hashing them is slow, so this collects
+        # them by identity.
+        found = {}
+        for version in versions:
+            low, high = _bounds(version)
+
+            # by_low[:starts] start before version ends, and by_high[ends:]
+            # end after it starts.  Overlapping intervals are in both.
+            starts = bisect_right(self.lows, high)
+            ends = bisect_left(self.highs, low)
+            if starts <= len(self.highs) - ends:
+                candidates = self.by_low[:starts]
+            else:
+                candidates = self.by_high[ends:]
+
+            for l, h, spec in candidates:
+                if l <= high and h >= low:
+                    found[id(spec)] = spec
+        return found.values()
+
+
+def _can_constrain(spec, other, **kwargs):
+    """Whether a copy of spec can be constrained by other."""
+    try:
+        spec.copy().constrain(other, **kwargs)
+        return True
+    except spack.spec.UnsatisfiableSpecError:
+        return False
+
+
 class ProviderIndex(object):
     """This is a dict of dicts used for finding providers of particular
        virtual dependencies. The dict of dicts looks like:
 
        { vpkg name :
-           { full vpkg spec : package providing spec } }
+           { full vpkg spec : [packages providing spec] } }
 
        Callers can use this to first find which packages provide a vpkg,
        then find a matching full spec.  e.g., in this scenario:
 
        { 'mpi' :
-           { mpi@:1.1 : mpich,
-             mpi@:2.3 : mpich2@1.9: } }
+           { mpi@:1.1 : [mpich],
+             mpi@:2.3 : [mpich2@1.9:, openmpi] } }
 
        Calling providers_for(spec) will find specs that provide a
-       matching implementation of MPI.
+       matching implementation of MPI.  The provided specs for each vpkg
+       are also indexed by version, so that only the ones with versions
+       that overlap the request are checked.
     """
     def __init__(self, specs, **kwargs):
         # TODO: come up with another name for this.  This "restricts" values to
@@ -80,6 +174,9 @@ class ProviderIndex(object):
 
         self.providers = {}
 
+        # _ProvidedIntervals for each vpkg name, made when it's needed.
+        self.intervals = {}
+
         for spec in specs:
             if not isinstance(spec, spack.spec.Spec):
                 spec = spack.spec.Spec(spec)
@@ -99,25 +196,39 @@ class ProviderIndex(object):
         pkg = spec.package
         for provided_spec, provider_spec in pkg.provided.iteritems():
             if provider_spec.satisfies(spec, deps=False):
-                provided_name = provided_spec.name
-                if provided_name not in self.providers:
-                    self.providers[provided_name] = {}
-
                 if self.restrict:
-                    self.providers[provided_name][provided_spec] = spec
+                    self.add(provided_spec, spec)
 
                 else:
                     # Before putting the spec in the map, constrain it so that
                     # it provides what was asked for.
                     constrained = spec.copy()
                     constrained.constrain(provider_spec)
-                    self.providers[provided_name][provided_spec] = constrained
+                    self.add(provided_spec, constrained)
+
+
+    def add(self, provided_spec, spec):
+        """Record that spec provides provided_spec."""
+        provided_name = provided_spec.name
+        if provided_name not in self.providers:
+            self.providers[provided_name] = {}
+        self.providers[provided_name].setdefault(provided_spec, []).append(spec)
+        self.intervals.pop(provided_name, None)
+
+
+    def _intervals(self, name):
+        intervals = self.intervals.get(name)
+        if intervals is None:
+            intervals = _ProvidedIntervals(self.providers[name])
+            self.intervals[name] = intervals
+        return intervals
 
 
     def providers_for(self, *vpkg_specs):
         """Gives specs of all packages that provide virtual packages
            with the supplied specs."""
-        providers = set()
+        # Collect providers by identity first: hashing specs is slow.
+        found = {}
         for vspec in vpkg_specs:
             # Allow string names to be passed as input, as well as specs
             if type(vspec) == str:
@@ -125,28 +236,35 @@ class ProviderIndex(object):
 
             # Add all the providers that satisfy the vpkg spec.
             if vspec.name in self.providers:
-                for provider_spec, spec in self.providers[vspec.name].items():
-                    if provider_spec.satisfies(vspec, deps=False):
-                        providers.add(spec)
+                provided = self.providers[vspec.name]
+                candidates = self._intervals(vspec.name).overlapping(
+                    vspec.versions)
+                for provided_spec in candidates:
+                    if provided_spec.satisfies(vspec, deps=False):
+                        for spec in provided[provided_spec]:
+                            found[id(spec)] = spec
 
         # Return providers in order
-        return sorted(providers)
-
-
-    # TODO: this is pretty darned nasty, and inefficient.
-    def _cross_provider_maps(self, lmap, rmap):
-        result = {}
-        for lspec in lmap:
-            for rspec in rmap:
-                try:
-                    constrained = lspec.copy().constrain(rspec)
-                    if lmap[lspec].name != rmap[rspec].name:
-                        continue
-                    result[constrained] = lmap[lspec].copy().constrain(
-                        rmap[rspec], deps=False)
-                except spack.spec.UnsatisfiableSpecError:
+        return sorted(set(found.values()))
+
+
+    def _compatible_providers(self, other, name):
+        """Whether some provider of name in self and some provider of name
+           in other are the same package, and both what they provide and
+           the providers themselves can be constrained to agree.  Only pairs
+           whose provided versions overlap are tried."""
+        lmap, rmap = self.providers[name], other.providers[name]
+        rintervals = other._intervals(name)
+        for lspec, lproviders in lmap.iteritems():
+            for rspec in rintervals.overlapping(lspec.versions):
+                if not _can_constrain(lspec, rspec):
                     continue
-        return result
+                for lprovider in lproviders:
+                    for rprovider in rmap[rspec]:
+                        if (lprovider.name == rprovider.name and
+                            _can_constrain(lprovider, rprovider, deps=False)):
+                            return True
+        return False
 
 
     def __contains__(self, name):
@@ -160,27 +278,32 @@ class ProviderIndex(object):
         if not common:
             return True
 
-        result = {}
-        for name in common:
-            crossed = self._cross_provider_maps(self.providers[name],
-                                                other.providers[name])
-            if crossed:
-                result[name] = crossed
-
-        return bool(result)
+        return any(self._compatible_providers(other, name) for name in common)
 
 
 
 @_autospec
 def get(spec):
+    """Package object for spec.  Packages for frozen (e.g. concretized)
+       specs are cached, so asking again for the same spec object returns
+       the same package.  Equal specs in different DAGs get packages of
+       their own, since a package's spec and stage belong to it.  Specs
+       that aren't frozen may still change, so each call gets a new
+       package for them.
+    """
     if spec.virtual:
         raise UnknownPackageError(spec.name)
 
-    if not spec in instances:
-        package_class = get_class_for_package_name(spec.name)
-        instances[spec.name] = package_class(spec)
+    if not spec.frozen:
+        return get_class_for_package_name(spec.name)(spec)
 
-    return instances[spec.name]
+    key = (id(spec), spack.packages_path)
+    with _cache_lock:
+        package = instances.get(key)
+        if package is None:
+            package = get_class_for_package_name(spec.name)(spec)
+            instances[key] = package
+        return package
 
 
 @_autospec
@@ -188,12 +311,150 @@ def get_installed(spec):
     return [s for s in installed_package_specs() if s.satisfies(spec)]
 
 
+class PackageInfo(object):
+    """What spack knows about a package without importing it: its name,
+       homepage, url, safe versions, dependencies, what it provides and
+       its description.  Dependencies map names to spec strings, and
+       provided is a list of [provided spec, provider spec] strings, as
+       stored in the index file.
+    """
+    def __init__(self, name, homepage, url, versions, dependencies,
+                 provided, doc):
+        self.name = name
+        self.homepage = homepage
+        self.url = url
+        self.versions = versions
+        self.dependencies = dependencies
+        self.provided = provided
+        self.doc = doc
+
+
+    @staticmethod
+    def from_class(name, cls):
+        return PackageInfo(
+            name, getattr(cls, 'homepage', None), getattr(cls, 'url', None),
+            sorted(str(v) for v in getattr(cls, 'versions', {})),
+            dict((dep_name, str(dep))
+                 for dep_name, dep in cls.dependencies.iteritems()),
+            sorted([str(provided), str(provider)]
+                   for provided, provider in cls.provided.iteritems()),
+            cls.__doc__)
+
+
+    def to_dict(self):
+        return { 'homepage'     : self.homepage,
+                 'url'          : self.url,
+                 'versions'     : self.versions,
+                 'dependencies' : self.dependencies,
+                 'provided'     : self.provided,
+                 'doc'          : self.doc }
+
+
+    @staticmethod
+    def from_dict(name, d):
+        return PackageInfo(name, d['homepage'], d['url'], d['versions'],
+                           d['dependencies'], d['provided'], d['doc'])
+
+
+def index_cache_file():
+    """File that the index of the packages in spack.packages_path is
+       cached in.  Each packages path has its own."""
+    path_hash = hashlib.sha1(spack.packages_path).hexdigest()
+    return new_path(spack.index_cache_path, 'packages-%s.json' % path_hash)
+
+
+def _package_file_stamp(pkg_name):
+    """Changes when the file for pkg_name is modified."""
+    st = os.stat(filename_for_package_name(pkg_name))
+    return [st.st_mtime, st.st_size]
+
+
+def package_index():
+    """Dict from names of all the packages in spack.packages_path to
+       their PackageInfo.
+
+       Getting these means importing every package, so they are cached
+       on disk along with the mtime and size of each package's file.
+       Only packages whose files changed since the cache was written
+       are imported.  Packages that can't be imported are left out with
+       a warning, so that one broken package doesn't break the others.
+    """
+    index = _package_indices.get(spack.packages_path)
+    if index is not None:
+        return index
+
+    cache_file = index_cache_file()
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+        if cached.get('format') != index_cache_format:
+            cached = {}
+    except (IOError, OSError, ValueError):
+        cached = {}
+    cached_packages = cached.get('packages', {})
+
+    packages = {}
+    for pkg_name in all_package_names():
+        stamp = _package_file_stamp(pkg_name)
+        entry = cached_packages.get(pkg_name)
+        if entry is None or entry['stamp'] != stamp:
+            cls, error = _import_package_class(pkg_name)
+            if error:
+                tty.warn(error)
+                continue
+            entry = PackageInfo.from_class(pkg_name, cls).to_dict()
+            entry['stamp'] = stamp
+        packages[pkg_name] = entry
+
+    if packages != cached_packages:
+        data = { 'format' : index_cache_format, 'packages' : packages }
+        try:
+            write_atomically(cache_file, json.dumps(data, sort_keys=True))
+        except (IOError, OSError), e:
+            tty.verbose("Couldn't write %s: %s" % (cache_file, e))
+
+    index = dict((name, PackageInfo.from_dict(name, entry))
+                 for name, entry in packages.iteritems())
+    _package_indices[spack.packages_path] = index
+    return index
+
+
+def info(pkg_name):
+    """PackageInfo for the package called pkg_name."""
+    validate_package_name(pkg_name)
+    index = package_index()
+    if pkg_name not in index:
+        # Packages left out of the index because they are broken are
+        # loaded here, to say what is wrong with them.
+        return PackageInfo.from_class(
+            pkg_name, get_class_for_package_name(pkg_name))
+    return index[pkg_name]
+
+
+def provider_index():
+    """ProviderIndex of all the packages in spack.packages_path, built
+       from the package index so that packages aren't imported."""
+    index = _provider_indices.get(spack.packages_path)
+    if index is not None:
+        return index
+
+    # Package specs are the providers constrained by their 'when' specs,
+    # which are what is stored.  Equal providers share one Spec.
+    index = ProviderIndex([])
+    providers = {}
+    for pkg_info in package_index().itervalues():
+        for provided, provider in pkg_info.provided:
+            if provider not in providers:
+                providers[provider] = spack.spec.Spec(str(provider))
+            index.add(spack.spec.Spec(str(provided)), providers[provider])
+
+    _provider_indices[spack.packages_path] = index
+    return index
+
+
 @_autospec
 def providers_for(vpkg_spec):
-    if not hasattr(providers_for, 'index'):
-        providers_for.index = ProviderIndex(all_package_names())
-
-    providers = providers_for.index.providers_for(vpkg_spec)
+    providers = provider_index().providers_for(vpkg_spec)
     if not providers:
         raise UnknownPackageError("No such virtual package: %s" % vpkg_spec)
     return providers
@@ -261,14 +522,18 @@ def packages_module():
 
 
 def get_class_for_package_name(pkg_name):
-    file_name = filename_for_package_name(pkg_name)
+    key = (spack.packages_path, pkg_name)
+    with _cache_lock:
+        cls = _classes.get(key)
+        if cls is None:
+            cls = _load_class_for_package_name(pkg_name)
+            _classes[key] = cls
+        return cls
+
 
-    if os.path.exists(file_name):
-        if not os.path.isfile(file_name):
-            tty.die("Something's wrong. '%s' is not a file!" % file_name)
-        if not os.access(file_name, os.R_OK):
-            tty.die("Cannot read '%s'!" % file_name)
-    else:
+def _load_class_for_package_name(pkg_name):
+    file_name = filename_for_package_name(pkg_name)
+    if not os.path.exists(file_name):
         raise UnknownPackageError(pkg_name)
 
     # Figure out pacakges module from spack.packages_path
@@ -276,18 +541,87 @@ def get_class_for_package_name(pkg_name):
     if not re.match(r'%s' % spack.module_path, spack.packages_path):
         raise RuntimeError("Packages path is not a submodule of spack.")
 
+    cls, error = _import_package_class(pkg_name)
+    if error:
+        tty.die(error)
+    return cls
+
+
+def _import_package_class(pkg_name):
+    """Import the module for the package called pkg_name and find its
+       package class.  Returns the class and None, or None and a message
+       saying why it couldn't be loaded, so that callers can decide
+       whether that is fatal.
+    """
+    file_name = filename_for_package_name(pkg_name)
+    if not os.path.isfile(file_name):
+        return None, "Something's wrong. '%s' is not a file!" % file_name
+    if not os.access(file_name, os.R_OK):
+        return None, "Cannot read '%s'!" % file_name
+
     class_name = class_name_for_package_name(pkg_name)
+    module_name = "%s.%s" % (packages_module(), pkg_name)
     try:
-        module_name = "%s.%s" % (packages_module(), pkg_name)
         module = __import__(module_name, fromlist=[class_name])
-    except ImportError, e:
-        tty.die("Error while importing %s.%s:\n%s" % (pkg_name, class_name, e.message))
+    except Exception, e:
+        return None, "Error while importing %s: %s" % (module_name, e)
+
+    cls = getattr(module, class_name, None)
+    if not (inspect.isclass(cls) and issubclass(cls, spack.Package)):
+        return None, ("%s does not define a package class called %s"
+                      % (module_name, class_name))
+    return cls, None
+
+
+def validate_package(pkg_name):
+    """Check the package called pkg_name for problems that would keep
+       spack from using it: a module that doesn't import or lacks the
+       expected class, missing or invalid homepage and url, a url with
+       no detectable version, bad versions, and inconsistent dependency
+       constraints.
+
+       Returns a list of messages, which is empty if nothing is wrong,
+       and the package's PackageInfo, or None if it couldn't be loaded.
+       Whether its dependencies exist depends on what other packages
+       provide, so callers check that with the PackageInfos of all
+       packages.
+    """
+    try:
+        validate_package_name(pkg_name)
+    except InvalidPackageNameError, e:
+        return [e.message], None
 
-    cls = getattr(module, class_name)
-    if not inspect.isclass(cls):
-        tty.die("%s.%s is not a class" % (pkg_name, class_name))
+    if not exists(pkg_name):
+        return [UnknownPackageError(pkg_name).message], None
 
-    return cls
+    cls, error = _import_package_class(pkg_name)
+    if error:
+        return [error], None
+
+    missing = [attr for attr in ('homepage', 'url') if not hasattr(cls, attr)]
+    if missing:
+        return ["No required attribute '%s'" % attr for attr in missing], None
+
+    try:
+        spack.validate.url(cls.url)
+        spack.url.parse_version(cls.url)
+        pkg = cls(spack.spec.Spec(pkg_name))
+    except (spack.error.SpackError, ValueError), e:
+        return [str(e)], PackageInfo.from_class(pkg_name, cls)
+
+    # Checking constraints loads every package in the dependency
+    # closure, and a broken one makes spack exit.
+    errors = []
+    try:
+        pkg.validate_dependencies()
+    except spack.package.InvalidPackageDependencyError, e:
+        errors.append(e.message)
+    except SystemExit:
+        errors.append("Couldn't load a dependency to check its constraints")
+    except Exception, e:
+        errors.append("Error while checking dependencies: %s" % e)
+
+    return errors, PackageInfo.from_class(pkg_name, cls)
 
 
 def compute_dependents():
@@ -322,10 +656,11 @@ def graph_dependencies(out=sys.stdout):
         return '"%s"' % string
 
     deps = []
-    for pkg in all_packages():
-        out.write('  %-30s [label="%s"]\n' % (quote(pkg.name), pkg.name))
-        for dep_name, dep in pkg.dependencies.iteritems():
-            deps.append((pkg.name, dep_name))
+    index = package_index()
+    for name in sorted(index):
+        out.write('  %-30s [label="%s"]\n' % (quote(name), name))
+        for dep_name in sorted(index[name].dependencies):
+            deps.append((name, dep_name))
     out.write('\n')
 
     for pair in deps:
@@ -23,7 +23,7 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
 import re
-import itertools
+import sys
 import spack.error
 
 
@@ -50,24 +50,42 @@ class Token:
 
 
 class Lexer(object):
-    """Base class for Lexers that keep track of line numbers."""
+    """Base class for Lexers that keep track of line numbers.
+
+       The lexicon is a list of (regex, token type) pairs.  All of the
+       regexes are combined into a single pattern, so the input is
+       tokenized in one pass.  A token type of None means that matching
+       text is skipped (e.g., whitespace).  Rules are tried in order and
+       must not contain capturing groups of their own.
+    """
     def __init__(self, lexicon):
-        self.scanner = re.Scanner(lexicon)
-
-    def token(self, type, value=''):
-        return Token(type, value, self.scanner.match.start(0), self.scanner.match.end(0))
+        self.types = [type for regex, type in lexicon]
+        self.regex = re.compile(
+            '|'.join('(%s)' % regex for regex, type in lexicon))
 
     def lex(self, text):
-        tokens, remainder = self.scanner.scan(text)
-        if remainder:
-            raise LexError("Invalid character", text, text.index(remainder))
+        tokens = []
+        match = self.regex.match
+        types = self.types
+
+        pos, end = 0, len(text)
+        while pos < end:
+            m = match(text, pos)
+            if not m:
+                raise LexError("Invalid character", text, pos)
+
+            type = types[m.lastindex - 1]
+            pos = m.end()
+            if type is not None:
+                tokens.append(Token(type, m.group(), m.start(), pos))
         return tokens
 
 
 class Parser(object):
     """Base class for simple recursive descent parsers."""
     def __init__(self, lexer):
-        self.tokens = iter([])   # iterators over tokens, handled in order.  Starts empty.
+        self.tokens = []         # tokens to be parsed, handled in order.
+        self.pos = 0             # index of the next token in self.tokens
         self.token = Token(None) # last accepted token starts at beginning of file
         self.next = None         # next token
         self.lexer = lexer
@@ -75,20 +93,26 @@ class Parser(object):
 
     def gettok(self):
         """Puts the next token in the input stream into self.next."""
-        try:
-            self.next = self.tokens.next()
-        except StopIteration:
+        if self.pos < len(self.tokens):
+            self.next = self.tokens[self.pos]
+            self.pos += 1
+        else:
             self.next = None
 
     def push_tokens(self, iterable):
         """Adds all tokens in some iterable to the token stream."""
-        self.tokens = itertools.chain(iter(iterable), iter([self.next]), self.tokens)
+        pending = self.tokens[self.pos:]
+        if self.next:
+            pending.insert(0, self.next)
+        self.tokens = list(iterable) + pending
+        self.pos = 0
         self.gettok()
 
     def accept(self, id):
         """Puts the next symbol in self.token if we like it.  Then calls gettok()"""
-        if self.next and self.next.is_a(id):
-            self.token = self.next
+        next = self.next
+        if next and next.type == id:
+            self.token = next
             self.gettok()
             return True
         return False
@@ -117,6 +141,10 @@ class Parser(object):
 
     def setup(self, text):
         self.text = text
+        self.tokens = []
+        self.pos = 0
+        self.token = Token(None)
+        self.next = None
         self.push_tokens(self.lexer.lex(text))
 
     def parse(self, text):
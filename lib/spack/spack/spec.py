@@ -93,7 +93,7 @@ expansion when it is the first character in an id typed on the command line.
 import sys
 import itertools
 import hashlib
-from StringIO import StringIO
+import weakref
 
 import spack.parse
 import spack.error
@@ -101,6 +101,7 @@ import spack.compilers
 import spack.compilers.gcc
 import spack.packages as packages
 import spack.tty as tty
+import spack.util.traverse as traverse
 
 from spack.version import *
 from spack.color import *
@@ -134,6 +135,165 @@ _separators = '[%s]' % ''.join(color_formats.keys())
    every time we call str()"""
 _any_version = VersionList([':'])
 
+"""Compilers of frozen specs, keyed by their strings, so that frozen
+   specs built with the same compiler share one Compiler object."""
+_frozen_compilers = weakref.WeakValueDictionary()
+
+
+def _version_list(string):
+    """Build a VersionList from its string form without the spec parser.
+       An empty string is an empty list."""
+    if not string:
+        return VersionList()
+    return VersionList(str(string))
+
+
+"""ANSI codes that start and end each colored field in Spec.format()."""
+_color_codes = dict((c, (colorize(fmt), colorize('@.')))
+                    for c, fmt in color_formats.items())
+
+
+def _colored(c, string, color):
+    """Wraps a field of a formatted spec in the color for field c."""
+    if not color:
+        return string
+    start, end = _color_codes[c]
+    return start + string + end
+
+
+def _format_versions(spec, color):
+    # Comparing strings is much cheaper than comparing to _any_version.
+    versions = str(spec.versions)
+    if versions and versions != ':':
+        return _colored('@', '@' + versions, color)
+    return ''
+
+
+def _format_compiler(spec, color):
+    if spec.compiler:
+        return _colored('%', '%' + str(spec.compiler.name), color)
+    return ''
+
+
+def _format_compiler_versions(spec, color):
+    if spec.compiler and spec.compiler.versions:
+        return _colored('%', '@' + str(spec.compiler.versions), color)
+    return ''
+
+
+def _format_variants(spec, color):
+    if spec.variants:
+        return _colored('+', str(spec.variants), color)
+    return ''
+
+
+def _format_architecture(spec, color):
+    if spec.architecture:
+        return _colored('=', '=' + str(spec.architecture), color)
+    return ''
+
+
+def _format_dependencies_hash(spec, color):
+    if spec.dependencies:
+        return '-' + spec.dependencies.install_hash()[:6]
+    return ''
+
+
+"""Renderers for each $-escaped field in a Spec.format() string."""
+_field_renderers = { '_' : lambda spec, color: spec.name,
+                     '@' : _format_versions,
+                     '%' : _format_compiler,
+                     '+' : _format_variants,
+                     '=' : _format_architecture,
+                     '#' : _format_dependencies_hash }
+
+
+def _literal(text):
+    return lambda spec, color: text
+
+
+@memoized
+def _compile_format(format_string):
+    """Compiles a Spec.format() string into a tuple of renderers.  Each
+       renderer is a function that takes a spec and a color flag and
+       returns one piece of the output; runs of literal text are merged
+       into single renderers.
+    """
+    renderers = []
+    text = []
+    def add(renderer):
+        if text:
+            renderers.append(_literal(''.join(text)))
+            del text[:]
+        renderers.append(renderer)
+
+    length = len(format_string)
+    escape = compiler = False
+    for i, c in enumerate(format_string):
+        if escape:
+            if c == '$':
+                text.append('$')
+            elif c in _field_renderers:
+                add(_field_renderers[c])
+            compiler = (c == '%')
+            escape = False
+
+        elif compiler:
+            if c == '@':
+                add(_format_compiler_versions)
+            elif c == '$':
+                escape = True
+            else:
+                text.append(c)
+            compiler = False
+
+        elif c == '$':
+            escape = True
+            if i == length - 1:
+                raise ValueError("Error: unterminated $ in format: '%s'"
+                                 % format_string)
+        else:
+            text.append(c)
+
+    if text:
+        renderers.append(_literal(''.join(text)))
+    return tuple(renderers)
+
+
+def _frozen_compiler(compiler):
+    """Returns the compiler frozen specs should use in place of compiler.
+       Frozen specs never modify their compilers, so they can share them."""
+    key = str(compiler)
+    shared = _frozen_compilers.get(key)
+    if shared is None:
+        shared = _frozen_compilers[key] = compiler
+    return shared
+
+
+def _sorted_dependencies(spec):
+    """Dependencies of spec in order of their names, for traversals."""
+    deps = spec.dependencies
+    if len(deps) < 2:
+        return deps.values()
+    return [deps[name] for name in sorted(deps)]
+
+
+"""Traversal functions for each order that Spec.traverse() supports."""
+_traversals = { 'pre'  : traverse.preorder,
+                'post' : traverse.postorder,
+                'bfs'  : traverse.breadth_first,
+                'topo' : traverse.topological }
+
+
+def traverse_specs(specs, **kwargs):
+    """Traverses the DAGs rooted at several specs as though they were one
+       DAG.  Takes the same options as Spec.traverse()."""
+    order = kwargs.get('order', 'pre')
+    if order not in _traversals:
+        raise ValueError("Invalid value for order: %s.  Choices are %s"
+                         % (order, ",".join(sorted(_traversals))))
+    return _traversals[order](specs, _sorted_dependencies, **kwargs)
+
 
 def index_specs(specs):
     """Take a list of specs and return a dict of lists.  Dict is
@@ -172,6 +332,8 @@ class Compiler(object):
     """The Compiler field represents the compiler or range of compiler
        versions that a package should be built with.  Compilers have a
        name and a version list. """
+    __slots__ = ('name', 'versions', '__weakref__')
+
     def __init__(self, name, version=None):
         self.name = name
         self.versions = VersionList()
@@ -232,6 +394,8 @@ class Variant(object):
        on the particular package being built, and each named variant can
        be enabled or disabled.
     """
+    __slots__ = ('name', 'enabled')
+
     def __init__(self, name, enabled):
         self.name = name
         self.enabled = enabled
@@ -251,6 +415,14 @@ class Variant(object):
 
 
 class VariantMap(HashableMap):
+    __slots__ = ()
+
+    def _cmp_key(self):
+        # Variants are keyed by name, so sorting the keys orders the
+        # values the same way HashableMap would, but more cheaply.
+        return tuple([self[key] for key in sorted(self)])
+
+
     def satisfies(self, other):
         return all(self[key].enabled == other[key].enabled
                    for key in other if key in self)
@@ -264,25 +436,111 @@ class VariantMap(HashableMap):
 class DependencyMap(HashableMap):
     """Each spec has a DependencyMap containing specs for its dependencies.
        The DependencyMap is keyed by name. """
+    __slots__ = ()
+
     @property
     def concrete(self):
         return all(d.concrete for d in self.values())
 
 
+    def _cmp_key(self):
+        # Sorting names orders the specs the same way HashableMap would,
+        # without comparing whole dependency DAGs against each other.
+        return tuple([self[name] for name in sorted(self)])
+
+
     def sha1(self):
+        """Hash of all the dependencies in this map, computed from their
+           (cached) Merkle hashes."""
         sha = hashlib.sha1()
-        sha.update(str(self))
+        for name in sorted(self.keys()):
+            sha.update(self[name].sha1())
         return sha.hexdigest()
 
 
+    def install_hash(self):
+        """Hash of the string form of these dependencies.  Install
+           prefixes are named with it, so unlike sha1() it must stay the
+           same from one version of spack to the next, or existing
+           installs can no longer be found.  Use sha1() for anything
+           that is only kept in memory."""
+        return hashlib.sha1(str(self)).hexdigest()
+
+
     def __str__(self):
         sorted_dep_names = sorted(self.keys())
         return ''.join(
             ["^" + str(self[name]) for name in sorted_dep_names])
 
 
+class DependentMap(dict):
+    """Each spec has a DependentMap of the specs that depend on it, keyed
+       by name.  Dependents are held through weak references, so that a
+       spec doesn't keep its dependents alive and spec DAGs don't form
+       reference cycles.  Dependents that no longer exist are left out.
+    """
+    __slots__ = ()
+
+    def __setitem__(self, name, spec):
+        dict.__setitem__(self, name, weakref.ref(spec))
+
+
+    def __getitem__(self, name):
+        spec = dict.__getitem__(self, name)()
+        if spec is None:
+            raise KeyError(name)
+        return spec
+
+
+    def get(self, name, default=None):
+        ref = dict.get(self, name)
+        spec = ref() if ref is not None else None
+        return default if spec is None else spec
+
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+
+    def iteritems(self):
+        for name, ref in dict.items(self):
+            spec = ref()
+            if spec is not None:
+                yield name, spec
+
+
+    def items(self):
+        return list(self.iteritems())
+
+
+    def keys(self):
+        return [name for name, spec in self.iteritems()]
+
+
+    def values(self):
+        return [spec for name, spec in self.iteritems()]
+
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+    def __len__(self):
+        return len(self.keys())
+
+
+    def __str__(self):
+        return str(sorted(self.keys()))
+
+
 @key_ordering
 class Spec(object):
+    __slots__ = ('name', '_versions', '_variants', '_architecture',
+                 '_compiler', 'dependents', 'dependencies',
+                 '_hash', '_index', '_root',
+                 '_frozen', '_virtual', '_concrete',
+                 '_str', '_key', '_key_hash', '__weakref__')
+
     def __init__(self, spec_like, *dep_like):
         # Copy if spec_like is a Spec.
         if isinstance(spec_like, Spec):
@@ -293,24 +551,14 @@ class Spec(object):
         if not isinstance(spec_like, basestring):
             raise TypeError("Can't make spec out of %s" % type(spec_like))
 
-        spec_list = SpecParser().parse(spec_like)
+        spec_list = _cached_parse(spec_like)
         if len(spec_list) > 1:
             raise ValueError("More than one spec in string: " + spec_like)
         if len(spec_list) < 1:
             raise ValueError("String contains no specs: " + spec_like)
 
-        # Take all the attributes from the first parsed spec without copying.
-        # This is safe b/c we throw out the parsed spec.  It's a bit nasty,
-        # but it's nastier to implement the constructor so that the parser
-        # writes directly into this Spec object.
-        other = spec_list[0]
-        self.name = other.name
-        self.dependents = other.dependents
-        self.versions = other.versions
-        self.variants = other.variants
-        self.architecture = other.architecture
-        self.compiler = other.compiler
-        self.dependencies = other.dependencies
+        # Parsed specs are shared through the parse cache, so copy.
+        self._dup(spec_list[0])
 
         # This allows users to construct a spec DAG with literals.
         # Note that given two specs a and b, Spec(a) copies a, but
@@ -320,11 +568,56 @@ class Spec(object):
             self._add_dependency(spec)
 
 
+    #
+    # Replacing any of these fields changes the spec's hash, so their
+    # setters clear it.  Changes made in place must clear it themselves.
+    #
+    @property
+    def versions(self):
+        return self._versions
+
+    @versions.setter
+    def versions(self, versions):
+        self._invalidate_hash()
+        self._versions = versions
+
+
+    @property
+    def variants(self):
+        return self._variants
+
+    @variants.setter
+    def variants(self, variants):
+        self._invalidate_hash()
+        self._variants = variants
+
+
+    @property
+    def architecture(self):
+        return self._architecture
+
+    @architecture.setter
+    def architecture(self, architecture):
+        self._invalidate_hash()
+        self._architecture = architecture
+
+
+    @property
+    def compiler(self):
+        return self._compiler
+
+    @compiler.setter
+    def compiler(self, compiler):
+        self._invalidate_hash()
+        self._compiler = compiler
+
+
     #
     # Private routines here are called by the parser when building a spec.
     #
     def _add_version(self, version):
         """Called by the parser to add an allowable version."""
+        self._invalidate_hash()
         self.versions.add(version)
 
 
@@ -332,6 +625,7 @@ class Spec(object):
         """Called by the parser to add a variant."""
         if name in self.variants: raise DuplicateVariantError(
                 "Cannot specify variant '%s' twice" % name)
+        self._invalidate_hash()
         self.variants[name] = Variant(name, enabled)
 
 
@@ -353,8 +647,124 @@ class Spec(object):
         """Called by the parser to add another spec as a dependency."""
         if spec.name in self.dependencies:
             raise DuplicateDependencyError("Cannot depend on '%s' twice" % spec)
+        self._invalidate_hash()
         self.dependencies[spec.name] = spec
         spec.dependents[self.name] = self
+        self._invalidate_index()
+        spec._invalidate_root()
+
+
+    def _clear_caches(self):
+        """Reset all of this node's cached, derived data and mark it as
+           not frozen.  Used when a node is first constructed."""
+        self._frozen = False
+        self._hash = None
+        self._index = None
+        self._root = None
+
+
+    def _invalidate_hash(self):
+        """Clear the cached hash of this node and of every node that
+           depends on it, since their hashes are computed from this one.
+           Call this whenever a node is modified.
+
+           A node's hash is only ever cached after its dependencies' hashes
+           are, so we can stop climbing at nodes with no cached hash.
+
+           Every change to a spec goes through here before it is made, so
+           this is also where changes to frozen specs are refused.
+        """
+        if self._frozen:
+            raise FrozenSpecError(self)
+
+        stack = [self]
+        while stack:
+            spec = stack.pop()
+            if spec._hash is not None:
+                spec._hash = None
+                stack.extend(spec.dependents.values())
+
+
+    def _invalidate_index(self):
+        """Clear the cached name index of this node and of every node that
+           depends on it.  Call this whenever dependencies are added to or
+           removed from a node.  Like hashes, indices are built bottom-up,
+           so we can stop climbing at nodes with no cached index.
+        """
+        stack = [self]
+        while stack:
+            spec = stack.pop()
+            if spec._index is not None:
+                spec._index = None
+                stack.extend(spec.dependents.values())
+
+
+    def _invalidate_root(self):
+        """Clear the cached root of this node and of everything it depends
+           on.  Call this when a node gets a new dependent.  A node's root is
+           only cached after its dependents' roots are, so we can stop
+           descending at nodes with no cached root.
+        """
+        stack = [self]
+        while stack:
+            spec = stack.pop()
+            if spec._root is not None:
+                spec._root = None
+                stack.extend(spec.dependencies.values())
+
+
+    def _name_index(self):
+        """Returns a dict from package names to tuples of the nodes with
+           that name below this spec in its DAG.  Nodes are listed in
+           preorder, so the first node in each tuple is the one a preorder
+           traversal would find first.  The index leaves out this spec
+           itself, so that it doesn't refer back to its owner.
+
+           Indices are built bottom-up from the dependencies' indices and
+           cached on each node until the DAG below it changes.
+        """
+        if self._index is None:
+            stack = [self]
+            while stack:
+                spec = stack[-1]
+                unindexed = [d for d in spec.dependencies.values()
+                             if d._index is None]
+                if unindexed:
+                    stack.extend(unindexed)
+                    continue
+
+                stack.pop()
+                if spec._index is None:
+                    index = {}
+                    for name in sorted(spec.dependencies.keys()):
+                        dep = spec.dependencies[name]
+                        dep_nodes = [(dep.name, (dep,))]
+                        dep_nodes.extend(dep._index.iteritems())
+                        for dep_name, nodes in dep_nodes:
+                            if dep_name not in index:
+                                index[dep_name] = nodes
+                            else:
+                                mine = index[dep_name]
+                                index[dep_name] = mine + tuple(
+                                    n for n in nodes
+                                    if not any(n is m for m in mine))
+                    spec._index = index
+
+        return self._index
+
+
+    def _nodes_named(self, name):
+        """Tuple of the nodes with the given name in the DAG rooted at
+           this spec, in preorder."""
+        nodes = self._name_index().get(name, ())
+        if name == self.name:
+            nodes = (self,) + nodes
+        return nodes
+
+
+    def _dependency_names(self):
+        """Set of names of all nodes below this one in its DAG."""
+        return set(self._name_index())
 
 
     @property
@@ -363,17 +773,23 @@ class Spec(object):
            In spack specs, there should be a single root (the package being
            installed).  This will throw an assertion error if that is not
            the case.
+
+           The root is cached through a weak reference, like dependents.
         """
-        if not self.dependents:
-            return self
-        else:
-            # If the spec has multiple dependents, ensure that they all
-            # lead to the same place.  Spack shouldn't deal with any DAGs
-            # with multiple roots, so something's wrong if we find one.
-            depiter = iter(self.dependents.values())
-            first_root = next(depiter).root
-            assert(all(first_root is d.root for d in depiter))
-            return first_root
+        root = self._root() if self._root is not None else None
+        if root is None:
+            if not self.dependents:
+                root = self
+            else:
+                # If the spec has multiple dependents, ensure that they all
+                # lead to the same place.  Spack shouldn't deal with any DAGs
+                # with multiple roots, so something's wrong if we find one.
+                depiter = iter(self.dependents.values())
+                root = next(depiter).root
+                assert(all(root is d.root for d in depiter))
+            self._root = weakref.ref(root)
+
+        return root
 
 
     @property
@@ -381,6 +797,12 @@ class Spec(object):
         return packages.get(self)
 
 
+    @property
+    def frozen(self):
+        """True if freeze() has made this spec immutable."""
+        return self._frozen
+
+
     @property
     def virtual(self):
         """Right now, a spec is virtual if no package exists with its name.
@@ -390,6 +812,8 @@ class Spec(object):
            Possible idea: just use conventin and make virtual deps all
            caps, e.g., MPI vs mpi.
         """
+        if self._frozen:
+            return self._virtual
         return not packages.exists(self.name)
 
 
@@ -399,6 +823,8 @@ class Spec(object):
            If any of the name, version, architecture, compiler, or depdenencies
            are ambiguous,then it is not concrete.
         """
+        if self._frozen:
+            return self._concrete
         return bool(not self.virtual
                     and self.versions.concrete
                     and self.architecture
@@ -406,62 +832,27 @@ class Spec(object):
                     and self.dependencies.concrete)
 
 
-    def preorder_traversal(self, visited=None, d=0, **kwargs):
-        """Generic preorder traversal of the DAG represented by this spec.
-           This will yield each node in the spec.  Options:
-
-           cover    [=nodes|edges|paths]
-               Determines how extensively to cover the dag.  Possible vlaues:
+    def traverse(self, **kwargs):
+        """Generic traversal of the DAG represented by this spec.  This
+           will yield each node in the spec.  Dependencies are visited in
+           order of their names.  Options:
 
-               'nodes': Visit each node in the dag only once.  Every node
-                        yielded by this function will be unique.
-               'edges': If a node has been visited once but is reached along a
-                        new path from the root, yield it but do not descend
-                        into it.  This traverses each 'edge' in the DAG once.
-               'paths': Explore every unique path reachable from the root.
-                        This descends into visited subtrees and will yield
-                        nodes twice if they're reachable by multiple paths.
+           order    [=pre|post|bfs|topo]
+               'pre' yields each node before its dependencies and 'post'
+               after them.  'bfs' yields nodes breadth-first.  'topo'
+               yields each node once, after all of its dependencies, or
+               before all of its dependents with reverse=True.
 
-           depth    [=False]
-               Defaults to False.  When True, yields not just nodes in the
-               spec, but also their depth from the root in a (depth, node)
-               tuple.
-
-           keyfun   [=id]
-               Allow a custom key function to track the identity of nodes
-               in the traversal.
-
-           root     [=True]
-               If false, this won't yield the root node, just its descendents.
+           The remaining options (cover, depth, key, root, and reverse)
+           are described in spack.util.traverse.
         """
-        depth      = kwargs.get('depth', False)
-        key_fun    = kwargs.get('key', id)
-        yield_root = kwargs.get('root', True)
-        cover      = kwargs.get('cover', 'nodes')
-
-        cover_values = ('nodes', 'edges', 'paths')
-        if cover not in cover_values:
-            raise ValueError("Invalid value for cover: %s.  Choices are %s"
-                             % (cover, ",".join(cover_values)))
-
-        if visited is None:
-            visited = set()
-
-        result = (d, self) if depth else self
-        key = key_fun(self)
-
-        if key in visited:
-            if cover == 'nodes':    return
-            if yield_root or d > 0: yield result
-            if cover == 'edges':    return
-        else:
-            if yield_root or d > 0: yield result
+        return traverse_specs([self], **kwargs)
 
-        visited.add(key)
-        for name in sorted(self.dependencies):
-            child = self.dependencies[name]
-            for elt in child.preorder_traversal(visited, d+1, **kwargs):
-                yield elt
+
+    def preorder_traversal(self, **kwargs):
+        """Preorder traversal of the DAG represented by this spec.  Takes
+           the same options as traverse()."""
+        return traverse.preorder([self], _sorted_dependencies, **kwargs)
 
 
     @property
@@ -492,6 +883,7 @@ class Spec(object):
             # to presets below, their constraints will all be merged, but we'll
             # still need to select a concrete package later.
             if not self.virtual:
+                self._invalidate_hash()
                 spack.concretizer.concretize_architecture(self)
                 spack.concretizer.concretize_compiler(self)
                 spack.concretizer.concretize_version(self)
@@ -510,9 +902,14 @@ class Spec(object):
 
     def _expand_virtual_packages(self):
         """Find virtual packages in this spec, replace them with providers,
-           and normalize again to include the provider's (potentially virtual)
+           and normalize the providers to include their (potentially virtual)
            dependencies.  Repeat until there are no virtual deps.
 
+           Only the subgraph below newly added providers is merged; the
+           rest of the DAG is already normalized and is left alone.  A
+           provider that is already in the DAG is constrained and reused
+           rather than added a second time.
+
            Precondition: spec is normalized.
 
            .. todo::
@@ -526,19 +923,35 @@ class Spec(object):
               a problem.
         """
         while True:
-            virtuals =[v for v in self.preorder_traversal() if v.virtual]
+            virtuals =[v for v in self.traverse() if v.virtual]
             if not virtuals:
                 return
 
+            spec_deps = DependencyMap()
+            for spec in self.traverse():
+                if not spec.virtual:
+                    spec_deps[spec.name] = spec
+
+            added = []
             for spec in virtuals:
                 providers = packages.providers_for(spec)
                 concrete = spack.concretizer.choose_provider(spec, providers)
-                concrete = concrete.copy()
-                spec._replace_with(concrete)
+                if concrete.name in spec_deps:
+                    # Consolidate duplicate providers and merge constraints.
+                    provider = spec_deps[concrete.name]
+                    provider.constrain(concrete, deps=False)
+                else:
+                    provider = concrete.copy()
+                    spec_deps[provider.name] = provider
+                    added.append(provider)
+                spec._replace_with(provider)
 
-            # If there are duplicate providers or duplicate provider deps, this
-            # consolidates them and merges constraints.
-            self.normalize()
+            # Only the new providers need their dependencies merged in.
+            index = packages.ProviderIndex(spec_deps.values(), restrict=True)
+            visited = set(spec_deps).difference(p.name for p in added)
+            for provider in added:
+                provider.package.validate_dependencies()
+                provider._normalize_helper(visited, spec_deps, index)
 
 
     def concretize(self):
@@ -552,10 +965,17 @@ class Spec(object):
            Concretizing ensures that it is self-consistent and that it's consistent
            with requirements of its pacakges.  See flatten() and normalize() for
            more details on this.
+
+           The concrete spec is frozen (see freeze()) once it is done.
+           Frozen specs are already concrete, so this does nothing to them.
         """
+        if self._frozen:
+            return
+
         self.normalize()
         self._expand_virtual_packages()
         self._concretize_helper()
+        self.freeze()
 
 
     def concretized(self):
@@ -567,6 +987,39 @@ class Spec(object):
         return clone
 
 
+    def freeze(self):
+        """Make this spec and everything it depends on immutable.  Frozen
+           specs compute their hash, string form, comparison key, and
+           concreteness once, here, and reuse them afterwards.  Any attempt
+           to change a frozen spec raises FrozenSpecError.  Don't modify
+           the fields of a frozen spec (e.g., its versions) directly.
+
+           Since frozen specs never change, a frozen sub-DAG can be added
+           as a dependency of any number of other specs without copying
+           it.  Its dependents may then come from different DAGs, so
+           the root of a shared node isn't meaningful.  Copies of a frozen
+           spec are not frozen.  Frozen specs with equal compilers share
+           one Compiler object.
+        """
+        self.sha1()
+
+        # Visit dependencies before dependents, so that each node's key
+        # can hash its dependencies' cached hashes.
+        for spec in self.traverse(order='topo'):
+            if spec._frozen:
+                continue
+            if spec.compiler:
+                # An equal compiler doesn't change the hash.
+                spec._compiler = _frozen_compiler(spec.compiler)
+            spec._virtual = spec.virtual
+            spec._concrete = spec.concrete
+            spec._str = str(spec)
+            spec._key = spec._cmp_key()
+            spec._frozen = True
+            spec._key_hash = hash(spec._key)
+        return self
+
+
     def flat_dependencies(self):
         """Return a DependencyMap containing all of this spec's dependencies
            with their constraints merged.  If there are any conflicts, throw
@@ -607,7 +1060,12 @@ class Spec(object):
         """Pull all dependencies up to the root (this spec).
            Merge constraints for dependencies with the same name, and if they
            conflict, throw an exception. """
-        self.dependencies = self.flat_dependencies()
+        flat_deps = self.flat_dependencies()
+        self._invalidate_hash()
+        self.dependencies = DependencyMap()
+        self._invalidate_index()
+        for name in flat_deps:
+            self._add_dependency(flat_deps[name])
 
 
     def _normalize_helper(self, visited, spec_deps, provider_index):
@@ -711,7 +1169,9 @@ class Spec(object):
         # provided spec is sane, and that all dependency specs are in the
         # root node of the spec.  flat_dependencies will do this for us.
         spec_deps = self.flat_dependencies()
+        self._invalidate_hash()
         self.dependencies.clear()
+        self._invalidate_index()
 
         # Figure out which of the user-provided deps provide virtual deps.
         # Remove virtual deps that are already provided by something in the spec
@@ -741,7 +1201,7 @@ class Spec(object):
     def normalized(self):
         """Return a normalized copy of this spec without modifying this spec."""
         clone = self.copy()
-        clone.normalized()
+        clone.normalize()
         return clone
 
 
@@ -782,10 +1242,13 @@ class Spec(object):
                 raise UnsatisfiableArchitectureSpecError(self.architecture,
                                                          other.architecture)
 
+        self._invalidate_hash()
         if self.compiler is not None and other.compiler is not None:
             self.compiler.constrain(other.compiler)
-        elif self.compiler is None:
-            self.compiler = other.compiler
+        elif self.compiler is None and other.compiler is not None:
+            # Copy so that later constraints on our compiler don't
+            # modify other's compiler.
+            self.compiler = other.compiler.copy()
 
         self.versions.intersect(other.versions)
         self.variants.update(other.variants)
@@ -817,18 +1280,15 @@ class Spec(object):
 
     def common_dependencies(self, other):
         """Return names of dependencies that self an other have in common."""
-        common = set(
-            s.name for s in self.preorder_traversal(root=False))
-        common.intersection_update(
-            s.name for s in other.preorder_traversal(root=False))
+        common = self._dependency_names()
+        common.intersection_update(other._dependency_names())
         return common
 
 
     def dep_difference(self, other):
         """Returns dependencies in self that are not in other."""
-        mine = set(s.name for s in self.preorder_traversal(root=False))
-        mine.difference_update(
-            s.name for s in other.preorder_traversal(root=False))
+        mine = self._dependency_names()
+        mine.difference_update(other._dependency_names())
         return mine
 
 
@@ -881,16 +1341,27 @@ class Spec(object):
         if not self.dependencies or not other.dependencies:
             return True
 
+        # Results only depend on the two DAGs and on the packages they
+        # refer to, so they're memoized by hash.  Callers like find and
+        # multimethod dispatch ask the same questions over and over.
+        key = (self.sha1(), other.sha1(), spack.packages_path)
+        result = _satisfies_cache.get(key)
+        if result is None:
+            result = self._satisfies_dependencies(other)
+            _satisfies_cache[key] = result
+        return result
+
+
+    def _satisfies_dependencies(self, other):
+        """Uncached implementation of satisfies_dependencies()."""
         # Handle first-order constraints directly
         for name in self.common_dependencies(other):
             if not self[name].satisfies(other[name]):
                 return False
 
         # For virtual dependencies, we need to dig a little deeper.
-        self_index = packages.ProviderIndex(
-            self.preorder_traversal(), restrict=True)
-        other_index = packages.ProviderIndex(
-            other.preorder_traversal(), restrict=True)
+        self_index = self.provider_index()
+        other_index = other.provider_index()
 
         # This handles cases where there are already providers for both vpkgs
         if not self_index.satisfies(other_index):
@@ -910,6 +1381,25 @@ class Spec(object):
         return True
 
 
+    def provider_index(self):
+        """Returns a restricted ProviderIndex of the packages in this spec's
+           DAG.  Indices are cached by the DAG's hash, so callers must
+           not modify them.
+
+           Other DAGs with the same hash get the same index, so it must
+           not change when this DAG does.  It holds copies of the nodes
+           that aren't frozen, without their dependencies.
+        """
+        key = (self.sha1(), spack.packages_path)
+        index = _provider_index_cache.get(key)
+        if index is None:
+            nodes = [node if node.frozen else node.copy(dependencies=False)
+                     for node in self.preorder_traversal()]
+            index = packages.ProviderIndex(nodes, restrict=True)
+            _provider_index_cache[key] = index
+        return index
+
+
     def virtual_dependencies(self):
         """Return list of any virtual deps in this spec."""
         return [spec for spec in self.preorder_traversal() if spec.virtual]
@@ -921,27 +1411,55 @@ class Spec(object):
            copies dependencies.
 
            To duplicate an entire DAG, call _dup() on the root of the DAG.
+           Each node in the DAG is copied exactly once, so nodes that are
+           shared by several dependents are also shared in the copy.
 
            Options:
            dependencies[=True]
                Whether deps should be copied too.  Set to false to copy a
                spec but not its dependencies.
         """
-        # TODO: this needs to handle DAGs.
+        self._dup_node(other)
+        if not kwargs.get('dependencies', True):
+            return
+
+        # The copy has the same structure as the original, so every node
+        # hashes the same as the node it was copied from.
+        self._hash = other._hash
+
+        # Map from ids of nodes in other's DAG to their copies.
+        copies = { id(other) : self }
+        stack = [other]
+        while stack:
+            node = stack.pop()
+            clone = copies[id(node)]
+            for name, dep in node.dependencies.iteritems():
+                dep_copy = copies.get(id(dep))
+                if dep_copy is None:
+                    dep_copy = Spec.__new__(Spec)
+                    dep_copy._dup_node(dep)
+                    dep_copy._hash = dep._hash
+                    copies[id(dep)] = dep_copy
+                    stack.append(dep)
+
+                clone.dependencies[name] = dep_copy
+                dep_copy.dependents[clone.name] = clone
+
+
+    def _dup_node(self, other):
+        """Copy the fields of the node other into self, without any
+           dependencies or dependents."""
         self.name = other.name
-        self.versions = other.versions.copy()
-        self.variants = other.variants.copy()
-        self.architecture = other.architecture
-        self.compiler = None
+        self._versions = other.versions.copy()
+        self._variants = other.variants.copy()
+        self._architecture = other.architecture
+        self._compiler = None
         if other.compiler:
-            self.compiler = other.compiler.copy()
+            self._compiler = other.compiler.copy()
 
-        self.dependents = DependencyMap()
-        copy_deps = kwargs.get('dependencies', True)
-        if copy_deps:
-            self.dependencies = other.dependencies.copy()
-        else:
-            self.dependencies = DependencyMap()
+        self.dependents = DependentMap()
+        self.dependencies = DependencyMap()
+        self._clear_caches()
 
 
     def copy(self, **kwargs):
@@ -963,28 +1481,33 @@ class Spec(object):
 
     def __getitem__(self, name):
         """TODO: reconcile __getitem__, _add_dependency, __contains__"""
-        for spec in self.preorder_traversal():
-            if spec.name == name:
-                return spec
-
-        raise KeyError("No spec with name %s in %s" % (name, self))
+        nodes = self._nodes_named(name)
+        if not nodes:
+            raise KeyError("No spec with name %s in %s" % (name, self))
+        return nodes[0]
 
 
     def __contains__(self, spec):
         """True if this spec has any dependency that satisfies the supplied
            spec."""
         spec = self._autospec(spec)
-        for s in self.preorder_traversal():
-            if s.satisfies(spec):
-                return True
-        return False
+        nodes = self._nodes_named(spec.name)
+        return any(s.satisfies(spec) for s in nodes)
 
 
     def _cmp_key(self):
+        if self._frozen:
+            return self._key
         return (self.name, self.versions, self.variants,
                 self.architecture, self.compiler, self.dependencies)
 
 
+    def __hash__(self):
+        if self._frozen:
+            return self._key_hash
+        return hash(self._cmp_key())
+
+
     def colorized(self):
         return colorize_spec(self)
 
@@ -1006,66 +1529,18 @@ class Spec(object):
 
            *Example:*  ``$_$@$+`` translates to the name, version, and options
            of the package, but no dependencies, arch, or compiler.
+
+           Format strings are compiled once (see _compile_format) and the
+           compiled renderers are reused by later calls.
            """
         color = kwargs.get('color', False)
-        length = len(format_string)
-        out = StringIO()
-        escape = compiler = False
-
-        def write(s, c):
-            if color:
-                f = color_formats[c] + cescape(s) + '@.'
-                cwrite(f, stream=out, color=color)
-            else:
-                out.write(s)
-
-        for i, c in enumerate(format_string):
-            if escape:
-                if c == '_':
-                    out.write(self.name)
-                elif c == '@':
-                    if self.versions and self.versions != _any_version:
-                        write(c + str(self.versions), c)
-                elif c == '%':
-                    if self.compiler:
-                        write(c + str(self.compiler.name), c)
-                    compiler = True
-                elif c == '+':
-                    if self.variants:
-                        write(str(self.variants), c)
-                elif c == '=':
-                    if self.architecture:
-                        write(c + str(self.architecture), c)
-                elif c == '#':
-                    if self.dependencies:
-                        out.write('-' + self.dependencies.sha1()[:6])
-                elif c == '$':
-                    out.write('$')
-                escape = False
-
-            elif compiler:
-                if c == '@':
-                    if self.compiler and self.compiler.versions:
-                        write(c + str(self.compiler.versions), '%')
-                elif c == '$':
-                    escape = True
-                else:
-                    out.write(c)
-                compiler = False
-
-            elif c == '$':
-                escape = True
-                if i == length - 1:
-                    raise ValueError("Error: unterminated $ in format: '%s'"
-                                     % format_string)
-            else:
-                out.write(c)
-
-        result = out.getvalue()
-        return result
+        return ''.join(render(self, color)
+                       for render in _compile_format(format_string))
 
 
     def __str__(self):
+        if self._frozen:
+            return self._str
         by_name = lambda d: d.name
         deps = self.preorder_traversal(key=by_name, root=False)
         sorted_deps = sorted(deps, key=by_name)
@@ -1073,39 +1548,151 @@ class Spec(object):
         return self.format() + dep_string
 
 
-    def tree(self, **kwargs):
-        """Prints out this spec and its dependencies, tree-formatted
-           with indentation."""
+    def tree_lines(self, **kwargs):
+        """Generates the lines of tree(), one at a time, each ending in a
+           newline.  Takes the same options as tree()."""
         color  = kwargs.get('color', False)
         depth  = kwargs.get('depth', False)
         showid = kwargs.get('ids',   False)
         cover  = kwargs.get('cover', 'nodes')
-        indent = kwargs.get('indent', 0)
+        indent = " " * kwargs.get('indent', 0)
         format = kwargs.get('format', '$_$@$%@$+$=')
 
-        out = ""
-        cur_id = 0
         ids = {}
         for d, node in self.preorder_traversal(cover=cover, depth=True):
-            out += " " * indent
+            out = [indent]
             if depth:
-                out += "%-4d" % d
+                out.append("%-4d" % d)
             if not id(node) in ids:
-                cur_id += 1
-                ids[id(node)] = cur_id
+                ids[id(node)] = len(ids) + 1
             if showid:
-                out += "%-4d" % ids[id(node)]
-            out += ("    " * d)
+                out.append("%-4d" % ids[id(node)])
+            out.append("    " * d)
             if d > 0:
-                out += "^"
-            out += node.format(format, color=color) + "\n"
-        return out
+                out.append("^")
+            out.append(node.format(format, color=color))
+            out.append("\n")
+            yield ''.join(out)
+
+
+    def tree(self, **kwargs):
+        """Prints out this spec and its dependencies, tree-formatted
+           with indentation.  If a stream is supplied with stream=<file>,
+           the lines are written straight to it and nothing is returned;
+           otherwise the tree is returned as a string."""
+        stream = kwargs.get('stream', None)
+        lines = self.tree_lines(**kwargs)
+        if stream is None:
+            return ''.join(lines)
+
+        for line in lines:
+            stream.write(line)
 
 
     def sha1(self):
-        sha = hashlib.sha1()
-        sha.update(str(self))
-        return sha.hexdigest()
+        """Merkle hash of the DAG rooted at this spec.  Each node's hash
+           combines the node's own fields with its dependencies' hashes.
+           Hashes are cached on every node and cleared when a node or one
+           of its dependencies changes, so rehashing only has to visit the
+           nodes that were modified since the last call.
+        """
+        if self._hash is None:
+            # Hash uncached nodes bottom-up, without recursion so that
+            # deep DAGs don't hit the recursion limit.
+            stack = [self]
+            while stack:
+                spec = stack[-1]
+                unhashed = [d for d in spec.dependencies.values()
+                            if d._hash is None]
+                if unhashed:
+                    stack.extend(unhashed)
+                    continue
+
+                stack.pop()
+                if spec._hash is None:
+                    sha = hashlib.sha1()
+                    sha.update(spec.format())
+                    for name in sorted(spec.dependencies.keys()):
+                        sha.update(spec.dependencies[name]._hash)
+                    spec._hash = sha.hexdigest()
+
+        return self._hash
+
+
+    def to_dict(self):
+        """Returns a structured representation of the DAG rooted at this
+           spec, made only of dicts, lists and strings so that it can be
+           stored as JSON.  Nodes are listed in preorder, so the root comes
+           first, and each node refers to its dependencies by their
+           position in the node list.  Each node also records its hash.
+        """
+        nodes = list(self.preorder_traversal())
+        positions = dict((id(node), i) for i, node in enumerate(nodes))
+
+        node_dicts = []
+        for node in nodes:
+            compiler = None
+            if node.compiler:
+                compiler = { 'name'     : node.compiler.name,
+                             'versions' : str(node.compiler.versions) }
+
+            node_dicts.append({
+                'name'         : node.name,
+                'versions'     : str(node.versions),
+                'compiler'     : compiler,
+                'variants'     : dict((v.name, v.enabled)
+                                      for v in node.variants.values()),
+                'architecture' : node.architecture,
+                'hash'         : node.sha1(),
+                'dependencies' : dict((name, positions[id(dep)])
+                                      for name, dep in node.dependencies.items())
+            })
+
+        return { 'nodes' : node_dicts }
+
+
+    @staticmethod
+    def from_dict(data):
+        """Rebuild a spec from the output of to_dict().  This builds the
+           nodes directly and links them in one pass, without going through
+           the spec parser, and it seeds each node's hash from the stored
+           one so that the DAG does not need to be rehashed.
+        """
+        nodes = []
+        for node_dict in data['nodes']:
+            spec = Spec.__new__(Spec)
+            spec.name = str(node_dict['name'])
+            spec._versions = _version_list(node_dict['versions'])
+            spec._variants = VariantMap()
+            for name, enabled in node_dict['variants'].iteritems():
+                spec.variants[str(name)] = Variant(str(name), enabled)
+
+            spec._architecture = node_dict['architecture']
+            if spec.architecture is not None:
+                spec._architecture = str(spec.architecture)
+
+            spec._compiler = None
+            compiler_dict = node_dict['compiler']
+            if compiler_dict:
+                spec._compiler = Compiler(str(compiler_dict['name']))
+                spec.compiler.versions = _version_list(
+                    compiler_dict['versions'])
+
+            spec.dependents   = DependentMap()
+            spec.dependencies = DependencyMap()
+            spec._clear_caches()
+            nodes.append(spec)
+
+        for spec, node_dict in zip(nodes, data['nodes']):
+            for name, position in node_dict['dependencies'].iteritems():
+                dep = nodes[position]
+                spec.dependencies[str(name)] = dep
+                dep.dependents[spec.name] = spec
+            spec._hash = node_dict.get('hash')
+            if spec._hash is not None:
+                spec._hash = str(spec._hash)
+
+        return nodes[0]
 
 
     def __repr__(self):
@@ -1121,22 +1708,25 @@ class SpecLexer(spack.parse.Lexer):
     """Parses tokens that make up spack specs."""
     def __init__(self):
         super(SpecLexer, self).__init__([
-            (r'\^',        lambda scanner, val: self.token(DEP,   val)),
-            (r'\@',        lambda scanner, val: self.token(AT,    val)),
-            (r'\:',        lambda scanner, val: self.token(COLON, val)),
-            (r'\,',        lambda scanner, val: self.token(COMMA, val)),
-            (r'\+',        lambda scanner, val: self.token(ON,    val)),
-            (r'\-',        lambda scanner, val: self.token(OFF,   val)),
-            (r'\~',        lambda scanner, val: self.token(OFF,   val)),
-            (r'\%',        lambda scanner, val: self.token(PCT,   val)),
-            (r'\=',        lambda scanner, val: self.token(EQ,    val)),
-            (r'\w[\w.-]*', lambda scanner, val: self.token(ID,    val)),
-            (r'\s+',       lambda scanner, val: None)])
+            (r'\^',        DEP),
+            (r'\@',        AT),
+            (r'\:',        COLON),
+            (r'\,',        COMMA),
+            (r'\+',        ON),
+            (r'\-',        OFF),
+            (r'\~',        OFF),
+            (r'\%',        PCT),
+            (r'\=',        EQ),
+            (r'\w[\w.-]*', ID),
+            (r'\s+',       None)])
+
+"""Lexers are stateless, so all spec parsers share one."""
+_lexer = SpecLexer()
 
 
 class SpecParser(spack.parse.Parser):
     def __init__(self):
-        super(SpecParser, self).__init__(SpecLexer())
+        super(SpecParser, self).__init__(_lexer)
 
 
     def do_parse(self):
@@ -1169,12 +1759,13 @@ class SpecParser(spack.parse.Parser):
         # This will init the spec without calling __init__.
         spec = Spec.__new__(Spec)
         spec.name = self.token.value
-        spec.versions = VersionList()
-        spec.variants = VariantMap()
-        spec.architecture = None
-        spec.compiler = None
-        spec.dependents   = DependencyMap()
+        spec._versions = VersionList()
+        spec._variants = VariantMap()
+        spec._architecture = None
+        spec._compiler = None
+        spec.dependents   = DependentMap()
         spec.dependencies = DependencyMap()
+        spec._clear_caches()
 
         # record this so that we know whether version is
         # unspecified or not.
@@ -1271,11 +1862,46 @@ class SpecParser(spack.parse.Parser):
             self.last_token_error("Identifier cannot contain '.'")
 
 
+"""Cache of parse results, keyed by spec string.  Parsing the same short
+   strings over and over is common (e.g., in package relations and when
+   checking satisfies() against strings), so we keep recent results here.
+   Cached specs must never be handed out directly; callers get copies."""
+_parse_cache = LRUCache(4096)
+
+"""Memoized results of satisfies_dependencies(), keyed by the hashes of
+   the two specs being compared."""
+_satisfies_cache = LRUCache(8192)
+
+"""Restricted ProviderIndex for each spec DAG, keyed by the DAG's hash.
+   Kept here rather than on the specs, so the specs the indices refer to
+   don't refer back to them."""
+_provider_index_cache = LRUCache(1024)
+
+
+def _cached_parse(string):
+    """Parse a string into a list of specs, consulting the parse cache
+       first.  Strings that fail to parse are cached too, so the same
+       SpecParseError is raised again without re-parsing.  The specs
+       returned are owned by the cache and must not be modified.
+    """
+    result = _parse_cache.get(string)
+    if result is None:
+        try:
+            result = SpecParser().parse(string)
+        except SpecParseError, e:
+            result = e
+        _parse_cache[string] = result
+
+    if isinstance(result, SpecParseError):
+        raise result
+    return result
+
+
 def parse(string):
     """Returns a list of specs from an input string.
        For creating one spec, see Spec() constructor.
     """
-    return SpecParser().parse(string)
+    return [spec.copy() for spec in _cached_parse(string)]
 
 
 def parse_anonymous_spec(spec_like, pkg_name):
@@ -1351,6 +1977,13 @@ class DuplicateArchitectureError(SpecError):
         super(DuplicateArchitectureError, self).__init__(message)
 
 
+class FrozenSpecError(SpecError):
+    """Raised when something tries to change a frozen spec."""
+    def __init__(self, spec):
+        super(FrozenSpecError, self).__init__(
+            "Cannot modify frozen spec %s" % spec)
+
+
 class InconsistentSpecError(SpecError):
     """Raised when two nodes in the same spec DAG have inconsistent
        constraints."""
@@ -37,6 +37,8 @@ test_names = ['versions',
               'spec_semantics',
               'spec_dag',
               'concretize',
+              'directory_layout',
+              'web',
               'multimethod']
 
 
@@ -22,10 +22,21 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
+import os
+import sys
+import shutil
+import tempfile
 import unittest
+import argparse
+from StringIO import StringIO
+from contextlib import closing
 
+import spack
+import spack.cmd.validate
 import spack.packages as packages
-from spack.spec import Spec
+import spack.tty as tty
+from spack.package import Package
+from spack.spec import *
 from spack.test.mock_packages_test import *
 
 class ConcretizeTest(MockPackagesTest):
@@ -167,3 +178,192 @@ class ConcretizeTest(MockPackagesTest):
         print spec.tree(color=True)
 
         spec.concretize()
+
+
+    def test_concretize_freezes(self):
+        spec = Spec('mpileaks')
+        spec.concretize()
+
+        for node in spec.preorder_traversal():
+            self.assertTrue(node.concrete)
+            self.assertRaises(FrozenSpecError, node._add_version, ver('1.0'))
+            self.assertRaises(FrozenSpecError, node.constrain, node.copy())
+        self.assertRaises(FrozenSpecError, spec.normalize)
+        self.assertEqual(str(spec), str(spec.copy()))
+
+        # Copies are not frozen, but compare and hash equal.
+        copy = spec.copy()
+        self.assertEqual(spec, copy)
+        self.assertEqual(hash(spec), hash(copy))
+        copy.dependencies['callpath'].versions = VersionList(['0.9'])
+        self.assertNotEqual(spec, copy)
+
+        # Concretizing again is a no-op.
+        before = str(spec)
+        spec.concretize()
+        self.assertEqual(before, str(spec))
+
+
+    def test_frozen_specs_can_be_shared(self):
+        mpich = Spec('mpich').concretized()
+        first = Spec('a', mpich)
+        second = Spec('b', mpich)
+
+        self.assertIs(first.dependencies['mpich'], mpich)
+        self.assertIs(second.dependencies['mpich'], mpich)
+        self.assertEqual(first.sha1(), Spec('a', mpich.copy()).sha1())
+        self.assertRaises(FrozenSpecError, first['mpich'].constrain, 'mpich')
+
+
+    def test_install_dependencies_visits_each_once(self):
+        spec = Spec('mpileaks').concretized()
+        installs, messages = [], []
+
+        def do_install(pkg, **kwargs):
+            installs.append(pkg.name)
+            if kwargs.get('dependencies', True):
+                pkg.do_install_dependencies()
+
+        saved = (Package.do_install, Package.installed, tty.msg, tty.pkg)
+        Package.do_install = do_install
+        Package.installed = property(lambda pkg: pkg.name == 'libelf')
+        tty.msg, tty.pkg = messages.append, lambda prefix: None
+        try:
+            spec.package.do_install_dependencies()
+        finally:
+            Package.do_install, Package.installed, tty.msg, tty.pkg = saved
+
+        deps = set(s.name for s in spec.traverse(root=False))
+        self.assertEqual(sorted(deps - set(['libelf'])), sorted(installs))
+        self.assertEqual(['libelf is already installed.'], messages)
+
+
+    def test_providers_for_version_ranges(self):
+        providers = packages.providers_for('mpi@2.2:')
+        self.assertTrue(any(spec.satisfies('zmpi') for spec in providers))
+        self.assertTrue(any(spec.satisfies('mpich2@1.2:') for spec in providers))
+        self.assertFalse(any(spec.satisfies('mpich2@:1.1') for spec in providers))
+
+        providers = packages.providers_for('mpi@4:')
+        self.assertEqual(['zmpi'], [spec.name for spec in providers])
+
+        providers = packages.providers_for('mpi')
+        self.assertEqual(set(['mpich', 'mpich2', 'zmpi']),
+                         set(spec.name for spec in providers))
+
+
+    def test_package_index_is_cached(self):
+        packages._package_indices.clear()
+        packages._provider_indices.clear()
+        before = [str(s) for s in packages.providers_for('mpi@2:')]
+        self.assertTrue(os.path.exists(packages.index_cache_file()))
+
+        # A fresh process reads the cache without importing packages.
+        packages._package_indices.clear()
+        packages._provider_indices.clear()
+        real_get_class = packages.get_class_for_package_name
+        try:
+            def fail(pkg_name):
+                self.fail("Imported %s with an up to date cache." % pkg_name)
+            packages.get_class_for_package_name = fail
+            after = [str(s) for s in packages.providers_for('mpi@2:')]
+            info = packages.info('mpich2')
+        finally:
+            packages.get_class_for_package_name = real_get_class
+        self.assertEqual(before, after)
+        self.assertEqual(['1.0', '1.1', '1.2', '1.3', '1.4', '1.5'],
+                         sorted(info.versions))
+        self.assertIn(['mpi@:2.2', 'mpich2@1.2:'], info.provided)
+
+
+    def test_package_index_skips_broken_packages(self):
+        # Packages have to be importable, so the directory is made in
+        # spack's module path, but away from the mock packages.
+        path = tempfile.mkdtemp(dir=spack.module_path)
+        shutil.copy(os.path.join(mock_packages_path, 'mpich2.py'), path)
+        open(os.path.join(path, '__init__.py'), 'w').close()
+        with closing(open(os.path.join(path, 'broken.py'), 'w')) as f:
+            f.write('from spack import *\n'
+                    'class Broken(Package):\n'
+                    '    raise RuntimeError("broken package")\n')
+
+        real_packages_path = spack.packages_path
+        spack.packages_path = path
+        try:
+            self.assertEqual(['mpich2'], packages.package_index().keys())
+            self.assertEqual('mpich2', packages.info('mpich2').name)
+            self.assertRaises(SystemExit, packages.info, 'broken')
+        finally:
+            spack.packages_path = real_packages_path
+            packages._package_indices.pop(path, None)
+            shutil.rmtree(path, True)
+
+
+    def test_packages_are_cached_for_frozen_specs(self):
+        spec = Spec('libelf@0.8.13%gcc@4.7=x86_64')
+        self.assertIsNot(packages.get(spec), packages.get(spec))
+
+        spec.freeze()
+        pkg = packages.get(spec)
+        self.assertIs(pkg, packages.get(spec))
+        other = Spec('libelf@0.8.12%gcc@4.7=x86_64').freeze()
+        self.assertIsNot(pkg, packages.get(other))
+
+
+    def test_equal_frozen_specs_get_their_own_packages(self):
+        # Two DAGs with the same hash must not share package state.
+        dag = 'libdwarf@20130729%gcc@4.7=x86_64 ^libelf@0.8.13%gcc@4.7=x86_64'
+        first, second = Spec(dag).freeze(), Spec(dag).freeze()
+        self.assertEqual(first.sha1(), second.sha1())
+
+        first_pkg = first['libelf'].package
+        second_pkg = second['libelf'].package
+        self.assertIs(first['libelf'], first_pkg.spec)
+        self.assertIs(second['libelf'], second_pkg.spec)
+        self.assertIs(first_pkg, first['libelf'].package)
+
+        first_pkg._stage = 'first stage'
+        self.assertIsNone(second_pkg._stage)
+
+
+    def test_validate_package(self):
+        for name in packages.all_package_names():
+            errors, info = packages.validate_package(name)
+            self.assertEqual([], errors)
+            self.assertEqual(name, info.name)
+
+        cls = packages.get_class_for_package_name('libelf')
+        real_url = cls.url
+        try:
+            cls.url = 'gopher://example.com/libelf-0.8.13.tar.gz'
+            errors, info = packages.validate_package('libelf')
+            self.assertEqual(1, len(errors))
+            self.assertIn('Invalid protocol', errors[0])
+        finally:
+            cls.url = real_url
+
+        errors, info = packages.validate_package('nonexistent')
+        self.assertEqual(1, len(errors))
+        self.assertIsNone(info)
+
+
+    def test_validate_command(self):
+        parser = argparse.ArgumentParser()
+        spack.cmd.validate.setup_parser(parser)
+        args = parser.parse_args(['-j', '1'])
+
+        cls = packages.get_class_for_package_name('libdwarf')
+        cls.dependencies['no-such-package'] = Spec('no-such-package')
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            self.assertRaises(SystemExit,
+                              spack.cmd.validate.validate, parser, args)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+            del cls.dependencies['no-such-package']
+
+        failed = [line.split()[0] for line in output.splitlines()
+                  if line.endswith('FAILED')]
+        self.assertEqual(['libdwarf'], failed)
+        self.assertIn('Depends on unknown package no-such-package', output)
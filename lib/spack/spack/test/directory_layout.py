@@ -0,0 +1,111 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""\
+This test verifies that specs survive a trip through the spec files
+that the directory layout writes into each install prefix.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from spack.spec import Spec
+from spack.directory_layout import *
+from spack.test.mock_packages_test import *
+
+
+class DirectoryLayoutTest(MockPackagesTest):
+    def setUp(self):
+        super(DirectoryLayoutTest, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.layout = SpecHashDirectoryLayout(self.tmpdir)
+        self.spec_path = os.path.join(self.tmpdir, 'spec')
+
+
+    def tearDown(self):
+        super(DirectoryLayoutTest, self).tearDown()
+        shutil.rmtree(self.tmpdir, True)
+
+
+    def check_read(self, spec):
+        read = self.layout.read_spec(self.spec_path)
+        self.assertEqual(str(spec), str(read))
+        return read
+
+
+    def test_write_and_read_spec(self):
+        spec = Spec('mpileaks')
+        spec.concretize()
+        self.layout.write_spec(spec, self.spec_path)
+
+        read = self.check_read(spec)
+        self.assertEqual(spec, read)
+        self.assertEqual(spec.tree(ids=True), read.tree(ids=True))
+        self.assertTrue(read.concrete)
+        self.assertEqual(spec.sha1(), read.sha1())
+
+        # Shared dependencies should still be shared after reading.
+        self.assertIs(read['mpich'], read['callpath']['mpich'])
+
+        # Stored hashes should match hashes computed from scratch.
+        self.assertEqual(spec.sha1(), read.copy().sha1())
+        self.assertEqual(spec.sha1(), Spec(str(read)).normalized().sha1())
+
+
+    def test_read_legacy_spec(self):
+        spec = Spec('mpileaks')
+        spec.concretize()
+        with closing(open(self.spec_path, 'w')) as spec_file:
+            spec_file.write(spec.tree(ids=False, cover='nodes'))
+
+        self.check_read(spec)
+
+
+    def test_invalid_spec_file(self):
+        with closing(open(self.spec_path, 'w')) as spec_file:
+            spec_file.write('{"spec_format": 1}')
+        self.assertRaises(InvalidSpecFileError,
+                          self.layout.read_spec, self.spec_path)
+
+
+    def test_paths_of_existing_installs(self):
+        # Install prefixes made before spec hashes were cached must still
+        # be found, so their names can't change.
+        spec = Spec('libdwarf@20130729%gcc@4.7=x86_64 '
+                    '^libelf@0.8.13%gcc@4.7=x86_64')
+        self.assertEqual('x86_64/gcc@4.7/libdwarf@20130729-8bcd5f04',
+                         self.layout.relative_path_for_spec(spec))
+
+        # A tree written by that version of spack is read back in place.
+        prefix = os.path.join(
+            self.tmpdir, 'x86_64', 'gcc@4.7', 'libdwarf@20130729-8bcd5f04')
+        os.makedirs(prefix)
+        with closing(open(os.path.join(prefix, '.spec'), 'w')) as spec_file:
+            spec_file.write('libdwarf@20130729%gcc@4.7=x86_64\n'
+                            '    ^libelf@0.8.13%gcc@4.7=x86_64\n')
+
+        installed = list(self.layout.all_specs())
+        self.assertEqual([str(spec)], [str(s) for s in installed])
+        self.assertEqual(prefix, self.layout.path_for_spec(installed[0]))
@@ -23,6 +23,8 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
 import unittest
+import shutil
+import tempfile
 
 import spack
 import spack.packages as packages
@@ -58,6 +60,10 @@ class MockPackagesTest(unittest.TestCase):
         cls.real_packages_path = spack.packages_path
         spack.packages_path = mock_packages_path
 
+        # Keep indices of the mock packages out of spack's own cache.
+        cls.real_index_cache_path = spack.index_cache_path
+        spack.index_cache_path = tempfile.mkdtemp()
+
         # First time through, record original relationships bt/w packages
         global original_deps
         original_deps = {}
@@ -73,6 +79,9 @@ class MockPackagesTest(unittest.TestCase):
         restore_dependencies()
         spack.packages_path = cls.real_packages_path
 
+        shutil.rmtree(spack.index_cache_path, True)
+        spack.index_cache_path = cls.real_index_cache_path
+
 
     def setUp(self):
         """Before each test, restore deps between packages to original state."""
@@ -27,6 +27,7 @@ Test for multi_method dispatch.
 """
 import unittest
 
+import spack
 import spack.packages as packages
 from spack.multimethod import *
 from spack.version import *
@@ -127,3 +128,32 @@ class MultiMethodTest(MockPackagesTest):
 
         pkg = packages.get('multimethod^mpich@1.0')
         self.assertEqual(pkg.different_by_virtual_dep(), 1)
+
+
+    def test_dispatch_is_cached_for_concrete_specs(self):
+        spec = Spec('multimethod@2.0%gcc@4.7=x86_64')
+        self.assertTrue(spec.concrete)
+        pkg = packages.get(spec)
+        mm = type(pkg).__dict__['different_by_architecture']
+
+        self.assertEqual(pkg.different_by_architecture(), 'x86_64')
+        self.assertIn((spec.sha1(), spack.packages_path), mm._dispatch_cache)
+
+        # Lookups after the first reuse the same bound method.
+        self.assertIs(pkg.version_overlap, pkg.version_overlap)
+        self.assertEqual(pkg.version_overlap(), 1)
+
+
+    def test_when_table_rejects_by_arch_and_compiler(self):
+        cls = type(packages.get('multimethod'))
+        table = cls.__dict__['different_by_architecture']
+        table._dispatch(Spec('multimethod=ppc32'))
+        self.assertEqual([2], table._table.candidates(Spec('multimethod=ppc32')))
+        self.assertEqual([], table._table.candidates(Spec('multimethod=macos')))
+        self.assertEqual([0, 1, 2, 3],
+                         table._table.candidates(Spec('multimethod')))
+
+        table = cls.__dict__['has_a_default']
+        table._dispatch(Spec('multimethod%intel'))
+        self.assertEqual([1], table._table.candidates(Spec('multimethod%intel')))
+        self.assertEqual([], table._table.candidates(Spec('multimethod%pgi')))
@@ -28,7 +28,12 @@ You can find the dummy packages here::
 
     spack/lib/spack/spack/test/mock_packages
 """
+import gc
+import weakref
+from StringIO import StringIO
+
 import spack
+import spack.spec
 import spack.package
 import spack.packages as packages
 
@@ -48,6 +53,35 @@ class SpecDagTest(MockPackagesTest):
                           spec.package.validate_dependencies)
 
 
+    def test_validated_dependencies_are_cached(self):
+        pkg = packages.get('mpileaks')
+        merged = pkg.validate_dependencies()
+        self.assertIs(pkg.validate_dependencies(), merged)
+        self.assertEqual(str(merged['libelf']), 'libelf')
+
+        # Changing a package deeper in the closure invalidates the cache.
+        set_pkg_dep('dyninst', 'libelf@0.8.12')
+        merged = pkg.validate_dependencies()
+        self.assertEqual(str(merged['libelf']), 'libelf@0.8.12')
+
+        set_pkg_dep('libdwarf', 'libelf@0.8.13')
+        self.assertRaises(spack.package.InvalidPackageDependencyError,
+                          pkg.validate_dependencies)
+
+
+    def test_expand_virtual_packages(self):
+        spec = Spec('mpileaks')
+        spec.concretize()
+
+        # Both dependents of mpi share the one provider that was chosen.
+        mpich = spec.dependencies['mpich']
+        self.assertIs(spec['callpath'].dependencies['mpich'], mpich)
+        self.assertEqual(str(mpich.versions), '3.0.4')
+        self.assertEqual(
+            [s.name for s in spec.traverse()],
+            ['mpileaks', 'callpath', 'dyninst', 'libdwarf', 'libelf', 'mpich'])
+
+
     def test_unique_node_traversal(self):
         dag = Spec('mpileaks ^zmpi')
         dag.normalize()
@@ -309,3 +343,153 @@ class SpecDagTest(MockPackagesTest):
         self.assertIn(Spec('libdwarf'), spec)
         self.assertNotIn(Spec('libgoblin'), spec)
         self.assertIn(Spec('mpileaks'), spec)
+
+
+    def test_sha1_is_cached_and_invalidated(self):
+        spec = Spec('mpileaks ^mpich ^callpath ^dyninst ^libelf@1.8.11 ^libdwarf')
+        spec.normalize()
+        h = spec.sha1()
+        self.assertEqual(h, spec.sha1())
+        self.assertEqual(h, spec.copy().sha1())
+
+        # Changing a node deep in the DAG changes hashes all the way up,
+        # but not the hashes of unrelated nodes.
+        mpich_hash = spec['mpich'].sha1()
+        spec['libelf'].constrain('libelf@1.8.11%gcc')
+        self.assertNotEqual(h, spec.sha1())
+        self.assertEqual(mpich_hash, spec['mpich'].sha1())
+
+        fresh = Spec('mpileaks ^mpich ^callpath ^dyninst ^libelf@1.8.11%gcc ^libdwarf')
+        fresh.normalize()
+        self.assertEqual(fresh.sha1(), spec.sha1())
+
+
+    def test_index_and_root_follow_changes(self):
+        libelf = Spec('libelf')
+        libdwarf = Spec('libdwarf', libelf)
+        self.assertIs(libelf.root, libdwarf)
+        self.assertIs(libdwarf['libelf'], libelf)
+        self.assertRaises(KeyError, libdwarf.__getitem__, 'dyninst')
+
+        # Hang the DAG under a new root.  Names added below an indexed node
+        # must show up, and roots must be recomputed for the whole subtree.
+        dyninst = Spec('dyninst', libdwarf)
+        self.assertIs(libelf.root, dyninst)
+        self.assertIs(dyninst['libelf'], libelf)
+
+        libelf._add_dependency(Spec('mpich'))
+        self.assertIs(dyninst['mpich'], libelf['mpich'])
+        self.assertIn('mpich', dyninst)
+        self.assertIs(dyninst['mpich'].root, dyninst)
+        self.assertEqual(dyninst.common_dependencies(libdwarf),
+                         set(['libelf', 'mpich']))
+
+
+    def test_copy_preserves_dag(self):
+        spec = Spec('mpileaks ^mpich ^callpath ^dyninst ^libelf ^libdwarf')
+        spec.normalize()
+        copy = spec.copy()
+
+        self.assertEqual(spec, copy)
+        self.assertEqual(spec.sha1(), copy.sha1())
+        self.check_links(copy)
+
+        # Shared nodes are copied once and stay shared.
+        self.assertIs(copy['mpich'], copy['callpath'].dependencies['mpich'])
+        self.assertIs(copy['libelf'], copy['libdwarf'].dependencies['libelf'])
+        self.assertIsNot(copy['libelf'], spec['libelf'])
+        self.assertEqual(
+            len(list(copy.preorder_traversal(cover='nodes'))),
+            len(list(spec.preorder_traversal(cover='nodes'))))
+
+
+    def test_tree_to_stream(self):
+        spec = Spec('mpileaks ^mpich ^callpath ^dyninst ^libelf ^libdwarf')
+        spec.normalize()
+
+        stream = StringIO()
+        self.assertIsNone(spec.tree(ids=True, indent=2, stream=stream))
+        self.assertEqual(stream.getvalue(), spec.tree(ids=True, indent=2))
+        self.assertEqual(''.join(spec.tree_lines(ids=True, indent=2)),
+                         stream.getvalue())
+
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[0], '  1   mpileaks')
+        self.assertEqual(lines[1], '  2       ^callpath')
+
+
+    def test_dag_has_no_reference_cycles(self):
+        spec = Spec('mpileaks', Spec('callpath', 'mpich', 'dyninst'))
+        self.assertIs(spec['mpich'].root, spec)
+        self.assertIn('mpileaks', spec['callpath'].dependents)
+
+        # Dependents are weak, so the root is freed as soon as it is
+        # dropped, without waiting for the cycle collector.
+        gc.disable()
+        try:
+            root = weakref.ref(spec)
+            callpath = spec['callpath']
+            del spec
+            self.assertIsNone(root())
+        finally:
+            gc.enable()
+
+        self.assertNotIn('mpileaks', callpath.dependents)
+        self.assertIs(callpath.root, callpath)
+
+
+    def check_order(self, spec, expected, **kwargs):
+        names = [node.name for node in spec.traverse(**kwargs)]
+        self.assertEqual(names, expected)
+
+
+    def test_traversal_orders(self):
+        spec = Spec('mpileaks ^mpich ^callpath ^dyninst ^libelf ^libdwarf')
+        spec.normalize()
+
+        self.check_order(spec, ['mpileaks', 'callpath', 'dyninst', 'libdwarf',
+                                'libelf', 'mpich'])
+        self.check_order(spec, ['mpileaks', 'callpath', 'dyninst', 'libdwarf',
+                                'libelf', 'libelf', 'mpich', 'mpich'],
+                         cover='edges')
+        self.check_order(spec, ['libelf', 'libdwarf', 'dyninst', 'mpich',
+                                'callpath', 'mpileaks'], order='post')
+        self.check_order(spec, ['libelf', 'libdwarf', 'libelf', 'dyninst',
+                                'mpich', 'callpath', 'mpich', 'mpileaks'],
+                         order='post', cover='paths')
+        self.check_order(spec, ['mpileaks', 'callpath', 'mpich', 'dyninst',
+                                'libdwarf', 'libelf'], order='bfs')
+        self.check_order(spec, ['libelf', 'libdwarf', 'dyninst', 'mpich',
+                                'callpath', 'mpileaks'], order='topo')
+        self.check_order(spec, ['mpileaks', 'callpath', 'dyninst', 'libdwarf',
+                                'libelf', 'mpich'], order='topo', reverse=True)
+        self.check_order(spec, ['libelf', 'libdwarf', 'dyninst', 'mpich',
+                                'callpath'], order='topo', root=False)
+
+        depths = [d for d, node in spec.traverse(order='bfs', depth=True)]
+        self.assertEqual(depths, [0, 1, 1, 2, 3, 3])
+        self.assertRaises(ValueError, spec.traverse, order='sideways')
+
+
+    def test_traverse_several_specs(self):
+        mpileaks = Spec('mpileaks ^mpich ^callpath ^dyninst ^libelf ^libdwarf')
+        mpileaks.normalize()
+        libdwarf = Spec('libdwarf ^libelf')
+        libdwarf.normalize()
+
+        # Separate DAGs are joined on nodes with the same key.
+        by_hash = lambda spec: spec.sha1()
+        names = [s.name for s in spack.spec.traverse_specs(
+                    [libdwarf, mpileaks], order='topo', key=by_hash)]
+        self.assertEqual(names, ['libelf', 'libdwarf', 'dyninst', 'mpich',
+                                 'callpath', 'mpileaks'])
+
+
+    def test_package_traversal(self):
+        names = [pkg.name for pkg in packages.get('mpileaks').preorder_traversal()]
+        self.assertEqual(names, ['mpileaks', 'callpath', 'dyninst', 'libdwarf',
+                                 'libelf'])
+        virtuals = [s.name for s in packages.get('mpileaks').preorder_traversal(
+                    virtual=True)]
+        self.assertEqual(set(virtuals), set(['mpi']))
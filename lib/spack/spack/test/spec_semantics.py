@@ -154,6 +154,28 @@ class SpecSematicsTest(MockPackagesTest):
         self.check_unsatisfiable('mpileaks^mpi@3:', '^mpich@1.0')
 
 
+    def test_provider_index_is_not_shared_with_changed_dags(self):
+        # Build and cache the provider index of one DAG, then change it.
+        spec = Spec('mpileaks ^mpich')
+        spec.provider_index()
+        spec.dependencies['mpich'].constrain(Spec('mpich@1.0'))
+
+        # A new DAG with the hash the old one had must not see the change.
+        self.assertTrue(
+            Spec('mpileaks ^mpich').satisfies(Spec('mpileaks ^mpich@3')))
+
+
+    def test_satisfies_dependencies_memo_tracks_changes(self):
+        spec = Spec('mpileaks^mpich@1.0')
+        self.assertTrue(spec.satisfies('mpileaks^mpi@:1'))
+        self.assertTrue(spec.satisfies('mpileaks^mpi@:1'))
+        self.assertFalse(spec.satisfies('mpileaks^mpi@3:'))
+
+        # Changing a dependency must not return stale memoized results.
+        spec['mpich'].versions = VersionList(['3.0'])
+        self.assertTrue(spec.satisfies('mpileaks^mpi@3:'))
+
+
     def test_constrain(self):
         self.check_constrain('libelf@2.1:2.5', 'libelf@0:2.5', 'libelf@2.1:3')
         self.check_constrain('libelf@2.1:2.5%gcc@4.5:4.6',
@@ -140,6 +140,24 @@ class SpecSyntaxTest(unittest.TestCase):
         self.assertRaises(DuplicateCompilerError, self.check_parse, "x ^y%intel%gcc")
         self.assertRaises(DuplicateCompilerError, self.check_parse, "x ^y%gcc%intel")
 
+    def test_parse_cache_returns_copies(self):
+        first = Spec("x@1.2:1.4+debug ^y%intel")
+        expected = str(first)
+        first.versions.intersect(ver('1.3'))
+        first.dependencies['y'].compiler = None
+
+        second = Spec("x@1.2:1.4+debug ^y%intel")
+        self.assertEqual(str(second), expected)
+        self.assertIsNot(first, second)
+        self.assertIs(second.dependencies['y'].dependents['x'], second)
+
+    def test_cached_parse_errors(self):
+        self.assertRaises(SpecParseError, self.check_parse, "x@@1.2")
+        self.assertRaises(SpecParseError, self.check_parse, "x@@1.2")
+
+    def test_lex_errors(self):
+        self.assertRaises(spack.parse.LexError, SpecLexer().lex, "x@1.2 $y")
+
 
     # ================================================================================
     # Lex checks
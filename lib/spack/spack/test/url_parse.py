@@ -267,3 +267,24 @@ class UrlParseTest(unittest.TestCase):
         self.assert_detected(
             'synergy', '1.3.6p2',
             'http://synergy.googlecode.com/files/synergy-1.3.6p2-MacOSX-Universal.zip')
+
+    def test_parse_names_and_versions(self):
+        urls = ['http://www.mr511.de/software/libelf-0.8.13.tar.gz',
+                'http://www.mr511.de/software/libelf-0.8.12.tar.gz',
+                'http://www.mr511.de/software/libelf-0.8.12.tar.gz',
+                'http://www.mr511.de/software/',
+                'http://example.com/blah.tar']
+        parsed = url.parse_names_and_versions(urls)
+        self.assertEqual(sorted(parsed.keys()), sorted(set(urls[:2])))
+        self.assertEqual(parsed[urls[0]], ('libelf', url.Version('0.8.13')))
+        self.assertEqual(parsed[urls[1]], ('libelf', url.Version('0.8.12')))
+
+    def test_parse_name_with_version_wildcard(self):
+        # Dots in versions match any character, as they always have.
+        self.assertEqual(url.parse_name('foo-1x2', '1.2'), 'foo')
+        self.assertEqual(url.parse_name('/a/foo-bar-1.2-1.2', '1.2'), 'foo-bar-1.2')
+        self.assertRaises(url.UndetectableNameError, url.parse_name, 'foo', '1.2')
+
+    def test_failed_parses_are_repeatable(self):
+        for i in range(2):
+            self.assert_not_detected('http://example.com/blah.tar')
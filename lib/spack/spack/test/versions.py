@@ -301,3 +301,56 @@ class VersionsTest(unittest.TestCase):
         self.check_intersection(['2.5:2.7'],
                                 ['1.1:2.7'], ['2.5:3.0','1.0'])
         self.check_intersection(['0:1'], [':'], ['0:1'])
+
+
+    def test_intersection_of_long_lists(self):
+        evens = ['1.%d' % i for i in range(0, 200, 2)]
+        odds  = ['1.%d' % i for i in range(1, 200, 2)]
+        self.check_intersection([], evens, odds)
+        self.check_intersection(evens[10:20], evens, ['1.20:1.38'])
+        self.check_intersection(['1.198', '2:2.5'],
+                                evens + ['2:3'], odds + ['1.198', '1.200:2.5'])
+
+
+    def test_union_of_long_lists(self):
+        evens = ['1.%d' % i for i in range(0, 200, 2)]
+        odds  = ['1.%d' % i for i in range(1, 200, 2)]
+        both = ver(evens).union(ver(odds))
+        self.assertEqual(both, ver(['1.%d' % i for i in range(200)]))
+        self.assertEqual(len(both), 200)
+        self.assertEqual(both.union(ver(['1.50:1.149'])),
+                         ver(evens[:25] + odds[:25] + ['1.50:1.149'] +
+                             evens[75:] + odds[75:]))
+
+
+    def test_unsorted_list_construction(self):
+        self.assertEqual(
+            ver(['2.0', '1.0:1.5', '1.2', '3:', '2.0', ':0.5', '1.5:1.7']).versions,
+            [ver(':0.5'), ver('1.0:1.7'), ver('2.0'), ver('3:')])
+        self.assertEqual(ver(['1.0:', ':2.0', '5']).versions, [ver(':')])
+        self.assertEqual(ver(['1.0:1.0']).versions, [Version('1.0')])
+        self.assertEqual(ver([ver(['1.0', '2.0']), '1.5']),
+                         ver(['1.0', '1.5', '2.0']))
+
+
+    def test_versions_are_interned(self):
+        self.assertIs(Version('1.2.3'), Version('1.2.3'))
+        self.assertIs(ver('1.2.3'), Version('1.2.3'))
+        self.assertIs(ver('1.2:1.4').start, Version('1.2'))
+        self.assertIsNot(Version('1.2.3'), Version('1.2.4'))
+        self.assertEqual(Version('1.2.3').string, '1.2.3')
+
+
+    def test_version_keys(self):
+        # Numbers are newer than letters, and longer versions are newer.
+        versions = [Version(v) for v in
+                    ('1.0', '1.0a', '1.0.1', 'a', '2', '1.0b', '1')]
+        expected = ['a', '1', '1.0', '1.0a', '1.0b', '1.0.1', '2']
+        self.assertEqual([str(v) for v in sorted(versions)], expected)
+        self.assertEqual(
+            [str(v) for v in sorted(versions, key=lambda v: v.key)], expected)
+
+        self.assertEqual(hash(Version('1.0')), hash(Version('1.00')))
+        self.assertTrue(Version('1.0') > None)
+        self.assertFalse(Version('1.0') <= None)
+        self.assertTrue(Version('1.2') < ver('1.3:1.4'))
@@ -0,0 +1,531 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""\
+Tests for spidering the web and finding the available versions of a
+package.  Pages are written to a temporary directory, and read either
+through file:// URLs or from a local HTTP server, so these tests don't
+need a network connection.
+"""
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import BaseHTTPServer
+import SimpleHTTPServer
+import SocketServer
+
+import spack
+import spack.error
+import spack.package
+import spack.packages as packages
+import spack.util.web as web
+from spack.util.listing_cache import ListingCache, CacheEntry
+from spack.package import find_versions_of_archive, find_versions_by_probing
+from spack.version import *
+from spack.test.mock_packages_test import mock_packages_path
+
+
+class MockRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """Serves files from the server's root directory, keeps connections
+       alive, and records what was asked for."""
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        SimpleHTTPServer.SimpleHTTPRequestHandler.setup(self)
+        with self.server.lock:
+            self.server.connections += 1
+
+
+    def do_GET(self):
+        self.respond(SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET)
+
+
+    def do_HEAD(self):
+        self.respond(SimpleHTTPServer.SimpleHTTPRequestHandler.do_HEAD)
+
+
+    def respond(self, serve):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path))
+            server.active += 1
+            server.max_active = max(server.active, server.max_active)
+        try:
+            time.sleep(server.delay)
+            if self.path in server.redirects:
+                self.send_response(301)
+                self.send_header('Location', server.redirects[self.path])
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            elif self.not_modified():
+                with server.lock:
+                    server.revalidated += 1
+                self.send_response(304)
+                self.end_headers()
+            else:
+                serve(self)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+    def not_modified(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            return False
+        last_modified = self.date_time_string(os.stat(path).st_mtime)
+        return self.headers.get('If-Modified-Since') == last_modified
+
+
+    def translate_path(self, path):
+        return os.path.join(self.server.root, path.split('?')[0].lstrip('/'))
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, root):
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), MockRequestHandler)
+        self.root = root
+        self.lock = threading.Lock()
+        self.requests = []
+        self.redirects = {}
+        self.connections = 0
+        self.revalidated = 0
+        self.active = self.max_active = 0
+        self.delay = 0
+
+
+    def handle_error(self, request, client_address):
+        # The spider hangs up on responses that aren't HTML.
+        pass
+
+
+class WebTestCase(unittest.TestCase):
+    """Keeps the caches of each test in temporary directories, and
+       writes pages for it to fetch.  This has no tests of its own."""
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.root = 'file://' + self.tmpdir
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.saved = (spack.listing_cache_path, spack.probe_cache_path,
+                      spack.versions_cache_path, spack.listing_cache_ttl,
+                      spack.versions_cache_ttl, spack.offline)
+        spack.listing_cache_path = os.path.join(self.cache_dir, 'listings')
+        spack.probe_cache_path = os.path.join(self.cache_dir, 'probes')
+        spack.versions_cache_path = os.path.join(self.cache_dir, 'versions')
+        spack.listing_cache_ttl = 60
+        spack.versions_cache_ttl = 60
+        spack.offline = False
+
+
+    def tearDown(self):
+        (spack.listing_cache_path, spack.probe_cache_path,
+         spack.versions_cache_path, spack.listing_cache_ttl,
+         spack.versions_cache_ttl, spack.offline) = self.saved
+        shutil.rmtree(self.tmpdir, True)
+        shutil.rmtree(self.cache_dir, True)
+
+
+    def write_page(self, name, *links):
+        with open(os.path.join(self.tmpdir, name), 'w') as f:
+            f.write('<html><body>\n')
+            for link in links:
+                f.write('<a href="%s">%s</a>\n' % (link, link))
+            f.write('</body></html>\n')
+        return '%s/%s' % (self.root, name)
+
+
+class WebTest(WebTestCase):
+    def test_spider(self):
+        index = self.write_page('index.html', 'a.html', 'foo-1.0.tar.gz')
+        self.write_page('a.html', 'b.html')
+        self.write_page('b.html')
+
+        self.assertEqual([url for url, page in web.spider(index)], [index])
+        pages = web.get_pages(index, depth=2)
+        self.assertEqual(sorted(pages), [self.root + '/a.html', index])
+        self.assertIn('b.html', pages[self.root + '/a.html'])
+
+        # Only pages from the network are cached.
+        remote = not self.root.startswith('file:')
+        self.assertEqual(os.path.isdir(spack.listing_cache_path), remote)
+
+
+    def test_find_versions_of_archive(self):
+        links = ['foo-%s.tar.gz' % v
+                 for v in ('1.0', '1.2', '1.10', '2.0.1', '1.2', '1.0')]
+        index = self.write_page(
+            'index.html', 'bar-3.0.tar.gz', 'foo-1.3.zip', *links)
+
+        versions = find_versions_of_archive(
+            'http://example.com/foo-1.0.tar.gz', list_url=index)
+        self.assertEqual(versions, ver(['1.0', '1.2', '1.10', '2.0.1']))
+
+
+class VersionsCacheTest(WebTestCase):
+    def setUp(self):
+        super(VersionsCacheTest, self).setUp()
+        self.real_packages_path = spack.packages_path
+        spack.packages_path = mock_packages_path
+
+        self.pkg_class = packages.get('libelf').__class__
+        self.pkg_class.list_url = self.write_page(
+            'index.html', 'libelf-0.8.10.tar.gz', 'libelf-0.8.13.tar.gz')
+
+
+    def tearDown(self):
+        del self.pkg_class.list_url
+        spack.packages_path = self.real_packages_path
+        super(VersionsCacheTest, self).tearDown()
+
+
+    def test_versions_are_cached(self):
+        pkg = packages.get('libelf')
+        self.assertEqual(pkg.fetch_available_versions(), ver(['0.8.10', '0.8.13']))
+        self.assertTrue(os.path.exists(pkg.versions_cache_file))
+
+        # New packages use the cache until it's stale or refreshed.
+        self.write_page('index.html', 'libelf-0.8.14.tar.gz')
+        pkg = packages.get('libelf')
+        self.assertEqual(pkg.fetch_available_versions(), ver(['0.8.10', '0.8.13']))
+        self.assertEqual(pkg.fetch_available_versions(refresh=True), ver(['0.8.14']))
+
+        self.write_page('index.html', 'libelf-0.8.15.tar.gz')
+        pkg = packages.get('libelf')
+        self.assertEqual(pkg.fetch_available_versions(), ver(['0.8.14']))
+        spack.versions_cache_ttl = 0
+        pkg = packages.get('libelf')
+        self.assertEqual(pkg.fetch_available_versions(), ver(['0.8.15']))
+
+
+    def test_cache_is_per_list_url(self):
+        pkg = packages.get('libelf')
+        pkg.fetch_available_versions()
+        self.pkg_class.list_url = self.write_page(
+            'other.html', 'libelf-0.9.tar.gz')
+        pkg = packages.get('libelf')
+        self.assertIsNone(pkg.cached_available_versions())
+        self.assertEqual(pkg.fetch_available_versions(), ver(['0.9']))
+
+
+    def test_finding_no_versions_is_cached(self):
+        self.write_page('index.html')
+        pkg = packages.get('libelf')
+        self.assertEqual(pkg.fetch_available_versions(), ver([]))
+        self.assertEqual(pkg.cached_available_versions(), ver([]))
+
+        # Until the cache is stale, the page isn't read again.
+        self.write_page('index.html', 'libelf-0.8.13.tar.gz')
+        pkg = packages.get('libelf')
+        self.assertEqual(pkg.fetch_available_versions(), ver([]))
+        spack.versions_cache_ttl = 0
+        pkg = packages.get('libelf')
+        self.assertEqual(pkg.fetch_available_versions(), ver(['0.8.13']))
+
+
+class HttpSpiderTest(WebTest):
+    def setUp(self):
+        super(HttpSpiderTest, self).setUp()
+        self.no_proxy = os.environ.get('no_proxy')
+        os.environ['no_proxy'] = '127.0.0.1'
+
+        self.server = MockServer(self.tmpdir)
+        self.root = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.no_proxy is None:
+            del os.environ['no_proxy']
+        else:
+            os.environ['no_proxy'] = self.no_proxy
+        super(HttpSpiderTest, self).tearDown()
+
+
+    def requested(self):
+        return sorted(path for command, path in self.server.requests)
+
+
+    def test_pages_are_fetched_once(self):
+        index = self.write_page('index.html', 'a.html', 'b.html#top', 'b.html')
+        self.write_page('a.html', 'index.html', 'b.html', 'c.html')
+        self.write_page('b.html', 'a.html', '/index.html', 'foo-1.0.tar.gz')
+        self.write_page('c.html', 'index.html')
+
+        pages = web.get_pages(index, depth=3, concurrency=4)
+        self.assertEqual(sorted(pages), [self.root + '/a.html',
+                                         self.root + '/b.html',
+                                         self.root + '/c.html', index])
+        self.assertEqual(self.requested(),
+                         ['/a.html', '/b.html', '/c.html', '/index.html'])
+        self.assertTrue(all(command == 'GET'
+                            for command, path in self.server.requests))
+
+
+    def test_only_html_is_read(self):
+        with open(os.path.join(self.tmpdir, 'data.bin'), 'w') as f:
+            f.write('x' * 1000000)
+        index = self.write_page('index.html', 'data.bin', 'a.html')
+        self.write_page('a.html')
+
+        pages = web.get_pages(index, depth=2)
+        self.assertEqual(sorted(pages), [self.root + '/a.html', index])
+        self.assertEqual(self.requested(),
+                         ['/a.html', '/data.bin', '/index.html'])
+
+
+    def test_connections_are_reused(self):
+        links = ['%d.html' % i for i in range(10)]
+        index = self.write_page('index.html', *links)
+        for link in links:
+            self.write_page(link)
+
+        pages = web.get_pages(index, depth=2, concurrency=1)
+        self.assertEqual(len(pages), 11)
+        self.assertEqual(self.server.connections, 1)
+
+
+    def test_concurrency_is_bounded(self):
+        links = ['%d.html' % i for i in range(12)]
+        index = self.write_page('index.html', *links)
+        for link in links:
+            self.write_page(link)
+
+        self.server.delay = 0.02
+        pages = web.get_pages(index, depth=2, concurrency=3)
+        self.assertEqual(len(pages), 13)
+        self.assertTrue(1 < self.server.max_active <= 3)
+
+
+    def test_redirects(self):
+        index = self.write_page('index.html', 'old.html', 'a.html')
+        self.write_page('a.html')
+        self.server.redirects['/old.html'] = self.root + '/a.html'
+
+        pages = web.get_pages(index, depth=2, concurrency=1)
+        self.assertEqual(sorted(pages), [self.root + '/a.html', index])
+        self.assertEqual(self.requested().count('/a.html'), 1)
+
+
+    def test_missing_root(self):
+        self.assertRaises(spack.error.NoNetworkConnectionError,
+                          web.get_pages, self.root + '/missing.html')
+
+        # Errors below the root are ignored.
+        index = self.write_page('index.html', 'missing.html')
+        self.assertEqual(list(web.get_pages(index, depth=2)), [index])
+
+
+    def test_find_versions_over_http(self):
+        index = self.write_page('index.html', 'foo-1.0.tar.gz', 'old/')
+        os.mkdir(os.path.join(self.tmpdir, 'old'))
+        self.write_page('old/index.html', 'foo-0.9.tar.gz', 'foo-0.8.tar.gz')
+
+        versions = find_versions_of_archive(
+            self.root + '/foo-1.0.tar.gz', list_url=index, list_depth=2)
+        self.assertEqual(versions, ver(['0.8', '0.9', '1.0']))
+
+
+    def test_cached_pages_skip_the_network(self):
+        index = self.write_page('index.html', 'a.html', 'old.html')
+        self.write_page('a.html')
+        self.server.redirects['/old.html'] = self.root + '/a.html'
+
+        pages = web.get_pages(index, depth=2)
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.assertEqual(web.get_pages(index, depth=2), pages)
+        self.assertEqual(len(self.server.requests), 3)
+
+
+    def test_stale_pages_are_revalidated(self):
+        index = self.write_page('index.html', 'a.html')
+        a = self.write_page('a.html')
+        pages = web.get_pages(index, depth=2)
+
+        spack.listing_cache_ttl = 0
+        self.assertEqual(web.get_pages(index, depth=2), pages)
+        self.assertEqual(self.server.revalidated, 2)
+
+        # A page that changed is downloaded again.
+        self.write_page('a.html', 'foo-1.0.tar.gz')
+        a_path = os.path.join(self.tmpdir, 'a.html')
+        os.utime(a_path, (time.time() + 10, time.time() + 10))
+
+        pages = web.get_pages(index, depth=2)
+        self.assertEqual(self.server.revalidated, 3)
+        self.assertIn('foo-1.0.tar.gz', pages[a])
+
+        # The new page is used from the cache from then on.
+        spack.listing_cache_ttl = 60
+        self.assertEqual(web.get_pages(index, depth=2), pages)
+        self.assertEqual(len(self.server.requests), 6)
+
+
+    def test_offline(self):
+        index = self.write_page('index.html', 'a.html')
+        self.write_page('a.html')
+        pages = web.get_pages(index, depth=2)
+
+        spack.listing_cache_ttl = 0
+        spack.offline = True
+        self.assertEqual(web.get_pages(index, depth=2), pages)
+        self.assertEqual(len(self.server.requests), 2)
+
+        self.assertRaises(spack.error.NoNetworkConnectionError,
+                          web.get_pages, self.root + '/b.html')
+        self.assertEqual(len(self.server.requests), 2)
+
+
+    def write_archives(self, *versions):
+        for v in versions:
+            open(os.path.join(self.tmpdir, 'foo-%s.tar.gz' % v), 'w').close()
+
+
+    def test_probe(self):
+        self.write_archives('1.0', '1.1')
+        self.server.redirects['/old.tar.gz'] = self.root + '/foo-1.0.tar.gz'
+        urls = ['%s/%s' % (self.root, name) for name in
+                ('foo-1.0.tar.gz', 'old.tar.gz', 'foo-1.1.tar.gz',
+                 'foo-1.2.tar.gz')]
+
+        # The missing one is last: the server hangs up after errors.
+        expected = dict(zip(urls, [True, True, True, False]))
+        self.assertEqual(web.probe(urls, concurrency=1), expected)
+        self.assertTrue(all(command == 'HEAD'
+                            for command, path in self.server.requests))
+        self.assertEqual(self.server.connections, 1)
+
+        # Answers, including missing archives, are cached.
+        requests = len(self.server.requests)
+        self.assertEqual(web.probe(urls), expected)
+        self.assertEqual(len(self.server.requests), requests)
+
+
+    def test_find_versions_by_probing(self):
+        self.write_archives('1.2.3', '1.2.4', '1.2.6', '1.3.0', '1.3.1')
+
+        self.server.delay = 0.01
+        url_for_version = lambda v: '%s/foo-%s.tar.gz' % (self.root, v)
+        versions = find_versions_by_probing(
+            url_for_version, [Version('1.2.3')], concurrency=2, lookahead=2)
+        self.assertEqual(versions, ver(['1.2.3', '1.2.4', '1.2.6',
+                                        '1.3.0', '1.3.1']))
+        self.assertTrue(self.server.max_active <= 2)
+
+        # Each candidate is only probed once.
+        paths = self.requested()
+        self.assertEqual(len(paths), len(set(paths)))
+        self.assertNotIn('/foo-1.2.3.tar.gz', paths)
+
+
+class ProbeLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.real_probe = spack.package.probe
+        self.probed = []
+        def probe_everything(urls, **kwargs):
+            self.probed.extend(urls)
+            return dict((url, True) for url in urls)
+        spack.package.probe = probe_everything
+
+
+    def tearDown(self):
+        spack.package.probe = self.real_probe
+
+
+    def test_probes_are_limited(self):
+        url_for_version = lambda v: 'http://example.com/foo-%s.tar.gz' % v
+        versions = find_versions_by_probing(
+            url_for_version, [Version('1.0')], max_probes=50)
+        self.assertEqual(len(self.probed), 50)
+        self.assertEqual(len(versions), 51)
+
+
+    def test_probing_stops_when_nothing_is_found(self):
+        rounds = []
+        spack.package.probe = lambda urls, **kwargs: rounds.append(urls) or {}
+        url_for_version = lambda v: 'http://example.com/foo-%s.tar.gz' % v
+        versions = find_versions_by_probing(
+            url_for_version, [Version('1.2')], rounds=100)
+        self.assertEqual(versions, ver(['1.2']))
+        self.assertEqual(len(rounds), 1)
+
+
+class ListingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = ListingCache(self.tmpdir, 60, 2500)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, True)
+
+
+    def test_entries(self):
+        url = 'http://example.com/foo/'
+        self.assertIsNone(self.cache.get(url))
+
+        self.cache.put(CacheEntry(url, page='<html/>', etag='"abc"'))
+        entry = self.cache.get(url)
+        self.assertEqual(entry.page, '<html/>')
+        self.assertEqual(entry.validators(), {'If-None-Match' : '"abc"'})
+        self.assertTrue(self.cache.is_fresh(entry))
+
+        entry.time -= 120
+        self.cache.put(entry)
+        entry = self.cache.get(url)
+        self.assertFalse(self.cache.is_fresh(entry))
+        self.cache.refresh(entry)
+        self.assertTrue(self.cache.is_fresh(self.cache.get(url)))
+
+
+    def test_least_recently_used_entries_are_evicted(self):
+        urls = ['http://example.com/%d/' % i for i in range(3)]
+        for i, url in enumerate(urls):
+            self.cache.put(CacheEntry(url, page='x' * 1000))
+            path = self.cache.path_for(url)
+            os.utime(path, (time.time() - 100 + i, time.time() - 100 + i))
+
+        # Using the oldest entry makes it the newest.
+        self.assertIsNotNone(self.cache.get(urls[0]))
+        self.cache.prune()
+
+        self.assertIsNotNone(self.cache.get(urls[0]))
+        self.assertIsNone(self.cache.get(urls[1]))
+        self.assertIsNotNone(self.cache.get(urls[2]))
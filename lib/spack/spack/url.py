@@ -50,6 +50,7 @@ import re
 import spack.error
 import spack.util.filesystem as fs
 from spack.version import Version
+from spack.util.lang import LRUCache
 
 #
 # Note: We call the input to most of these functions a "path" but the functions
@@ -78,107 +79,217 @@ class UndetectableNameError(UrlParseError):
             "Couldn't parse package name in: " + path, path)
 
 
-def parse_version_string_with_indices(path):
-    """Try to extract a version string from a filename or URL.  This is taken
-       largely from Homebrew's Version class."""
+"""Patterns for finding the version in a path, in the order they are
+   tried.  This is taken largely from Homebrew's Version class.  Each
+   pattern is matched against either the whole path or its stem (the
+   path without its archive extension), as given by the second element.
+"""
+_version_types = tuple((re.compile(regex), on_stem) for regex, on_stem in [
+    # GitHub tarballs, e.g. v1.2.3
+    (r'github.com/.+/(?:zip|tar)ball/v?((\d+\.)+\d+)$', False),
 
-    if os.path.isdir(path):
-        stem = os.path.basename(path)
-    elif re.search(r'((?:sourceforge.net|sf.net)/.*)/download$', path):
-        stem = fs.stem(os.path.dirname(path))
-    else:
-        stem = fs.stem(path)
+    # e.g. https://github.com/sam-github/libnet/tarball/libnet-1.1.4
+    (r'github.com/.+/(?:zip|tar)ball/.*-((\d+\.)+\d+)$', False),
 
-    version_types = [
-        # GitHub tarballs, e.g. v1.2.3
-        (r'github.com/.+/(?:zip|tar)ball/v?((\d+\.)+\d+)$', path),
+    # e.g. https://github.com/isaacs/npm/tarball/v0.2.5-1
+    (r'github.com/.+/(?:zip|tar)ball/v?((\d+\.)+\d+-(\d+))$', False),
 
-        # e.g. https://github.com/sam-github/libnet/tarball/libnet-1.1.4
-        (r'github.com/.+/(?:zip|tar)ball/.*-((\d+\.)+\d+)$', path),
+    # e.g. https://github.com/petdance/ack/tarball/1.93_02
+    (r'github.com/.+/(?:zip|tar)ball/v?((\d+\.)+\d+_(\d+))$', False),
 
-        # e.g. https://github.com/isaacs/npm/tarball/v0.2.5-1
-        (r'github.com/.+/(?:zip|tar)ball/v?((\d+\.)+\d+-(\d+))$', path),
+    # e.g. https://github.com/erlang/otp/tarball/OTP_R15B01 (erlang style)
+    (r'[-_](R\d+[AB]\d*(-\d+)?)', False),
 
-        # e.g. https://github.com/petdance/ack/tarball/1.93_02
-        (r'github.com/.+/(?:zip|tar)ball/v?((\d+\.)+\d+_(\d+))$', path),
+    # e.g. boost_1_39_0
+    (r'((\d+_)+\d+)$', True),
 
-        # e.g. https://github.com/erlang/otp/tarball/OTP_R15B01 (erlang style)
-        (r'[-_](R\d+[AB]\d*(-\d+)?)', path),
+    # e.g. foobar-4.5.1-1
+    # e.g. ruby-1.9.1-p243
+    (r'-((\d+\.)*\d\.\d+-(p|rc|RC)?\d+)(?:[-._](?:bin|dist|stable|src|sources))?$', True),
 
-        # e.g. boost_1_39_0
-        (r'((\d+_)+\d+)$', stem),
+    # e.g. lame-398-1
+    (r'-((\d)+-\d)', True),
 
-        # e.g. foobar-4.5.1-1
-        # e.g. ruby-1.9.1-p243
-        (r'-((\d+\.)*\d\.\d+-(p|rc|RC)?\d+)(?:[-._](?:bin|dist|stable|src|sources))?$', stem),
+    # e.g. foobar-4.5.1
+    (r'-((\d+\.)*\d+)$', True),
 
-        # e.g. lame-398-1
-        (r'-((\d)+-\d)', stem),
+    # e.g. foobar-4.5.1b
+    (r'-((\d+\.)*\d+([a-z]|rc|RC)\d*)$', True),
 
-        # e.g. foobar-4.5.1
-        (r'-((\d+\.)*\d+)$', stem),
+    # e.g. foobar-4.5.0-beta1, or foobar-4.50-beta
+    (r'-((\d+\.)*\d+-beta(\d+)?)$', True),
 
-        # e.g. foobar-4.5.1b
-        (r'-((\d+\.)*\d+([a-z]|rc|RC)\d*)$', stem),
+    # e.g. foobar4.5.1
+    (r'((\d+\.)*\d+)$', True),
 
-        # e.g. foobar-4.5.0-beta1, or foobar-4.50-beta
-        (r'-((\d+\.)*\d+-beta(\d+)?)$', stem),
+    # e.g. foobar-4.5.0-bin
+    (r'-((\d+\.)+\d+[a-z]?)[-._](bin|dist|stable|src|sources?)$', True),
 
-        # e.g. foobar4.5.1
-        (r'((\d+\.)*\d+)$', stem),
+    # e.g. dash_0.5.5.1.orig.tar.gz (Debian style)
+    (r'_((\d+\.)+\d+[a-z]?)[.]orig$', True),
 
-        # e.g. foobar-4.5.0-bin
-        (r'-((\d+\.)+\d+[a-z]?)[-._](bin|dist|stable|src|sources?)$', stem),
+    # e.g. http://www.openssl.org/source/openssl-0.9.8s.tar.gz
+    (r'-([^-]+)', True),
 
-        # e.g. dash_0.5.5.1.orig.tar.gz (Debian style)
-        (r'_((\d+\.)+\d+[a-z]?)[.]orig$', stem),
+    # e.g. astyle_1.23_macosx.tar.gz
+    (r'_([^_]+)', True),
 
-        # e.g. http://www.openssl.org/source/openssl-0.9.8s.tar.gz
-        (r'-([^-]+)', stem),
+    # e.g. http://mirrors.jenkins-ci.org/war/1.486/jenkins.war
+    (r'\/(\d\.\d+)\/', False),
 
-        # e.g. astyle_1.23_macosx.tar.gz
-        (r'_([^_]+)', stem),
+    # e.g. http://www.ijg.org/files/jpegsrc.v8d.tar.gz
+    (r'\.v(\d+[a-z]?)', True)])
 
-        # e.g. http://mirrors.jenkins-ci.org/war/1.486/jenkins.war
-        (r'\/(\d\.\d+)\/', path),
+"""Sourceforge download links put the file name before a trailing
+   /download, so the stem has to be taken from the directory."""
+_sourceforge_download = re.compile(r'((?:sourceforge.net|sf.net)/.*)/download$')
 
-        # e.g. http://www.ijg.org/files/jpegsrc.v8d.tar.gz
-        (r'\.v(\d+[a-z]?)', stem)]
+"""Patterns for finding the package name in a path, in the order they
+   are tried.  Most of them must be followed by the version, and those
+   are marked with True.  Their regexes stop where the version should
+   start; see _find_name() for how the version is matched.
+"""
+_name_types = tuple((re.compile(regex), before) for regex, before in [
+    (r'/sourceforge/([^/]+)/', False),
+    (r'/([^/]+)/(tarball|zipball)/', False),
+    (r'/([^/]+)[_.-](bin|dist|stable|src|sources)[_.-]$', True),
+    (r'/([^/]+)[_.-]v?$', True),
+    (r'/([^/]+)$', True),
+    (r'^([^/]+)[_.-]v?$', True),
+    (r'^([^/]+)$', True)])
+
+"""Version strings that can be matched without compiling them as regexes:
+   all their characters are literal, except '.', which matches anything."""
+_simple_version = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+"""Parsed versions and names, keyed by path.  The same package URLs are
+   parsed over and over (for default versions, URLs of other versions,
+   and version wildcards), and listings have many links in common, so
+   results are memoized.  Paths that can't be parsed are cached as ()."""
+_version_cache = LRUCache(8192)
+_name_cache = LRUCache(8192)
+
+
+def _find_version(path, is_dir):
+    """Uncached implementation of parse_version_string_with_indices().
+       Returns () if no version can be found."""
+    if is_dir:
+        stem = os.path.basename(path)
+    elif _sourceforge_download.search(path):
+        stem = fs.stem(os.path.dirname(path))
+    else:
+        stem = fs.stem(path)
 
-    for vtype in version_types:
-        regex, match_string = vtype[:2]
-        match = re.search(regex, match_string)
+    for regex, on_stem in _version_types:
+        match = regex.search(stem if on_stem else path)
         if match and match.group(1) is not None:
-            return match.group(1), match.start(1), match.end(1)
+            ver = match.group(1)
+            return ver, match.start(1), match.end(1), Version(ver)
+    return ()
+
 
-    raise UndetectableVersionError(path)
+def _cached_version(path):
+    """The version string, its indices, and the Version found in a path.
+       Keeping the Version in the cache also keeps it interned."""
+    key = (path, os.path.isdir(path))
+    result = _version_cache.get(key)
+    if result is None:
+        result = _find_version(*key)
+        _version_cache[key] = result
+
+    if not result:
+        raise UndetectableVersionError(path)
+    return result
+
+
+def parse_version_string_with_indices(path):
+    """Try to extract a version string from a filename or URL.  Returns
+       the version string and its start and end indices in the path."""
+    return _cached_version(path)[:3]
 
 
 def parse_version(path):
     """Given a URL or archive name, extract a version from it and return
        a version object.
     """
-    ver, start, end = parse_version_string_with_indices(path)
-    return Version(ver)
+    return _cached_version(path)[3]
+
+
+def _version_positions(path, ver):
+    """Indices where ver matches in path.  Versions are used as regexes in
+       name patterns, so '.' in ver matches any character but a newline.
+    """
+    pieces = ver.split('.')
+    last = len(path) - len(ver)
+    positions = []
+    i = path.find(pieces[0])
+    while 0 <= i <= last:
+        j = i
+        for piece in pieces:
+            if not path.startswith(piece, j):
+                break
+            j += len(piece) + 1
+        else:
+            if '\n' not in path[i:i + len(ver)]:
+                positions.append(i)
+        i = path.find(pieces[0], i + 1)
+    return positions
+
+
+def _find_name(path, ver):
+    """Uncached implementation of parse_name().  Returns () if no name
+       can be found.
+
+       Rather than compiling every name pattern again for each version,
+       this finds where the version occurs and matches the part of each
+       pattern before the version so that it ends at one of those places.
+       Like a regex search, it takes the match that starts first, and of
+       those, the longest one.
+    """
+    if not _simple_version.match(ver):
+        # Versions with regex syntax in them have to be compiled.
+        for regex, before_version in _name_types:
+            if before_version:
+                regex = re.compile(regex.pattern[:-1] + ver)
+            match = regex.search(path)
+            if match:
+                return match.group(1)
+        return ()
+
+    positions = None
+    for regex, before_version in _name_types:
+        if not before_version:
+            match = regex.search(path)
+            if match:
+                return match.group(1)
+            continue
+
+        if positions is None:
+            positions = _version_positions(path, ver)
+
+        best = None
+        for pos in positions:
+            match = regex.search(path, 0, pos)
+            if match and (best is None or match.start() <= best.start()):
+                best = match
+        if best:
+            return best.group(1)
+    return ()
 
 
 def parse_name(path, ver=None):
     if ver is None:
         ver = parse_version(path)
 
-    ntypes = (r'/sourceforge/([^/]+)/',
-              r'/([^/]+)/(tarball|zipball)/',
-              r'/([^/]+)[_.-](bin|dist|stable|src|sources)[_.-]%s' % ver,
-              r'/([^/]+)[_.-]v?%s' % ver,
-              r'/([^/]+)%s' % ver,
-              r'^([^/]+)[_.-]v?%s' % ver,
-              r'^([^/]+)%s' % ver)
+    key = (path, str(ver))
+    name = _name_cache.get(key)
+    if name is None:
+        name = _find_name(*key)
+        _name_cache[key] = name
 
-    for nt in ntypes:
-        match = re.search(nt, path)
-        if match:
-            return match.group(1)
-    raise UndetectableNameError(path)
+    if not name:
+        raise UndetectableNameError(path)
+    return name
 
 
 def parse_name_and_version(path):
@@ -187,6 +298,21 @@ def parse_name_and_version(path):
     return (name, ver)
 
 
+def parse_names_and_versions(paths):
+    """Parse names and versions out of many paths at once, e.g. all the
+       links on a spidered page.  Returns a dict from each path that could
+       be parsed to its (name, version).  Paths that can't be parsed are
+       left out, rather than raising an error.
+    """
+    parsed = {}
+    for path in set(paths):
+        try:
+            parsed[path] = parse_name_and_version(path)
+        except UrlParseError:
+            pass
+    return parsed
+
+
 def substitute_version(path, new_version):
     """Given a URL or archive name, find the version in the path and substitute
        the new version for it.
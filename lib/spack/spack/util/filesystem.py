@@ -27,6 +27,7 @@ import re
 import shutil
 import errno
 import getpass
+import tempfile
 from contextlib import contextmanager, closing
 
 import spack.tty as tty
@@ -60,11 +61,35 @@ def working_dir(dirname):
 def mkdirp(*paths):
     for path in paths:
         if not os.path.exists(path):
-            os.makedirs(path)
+            try:
+                os.makedirs(path)
+            except OSError, e:
+                # Someone else may have made it in the meantime.
+                if e.errno != errno.EEXIST or not os.path.isdir(path):
+                    raise
         elif not os.path.isdir(path):
             raise OSError(errno.EEXIST, "File alredy exists", path)
 
 
+def write_atomically(path, contents):
+    """Write contents to path, making its directory if needed.  This
+       writes a temporary file next to path and renames it into place,
+       so readers, even in other processes, see either the old file or
+       the new one and never a partial one.  Temporary files start with
+       '.tmp'.
+    """
+    dirname = os.path.dirname(path)
+    mkdirp(dirname)
+    fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(contents)
+        os.rename(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+
+
 def new_path(prefix, *args):
     path = str(prefix)
     for elt in args:
@@ -84,13 +109,17 @@ def ancestor(dir, n=1):
     return parent
 
 
+"""Patterns for the extensions of archive types, compiled once."""
+_archive_suffixes = tuple(re.compile(r'\.%s$' % ext)
+                          for ext in ALLOWED_ARCHIVE_TYPES)
+
+
 def stem(path):
     """Get the part of a path that does not include its compressed
        type extension."""
-    for type in ALLOWED_ARCHIVE_TYPES:
-        suffix = r'\.%s$' % type
-        if re.search(suffix, path):
-            return re.sub(suffix, "", path)
+    for suffix in _archive_suffixes:
+        if suffix.search(path):
+            return suffix.sub("", path)
     return path
 
 
@@ -27,6 +27,8 @@ import re
 import sys
 import functools
 import inspect
+import threading
+from collections import OrderedDict
 from spack.util.filesystem import new_path
 
 # Ignore emacs backups when listing modules
@@ -38,12 +40,11 @@ def caller_locals():
        This allows a fucntion to insert variables into its caller's
        scope.  Yes, this is some black magic, and yes it's useful
        for implementing things like depends_on and provides.
+
+       This uses sys._getframe() rather than inspect.stack(), which
+       reads source files for every frame on the stack.
     """
-    stack = inspect.stack()
-    try:
-        return stack[2][0].f_locals
-    finally:
-        del stack
+    return sys._getframe(2).f_locals
 
 
 def get_calling_package_name():
@@ -51,16 +52,11 @@ def get_calling_package_name():
        the module's name.  This is useful for getting the name of
        spack packages from inside a relation function.
     """
-    stack = inspect.stack()
-    try:
-        # get calling function name (the relation)
-        relation = stack[1][3]
-
-        # Make sure locals contain __module__
-        caller_locals = stack[2][0].f_locals
-    finally:
-        del stack
+    # get calling function name (the relation)
+    relation = sys._getframe(1).f_code.co_name
 
+    # Make sure locals contain __module__
+    caller_locals = sys._getframe(2).f_locals
     if not '__module__' in caller_locals:
         raise ScopeError(relation)
 
@@ -104,6 +100,50 @@ def memoized(obj):
     return memoizer
 
 
+class LRUCache(object):
+    """Dictionary-like cache that holds at most max_size entries.  When
+       the cache is full, the least recently used entry is evicted to
+       make room for a new one.  Access is guarded by a lock, so a
+       cache can be shared between threads.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it as most recently used,
+           or return default if the key is not cached."""
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+    def __contains__(self, key):
+        return key in self.entries
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
 def list_modules(directory, **kwargs):
     """Lists all of the modules, excluding __init__.py, in
        a particular directory."""
@@ -132,8 +172,10 @@ def key_ordering(cls):
        return the hash of this key.
 
        If a class already has __eq__, __ne__, __lt__, __le__, __gt__, or __ge__
-       defined, this decorator will overwrite them.  If the class does not
-       have a _cmp_key method, then this will raise a TypeError.
+       defined, this decorator will overwrite them.  A __hash__ defined by
+       the class itself is kept, so classes can cache their hashes.  If the
+       class does not have a _cmp_key method, then this will raise a
+       TypeError.
     """
     def setter(name, value):
         value.__name__ = name
@@ -150,7 +192,8 @@ def key_ordering(cls):
     setter('__gt__', lambda s,o: o is None or s._cmp_key() >  o._cmp_key())
     setter('__ge__', lambda s,o: o is None or s._cmp_key() >= o._cmp_key())
 
-    setter('__hash__', lambda self: hash(self._cmp_key()))
+    if '__hash__' not in cls.__dict__:
+        setter('__hash__', lambda self: hash(self._cmp_key()))
 
     return cls
 
@@ -0,0 +1,186 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+This is a persistent cache for the listing pages that spack spiders
+to find versions of packages.  Entries are kept on disk, one file per
+URL, so that they can be shared by separate spack runs.
+
+Each entry remembers the ETag and Last-Modified headers that the page
+came with.  Entries younger than the cache's ttl are used without
+going to the network at all.  Older ones are revalidated with a
+conditional request, so pages that haven't changed aren't downloaded
+again.  When the cache grows past its maximum size, the entries that
+were used least recently are removed.
+"""
+import os
+import time
+import json
+import hashlib
+
+import spack
+import spack.tty as tty
+from spack.util.filesystem import write_atomically
+
+
+class CacheEntry(object):
+    """What came back for a URL.  If the URL was redirected, location is
+       where it went and page is None.  Otherwise page is the page that
+       response_url returned, or None if it wasn't HTML.  status is the
+       HTTP status of the response."""
+    def __init__(self, url, **kwargs):
+        self.url = url
+        self.response_url = kwargs.get('response_url', url)
+        self.location = kwargs.get('location', None)
+        self.status = kwargs.get('status', 200)
+        self.page = kwargs.get('page', None)
+        self.etag = kwargs.get('etag', None)
+        self.last_modified = kwargs.get('last_modified', None)
+        self.time = kwargs.get('time', time.time())
+
+
+    def validators(self):
+        """Headers that ask the server to send the page only if it has
+           changed since this entry was stored."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class ListingCache(object):
+    """Stores CacheEntries in a directory, keyed by URL.
+
+       This is safe to use from several threads and several processes
+       at once: entries are written to a temporary file and renamed into
+       place, so readers see either the old entry or the new one.
+    """
+    def __init__(self, root, ttl, max_size):
+        self.root = root
+        self.ttl = ttl
+        self.max_size = max_size
+
+
+    def path_for(self, url):
+        return os.path.join(self.root, hashlib.sha1(url).hexdigest())
+
+
+    def get(self, url):
+        """The entry for url, or None if there isn't one."""
+        path = self.path_for(url)
+        try:
+            with open(path) as f:
+                header = json.loads(f.readline())
+                page = f.read() if header['page'] else None
+            if header['url'] != url:
+                return None
+
+            # Entries are evicted by the time they were last used.
+            os.utime(path, None)
+
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+        return CacheEntry(url, response_url=header['response_url'],
+                          location=header['location'], page=page,
+                          status=header['status'],
+                          etag=header['etag'],
+                          last_modified=header['last_modified'],
+                          time=header['time'])
+
+
+    def is_fresh(self, entry):
+        """Whether entry can be used without asking the server."""
+        return time.time() - entry.time < self.ttl
+
+
+    def put(self, entry):
+        header = { 'url'           : entry.url,
+                   'response_url'  : entry.response_url,
+                   'location'      : entry.location,
+                   'status'        : entry.status,
+                   'page'          : entry.page is not None,
+                   'etag'          : entry.etag,
+                   'last_modified' : entry.last_modified,
+                   'time'          : entry.time }
+        contents = json.dumps(header) + '\n' + (entry.page or '')
+        try:
+            write_atomically(self.path_for(entry.url), contents)
+        except (IOError, OSError), e:
+            # The cache is only an optimization.
+            tty.warn("Couldn't cache %s: %s" % (entry.url, e))
+
+
+    def refresh(self, entry):
+        """Record that the server said entry is still current."""
+        entry.time = time.time()
+        self.put(entry)
+
+
+    def prune(self):
+        """Remove the least recently used entries until the cache is no
+           bigger than max_size."""
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return
+
+        entries = []
+        for name in names:
+            # Skip files that other threads are still writing.
+            if name.startswith('.tmp'):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+        size = sum(entry_size for mtime, entry_size, path in entries)
+        for mtime, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+
+
+def listing_cache():
+    """The cache configured in spack's globals."""
+    return ListingCache(spack.listing_cache_path,
+                        spack.listing_cache_ttl,
+                        spack.listing_cache_size)
+
+
+def probe_cache():
+    """The cache for results of probing URLs, configured in spack's
+       globals."""
+    return ListingCache(spack.probe_cache_path,
+                        spack.listing_cache_ttl,
+                        spack.listing_cache_size)
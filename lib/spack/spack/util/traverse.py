@@ -0,0 +1,205 @@
+##############################################################################
+# Copyright (c) 2013, Lawrence Livermore National Security, LLC.
+# Produced at the Lawrence Livermore National Laboratory.
+#
+# This file is part of Spack.
+# Written by Todd Gamblin, tgamblin@llnl.gov, All rights reserved.
+# LLNL-CODE-647188
+#
+# For details, see https://scalability-llnl.github.io/spack
+# Please also see the LICENSE file for our notice and the LGPL.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License (as published by
+# the Free Software Foundation) version 2.1 dated February 1999.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the IMPLIED WARRANTY OF
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the terms and
+# conditions of the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+##############################################################################
+"""
+Iterative traversals of DAGs, shared by Specs and Packages.
+
+Each traversal takes a list of root nodes and a children function
+that returns a node's children in the order they should be visited.
+Traversals are iterative, so deep DAGs don't hit the recursion limit
+or pay for chains of nested generators.
+
+The depth-first and breadth-first traversals take these options:
+
+  cover    [=nodes|edges|paths]
+      Determines how extensively to cover the dag.  Possible values:
+
+      'nodes': Visit each node in the dag only once.  Every node
+               yielded by the traversal will be unique.
+      'edges': If a node has been visited once but is reached along a
+               new path from the root, yield it but do not descend
+               into it.  This traverses each 'edge' in the DAG once.
+      'paths': Explore every unique path reachable from the root.
+               This descends into visited subtrees and will yield
+               nodes twice if they're reachable by multiple paths.
+
+  depth    [=False]
+      When True, yields not just nodes, but also their depth from the
+      root in a (depth, node) tuple.
+
+  key      [=id]
+      Function used to track the identity of nodes in the traversal.
+
+  root     [=True]
+      If false, this won't yield the root nodes, just their descendents.
+
+  visited  [=None]
+      Set of keys of nodes that have already been visited.  Supply one
+      to share it between traversals; by default each traversal starts
+      with an empty one.
+
+topological() orders nodes so that each comes after all of its
+children (or, with reverse=True, before them).  It takes the key and
+root options.
+"""
+import heapq
+from collections import deque
+
+"""Valid values for the cover option."""
+cover_values = ('nodes', 'edges', 'paths')
+
+
+def _options(kwargs):
+    cover = kwargs.get('cover', 'nodes')
+    if cover not in cover_values:
+        raise ValueError("Invalid value for cover: %s.  Choices are %s"
+                         % (cover, ",".join(cover_values)))
+
+    visited = kwargs.get('visited')
+    if visited is None:
+        visited = set()
+
+    return (cover, kwargs.get('depth', False), kwargs.get('key', id),
+            kwargs.get('root', True), visited)
+
+
+def preorder(roots, children, **kwargs):
+    """Yields each node before its children."""
+    cover, depth, key_fun, yield_root, visited = _options(kwargs)
+
+    stack = [(0, node) for node in reversed(roots)]
+    pop, push = stack.pop, stack.extend
+    while stack:
+        d, node = pop()
+        key = key_fun(node)
+
+        if key in visited:
+            if cover == 'nodes':    continue
+            if yield_root or d > 0: yield (d, node) if depth else node
+            if cover == 'edges':    continue
+        else:
+            if yield_root or d > 0: yield (d, node) if depth else node
+            visited.add(key)
+
+        d += 1
+        push([(d, child) for child in reversed(children(node))])
+
+
+def postorder(roots, children, **kwargs):
+    """Yields each node after its children."""
+    cover, depth, key_fun, yield_root, visited = _options(kwargs)
+
+    # Each node goes on the stack twice: once to expand it, and once,
+    # below its children, to yield it after they are done.
+    stack = [(0, node, False) for node in reversed(roots)]
+    while stack:
+        d, node, expanded = stack.pop()
+        if not expanded:
+            key = key_fun(node)
+            if key in visited:
+                if cover == 'nodes':
+                    continue
+                expanded = (cover == 'edges')
+
+        if expanded:
+            if yield_root or d > 0: yield (d, node) if depth else node
+            continue
+
+        visited.add(key)
+        stack.append((d, node, True))
+        stack.extend([(d+1, child, False)
+                      for child in reversed(children(node))])
+
+
+def breadth_first(roots, children, **kwargs):
+    """Yields nodes in order of their distance from the roots."""
+    cover, depth, key_fun, yield_root, visited = _options(kwargs)
+
+    queue = deque((0, node) for node in roots)
+    while queue:
+        d, node = queue.popleft()
+        key = key_fun(node)
+
+        if key in visited:
+            if cover == 'nodes':    continue
+            if yield_root or d > 0: yield (d, node) if depth else node
+            if cover == 'edges':    continue
+        else:
+            if yield_root or d > 0: yield (d, node) if depth else node
+            visited.add(key)
+
+        queue.extend([(d+1, child) for child in children(node)])
+
+
+def topological(roots, children, **kwargs):
+    """Yields each node once, after all of its children, or before all
+       of them if reverse=True.  Nodes that are ready at the same time
+       come out in the order a preorder traversal would find them, so
+       the order is deterministic.
+    """
+    key_fun    = kwargs.get('key', id)
+    yield_root = kwargs.get('root', True)
+    reverse    = kwargs.get('reverse', False)
+
+    # Find every node, in preorder, along with the keys of its
+    # children and parents.
+    nodes = {}
+    position = {}
+    child_keys = {}
+    parent_keys = {}
+    stack = list(reversed(roots))
+    while stack:
+        node = stack.pop()
+        key = key_fun(node)
+        if key in nodes:
+            continue
+        nodes[key] = node
+        position[key] = len(position)
+        parent_keys.setdefault(key, set())
+
+        kids = children(node)
+        child_keys[key] = set(key_fun(child) for child in kids)
+        for child_key in child_keys[key]:
+            parent_keys.setdefault(child_key, set()).add(key)
+        stack.extend(reversed(kids))
+
+    # Then repeatedly take the earliest node that is waiting on nothing.
+    waiting_on, unblocks = child_keys, parent_keys
+    if reverse:
+        waiting_on, unblocks = parent_keys, child_keys
+
+    pending = dict((key, len(waiting_on[key])) for key in nodes)
+    ready = [(position[key], key) for key in nodes if not pending[key]]
+    heapq.heapify(ready)
+
+    root_keys = set(key_fun(node) for node in roots)
+    while ready:
+        pos, key = heapq.heappop(ready)
+        if yield_root or key not in root_keys:
+            yield nodes[key]
+
+        for other in unblocks[key]:
+            pending[other] -= 1
+            if not pending[other]:
+                heapq.heappush(ready, (position[other], other))
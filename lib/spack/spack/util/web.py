@@ -23,20 +23,38 @@
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
 import re
-import subprocess
+import socket
+import httplib
+import threading
+import urllib
 import urllib2
 import urlparse
-from multiprocessing import Pool
+from Queue import Queue, Empty
 from HTMLParser import HTMLParser
 
 import spack
 import spack.error
 import spack.tty as tty
 from spack.util.compression import ALLOWED_ARCHIVE_TYPES
+from spack.util.listing_cache import CacheEntry, listing_cache, probe_cache
 
 # Timeout in seconds for web requests
 TIMEOUT = 10
 
+# Maximum number of redirects to follow for one page
+MAX_REDIRECTS = 10
+
+# Connection classes for the URL schemes that the spider keeps
+# connections open for.  Other schemes are fetched with urllib2.
+_connection_types = { 'http'  : httplib.HTTPConnection,
+                      'https' : httplib.HTTPSConnection }
+
+# Statuses that redirect to the URL in the Location header.
+_redirects = (301, 302, 303, 307, 308)
+
+# Errors that mean a page couldn't be fetched.
+_network_errors = (urllib2.URLError, httplib.HTTPException, socket.error)
+
 
 class LinkParser(HTMLParser):
     """This parser just takes an HTML page and strips out the hrefs on the
@@ -52,93 +70,445 @@ class LinkParser(HTMLParser):
                     self.links.append(val)
 
 
-def _spider(args):
-    """_spider(url, depth, max_depth)
+def _is_archive(link):
+    return any(link.endswith(suf) for suf in ALLOWED_ARCHIVE_TYPES)
+
+
+class _Fetcher(object):
+    """Base class for things that fetch URLs from a pool of threads.
+       Subclasses implement _fetch(), and _load() puts the cache in
+       front of it.  Each thread keeps one connection open per host,
+       and reuses it for all of its requests to that host.  Threads
+       should call _close_all() when they're done."""
+    def __init__(self, cache, offline):
+        self.cache = cache
+        self.offline = offline
+        self.local = threading.local()
+        self.proxies = urllib.getproxies()
+
+
+    @property
+    def connections(self):
+        """This thread's open connections, by (scheme, host)."""
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        return self.local.connections
+
+
+    def _load(self, url):
+        """Get a CacheEntry for url, from the cache if it's fresh enough
+           and with _fetch() if it isn't."""
+        # Local files are always read directly.
+        remote = urlparse.urlsplit(url).scheme != 'file'
+        cache = self.cache if remote else None
+
+        entry = cache and cache.get(url)
+        if entry and (self.offline or cache.is_fresh(entry)):
+            return entry
+
+        if self.offline and remote:
+            raise urllib2.URLError(
+                "%s is not cached and spack is offline" % url)
+
+        fetched = self._fetch(url, entry)
+        if cache:
+            if fetched is entry:
+                cache.refresh(entry)
+            else:
+                cache.put(fetched)
+        return fetched
+
+
+    def _keeps_connections(self, parts):
+        """Whether the URL in parts is fetched on a kept-alive connection.
+           Other schemes, and URLs that go through a proxy, are left to
+           urllib2."""
+        if parts.scheme not in _connection_types:
+            return False
+        return (parts.scheme not in self.proxies or
+                urllib.proxy_bypass(parts.hostname or ''))
+
+
+    def _request(self, method, parts, headers):
+        """Send a request on this thread's connection to the host in parts,
+           opening one if needed.  A kept-alive connection may have been
+           closed by the server, so a failure on a reused connection is
+           retried once on a new one."""
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        key = (parts.scheme, parts.netloc)
+        while True:
+            conn = self.connections.get(key)
+            reused = conn is not None
+            if not reused:
+                conn_type = _connection_types[parts.scheme]
+                conn = conn_type(parts.netloc, timeout=TIMEOUT)
+                self.connections[key] = conn
+
+            try:
+                conn.request(method, path, headers=headers)
+                return conn.getresponse(), conn
+            except (httplib.HTTPException, socket.error):
+                self._close(parts, conn)
+                if not reused:
+                    raise
+
+
+    def _close(self, parts, conn):
+        conn.close()
+        self.connections.pop((parts.scheme, parts.netloc), None)
+
 
-       Fetches URL and any pages it links to up to max_depth.  depth should
-       initially be 1, and max_depth includes the root.  This function will
-       print out a warning only if the root can't be fetched; it ignores
-       errors with pages that the root links to.
+    def _close_all(self):
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
 
-       This will return a list of the pages fetched, in no particular order.
 
-       Takes args as a tuple b/c it's intended to be used by a multiprocessing
-       pool.  Firing off all the child links at once makes the fetch MUCH
-       faster for pages with lots of children.
+class _Spider(_Fetcher):
+    """Fetches pages breadth-first with a bounded pool of worker threads.
+
+       Every URL is fetched at most once: URLs are added to a visited set
+       when they are queued, and pages reached again through a redirect
+       are dropped.  Each worker keeps one connection open per host and
+       reuses it for all of its requests to that host.  Pages are fetched
+       with a single GET, and if the response isn't HTML, the connection
+       is dropped before the body is read, so big files aren't downloaded.
+
+       Pages from the network are looked up in the cache first, if there
+       is one.  Fresh entries are used as they are, and stale ones are
+       revalidated with a conditional GET.  If offline is true, cached
+       pages are always used, and pages that aren't cached are errors.
     """
-    url, depth, max_depth = args
+    def __init__(self, max_depth, concurrency, cache, offline):
+        super(_Spider, self).__init__(cache, offline)
+        self.max_depth = max_depth
+        self.concurrency = max(1, concurrency)
 
-    pages = {}
-    try:
-        # Make a HEAD request first to check the content type.  This lets
-        # us ignore tarballs and gigantic files.
-        # It would be nice to do this with the HTTP Accept header to avoid
-        # one round-trip.  However, most servers seem to ignore the header
-        # if you ask for a tarball with Accept: text/html.
-        req = urllib2.Request(url)
-        req.get_method = lambda: "HEAD"
-        resp = urllib2.urlopen(req, timeout=TIMEOUT)
-
-        if not "Content-type" in resp.headers:
-            print "ignoring page " + url
-            return pages
-
-        if not resp.headers["Content-type"].startswith('text/html'):
-            print "ignoring page " + url + " with content type " + resp.headers["Content-type"]
-            return pages
-
-        # Do the real GET request when we know it's just HTML.
-        req.get_method = lambda: "GET"
-        response = urllib2.urlopen(req, timeout=TIMEOUT)
-        response_url = response.geturl()
-
-        # Read the page and and stick it in the map we'll return
-        page = response.read()
-        pages[response_url] = page
+        self.tasks = Queue()
+        self.results = Queue()
+        self.lock = threading.Lock()
+        self.visited = set()
+        self.pending = 0
+        self.stopped = False
+
+
+    def run(self, root_url):
+        """Generator that yields (url, page) pairs as they are fetched."""
+        self._enqueue(root_url, 1)
+        workers = [threading.Thread(target=self._work)
+                   for i in range(self.concurrency)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        try:
+            while True:
+                # Poll, so that the main thread can still be interrupted.
+                try:
+                    result = self.results.get(True, 0.1)
+                except Empty:
+                    continue
+
+                if result is None:
+                    break
+                elif isinstance(result, Exception):
+                    raise result
+                yield result
+
+        finally:
+            # Workers finish the page they're on and then exit.
+            self.stopped = True
+            for worker in workers:
+                self.tasks.put(None)
+            if self.cache:
+                self.cache.prune()
+
+
+    def _claim(self, url):
+        """Add url to the visited set.  Returns False if it was already
+           there.  Call with the lock held."""
+        url = urlparse.urldefrag(url)[0]
+        if url in self.visited:
+            return False
+        self.visited.add(url)
+        return True
+
+
+    def _enqueue(self, url, depth):
+        """Queue url unless it has been seen already.  Call with the lock
+           held, except for the root."""
+        if self._claim(url):
+            self.pending += 1
+            self.tasks.put((urlparse.urldefrag(url)[0], depth))
+
+
+    def _work(self):
+        try:
+            while True:
+                task = self.tasks.get()
+                if task is None:
+                    break
+
+                url, depth = task
+                try:
+                    if not self.stopped:
+                        self._visit(url, depth)
+
+                except _network_errors, e:
+                    # Only report it if it's the root page.  We ignore
+                    # errors when spidering.
+                    if depth == 1:
+                        reason = getattr(e, 'reason', None) or str(e)
+                        self.results.put(
+                            spack.error.NoNetworkConnectionError(reason, url))
+
+                except Exception, e:
+                    # Other types of errors are completely ignored.
+                    pass
+
+                finally:
+                    with self.lock:
+                        self.pending -= 1
+                        if not self.pending:
+                            self.results.put(None)
+        finally:
+            self._close_all()
+
+
+    def _visit(self, url, depth):
+        response_url, page = self._get(url)
+        if page is None:
+            return
+        self.results.put((response_url, page))
 
         # If we're not at max depth, parse out the links in the page
-        if depth < max_depth:
+        if depth < self.max_depth:
             link_parser = LinkParser()
-
-            subcalls = []
             link_parser.feed(page)
-            while link_parser.links:
-                raw_link = link_parser.links.pop()
 
-                # Skip stuff that looks like an archive
-                if any(raw_link.endswith(suf) for suf in ALLOWED_ARCHIVE_TYPES):
-                    continue
+            with self.lock:
+                for raw_link in link_parser.links:
+                    # Skip stuff that looks like an archive
+                    if _is_archive(raw_link):
+                        continue
+
+                    # Evaluate the link relative to the page it came from.
+                    abs_link = urlparse.urljoin(response_url, raw_link)
+                    self._enqueue(abs_link, depth + 1)
+
+
+    def _get(self, url):
+        """GET url, following redirects.  Returns the URL the page came
+           from and the page.  The page is None if it isn't HTML, or if
+           it was redirected to a page that has already been visited."""
+        for i in range(MAX_REDIRECTS + 1):
+            entry = self._load(url)
+            if entry.location is None:
+                return entry.response_url, entry.page
+
+            url = urlparse.urljoin(url, entry.location)
+
+            # Don't fetch pages again that were reached another way.
+            with self.lock:
+                if not self._claim(url):
+                    return url, None
+
+        raise urllib2.URLError("Too many redirects")
+
+
+    def _fetch(self, url, entry):
+        """Fetch url without following redirects.  If entry is the
+           cached entry for url and the page hasn't changed, returns
+           entry.  Otherwise returns a new CacheEntry."""
+        parts = urlparse.urlsplit(url)
+        if not self._keeps_connections(parts):
+            return _urllib2_fetch(url, entry)
+
+        headers = entry.validators() if entry else {}
+        response, conn = self._request('GET', parts, headers)
+        status = response.status
+        if status == 304 and entry:
+            response.read()
+            return entry
+
+        elif status in _redirects:
+            response.read()
+            return CacheEntry(url, location=response.getheader('location'))
+
+        elif status != 200:
+            response.read()
+            raise urllib2.HTTPError(
+                url, status, response.reason, response.msg, None)
+
+        content_type = response.getheader('content-type', '')
+        if not content_type.startswith('text/html'):
+            tty.verbose("ignoring page %s with content type %s"
+                        % (url, content_type))
+            self._close(parts, conn)
+            return CacheEntry(url)
+
+        return CacheEntry(url, page=response.read(),
+                          etag=response.getheader('etag'),
+                          last_modified=response.getheader('last-modified'))
+
+
+class _Prober(_Fetcher):
+    """Checks whether URLs exist with HEAD requests, from a bounded pool
+       of worker threads.  Results are cached like the spider's pages,
+       but they are never revalidated: a HEAD request is as cheap as a
+       conditional one."""
+    def __init__(self, concurrency, cache, offline):
+        super(_Prober, self).__init__(cache, offline)
+        self.concurrency = max(1, concurrency)
+
+
+    def run(self, urls):
+        """Returns a dict from each URL in urls to whether it exists."""
+        tasks = Queue()
+        for url in urls:
+            tasks.put(url)
+
+        results = {}
+        workers = [threading.Thread(target=self._work, args=(tasks, results))
+                   for i in range(min(self.concurrency, len(urls)))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        for worker in workers:
+            # Join with a timeout, so that the main thread can still be
+            # interrupted.
+            while worker.is_alive():
+                worker.join(0.1)
 
-                # Evaluate the link relative to the page it came from.
-                abs_link = urlparse.urljoin(response_url, raw_link)
-                subcalls.append((abs_link, depth+1, max_depth))
+        if self.cache:
+            self.cache.prune()
+        return results
 
-            if subcalls:
-                pool = Pool(processes=len(subcalls))
-                dicts = pool.map(_spider, subcalls)
-                for d in dicts:
-                    pages.update(d)
 
-    except urllib2.URLError, e:
-        # Only report it if it's the root page.  We ignore errors when spidering.
-        if depth == 1:
-            raise spack.error.NoNetworkConnectionError(e.reason, url)
+    def _work(self, tasks, results):
+        try:
+            while True:
+                try:
+                    url = tasks.get_nowait()
+                except Empty:
+                    break
 
-    except Exception, e:
-        # Other types of errors are completely ignored.
-        pass
+                try:
+                    results[url] = (self._load(url).status == 200)
+                except _network_errors:
+                    # Failures that aren't answers from the server aren't
+                    # cached, so they are tried again next time.
+                    results[url] = False
+        finally:
+            self._close_all()
 
-    return pages
+
+    def _fetch(self, url, entry):
+        """HEAD url, following redirects, and return a CacheEntry with
+           the final status."""
+        target = url
+        for i in range(MAX_REDIRECTS + 1):
+            parts = urlparse.urlsplit(target)
+            if not self._keeps_connections(parts):
+                return CacheEntry(url, status=_urllib2_status(target))
+
+            response, conn = self._request('HEAD', parts, {})
+            response.read()
+            if response.status in _redirects:
+                target = urlparse.urljoin(
+                    target, response.getheader('location'))
+                continue
+
+            return CacheEntry(url, response_url=target, status=response.status)
+
+        raise urllib2.URLError("Too many redirects")
+
+
+def _urllib2_status(url):
+    """Status of a HEAD request for url, made with urllib2.  URLs that
+       aren't HTTP give 200 if they can be opened."""
+    request = urllib2.Request(url)
+    request.get_method = lambda: 'HEAD'
+    try:
+        urllib2.urlopen(request, timeout=TIMEOUT).close()
+        return 200
+    except urllib2.HTTPError, e:
+        return e.code
+
+
+def _urllib2_fetch(url, entry):
+    """Fetch a URL with a scheme the spider doesn't keep connections for,
+       e.g. file:// or ftp://.  urllib2 follows redirects itself, so the
+       result is never a redirect.  Otherwise this is like
+       _Spider._fetch."""
+    headers = entry.validators() if entry else {}
+    try:
+        response = urllib2.urlopen(
+            urllib2.Request(url, headers=headers), timeout=TIMEOUT)
+    except urllib2.HTTPError, e:
+        if e.code == 304 and entry:
+            return entry
+        raise
+
+    response_url = response.geturl()
+    try:
+        content_type = response.headers.get('Content-type', '')
+        if not content_type.startswith('text/html'):
+            tty.verbose("ignoring page %s with content type %s"
+                        % (url, content_type))
+            return CacheEntry(url, response_url=response_url)
+
+        return CacheEntry(url, response_url=response_url,
+                          page=response.read(),
+                          etag=response.headers.get('ETag'),
+                          last_modified=response.headers.get('Last-Modified'))
+    finally:
+        response.close()
+
+
+def spider(root_url, **kwargs):
+    """Generator that fetches web pages from a root URL and yields
+       (url, page) pairs as they arrive, so that callers can process
+       each page without holding all of them.  Raises
+       NoNetworkConnectionError if the root can't be fetched.
+
+       If depth is specified (e.g., depth=2), then this will also fetch
+       pages linked from the root and its children up to depth.  At most
+       concurrency pages are fetched at once; the default is
+       spack.spider_concurrency.
+
+       Pages are cached in the listing cache configured in spack's
+       globals, unless another ListingCache is passed as cache, or
+       cache is None.  If offline is true (the default is spack.offline),
+       only cached pages are used.
+    """
+    max_depth = kwargs.get('depth', 1)
+    concurrency = kwargs.get('concurrency', spack.spider_concurrency)
+    cache = kwargs.get('cache', listing_cache())
+    offline = kwargs.get('offline', spack.offline)
+    return _Spider(max_depth, concurrency, cache, offline).run(root_url)
 
 
 def get_pages(root_url, **kwargs):
-    """Gets web pages from a root URL.
-       If depth is specified (e.g., depth=2), then this will also fetches pages
-       linked from the root and its children up to depth.
+    """Gets web pages from a root URL, as a dict from URL to page.
+       Takes the same arguments as spider().
+    """
+    return dict(spider(root_url, **kwargs))
+
+
+def probe(urls, **kwargs):
+    """Checks which of urls exist, with HEAD requests that are made
+       concurrently.  Returns a dict from each URL to True or False.
 
-       This will spawn processes to fetch the children, for much improved
-       performance over a sequential fetch.
+       Takes the same concurrency, cache and offline arguments as
+       spider().  The default cache is the probe cache configured in
+       spack's globals.
     """
-    max_depth = kwargs.setdefault('depth', 1)
-    pages =  _spider((root_url, 1, max_depth))
-    return pages
+    concurrency = kwargs.get('concurrency', spack.spider_concurrency)
+    cache = kwargs.get('cache', probe_cache())
+    offline = kwargs.get('offline', spack.offline)
+    return _Prober(concurrency, cache, offline).run(list(urls))
@@ -22,9 +22,9 @@
 # along with this program; if not, write to the Free Software Foundation,
 # Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
 ##############################################################################
-import tty
 from urlparse import urlparse
 
+import spack.error
 from spack.util.compression import allowed_archive
 
 ALLOWED_SCHEMES    = ["http", "https", "ftp", "file"]
@@ -32,7 +32,13 @@ ALLOWED_SCHEMES    = ["http", "https", "ftp", "file"]
 def url(url_string):
     url = urlparse(url_string)
     if url.scheme not in ALLOWED_SCHEMES:
-        tty.die("Invalid protocol in URL: '%s'" % url_string)
+        raise InvalidURLError("Invalid protocol in URL: '%s'" % url_string)
 
     if not allowed_archive(url_string):
-        tty.die("Invalid file type in URL: '%s'" % url_string)
+        raise InvalidURLError("Invalid file type in URL: '%s'" % url_string)
+
+
+class InvalidURLError(spack.error.SpackError):
+    """Raised when a package's URL can't be used to fetch it."""
+    def __init__(self, message):
+        super(InvalidURLError, self).__init__(message)
@@ -46,7 +46,9 @@ be called on any of the types::
 import os
 import sys
 import re
+import weakref
 from bisect import bisect_left
+import operator
 from functools import total_ordering, wraps
 
 import spack.util.none_high as none_high
@@ -55,6 +57,14 @@ import spack.error
 
 # Valid version characters
 VALID_VERSION = r'[A-Za-z0-9_.-]'
+_valid_version = re.compile(VALID_VERSION)
+
+"""Versions are split into alphabetical and numeric segments."""
+_segment_regex = re.compile(r'[a-zA-Z]+|[0-9]+')
+
+"""Versions that are currently in use, keyed by the strings they were
+   made from.  Version() returns these instead of making duplicates."""
+_versions = weakref.WeakValueDictionary()
 
 def int_if_int(string):
     """Convert a string to int if possible.  Otherwise, return a string."""
@@ -64,6 +74,18 @@ def int_if_int(string):
         return string
 
 
+def _segment_key(segment):
+    """Numbers are always "newer" than letters.  This is for consistency
+       with RPM.  See patch #60884 (and details) from bugzilla #50977 in
+       the RPM project at rpm.org.  Or look at rpmvercmp.c if you want to
+       see how this is implemented there.
+    """
+    if type(segment) == int:
+        return (1, segment)
+    else:
+        return (0, segment)
+
+
 def coerce_versions(a, b):
     """Convert both a and b to the 'greatest' type between them, in this order:
            Version < VersionRange < VersionList
@@ -93,6 +115,25 @@ def coerce_versions(a, b):
             return (VersionList([a]), b)
 
 
+def _compare_keys(op):
+    """Make a Version comparison method from an operator.  Versions are
+       compared by their precomputed keys; anything else is coerced, and
+       None is lower than any Version."""
+    name = '__%s__' % op.__name__
+    none_result = op(1, 0)
+
+    def compare(self, other):
+        if type(other) == Version:
+            return op(self.key, other.key)
+        elif other is None:
+            return none_result
+        else:
+            a, b = coerce_versions(self, other)
+            return getattr(a, name)(b)
+    compare.__name__ = name
+    return compare
+
+
 def coerced(method):
     """Decorator that ensures that argument types of a method are coerced."""
     @wraps(method)
@@ -105,27 +146,50 @@ def coerced(method):
     return coercing_method
 
 
-@total_ordering
 class Version(object):
-    """Class to represent versions"""
-    def __init__(self, string):
+    """Class to represent versions.  Versions are immutable, so they are
+       interned: constructing a Version from a string that a live Version
+       was made from returns that Version.
+
+       Each Version has a key that is computed once, when it is made, and
+       that sorts the way versions should.  Comparisons just compare keys.
+    """
+    __slots__ = ('string', 'version', 'separators', 'key', '__weakref__')
+
+    def __new__(cls, string):
         string = str(string)
+        interned = _versions.get(string)
+        if interned is not None:
+            return interned
 
-        if not re.match(VALID_VERSION, string):
+        if not _valid_version.match(string):
             raise ValueError("Bad characters in version string: %s" % string)
 
+        self = super(Version, cls).__new__(cls)
+
         # preserve the original string, but trimmed.
+        key = string
         string = string.strip()
         self.string = string
 
         # Split version into alphabetical and numeric segments
-        segment_regex = r'[a-zA-Z]+|[0-9]+'
-        segments = re.findall(segment_regex, string)
+        segments = _segment_regex.findall(string)
         self.version = tuple(int_if_int(seg) for seg in segments)
 
         # Store the separators from the original version string as well.
         # last element of separators is ''
-        self.separators = tuple(re.split(segment_regex, string)[1:-1])
+        self.separators = tuple(_segment_regex.split(string)[1:-1])
+
+        # Tuples compare element by element, and if the common prefix is
+        # equal, the one with more segments is bigger -- just like versions.
+        self.key = tuple(_segment_key(seg) for seg in self.version)
+
+        _versions[key] = self
+        return self
+
+
+    def __getnewargs__(self):
+        return (self.string,)
 
 
     def up_to(self, index):
@@ -188,51 +252,21 @@ class Version(object):
         return self
 
 
-    @coerced
-    def __lt__(self, other):
-        """Version comparison is designed for consistency with the way RPM
-           does things.  If you need more complicated versions in installed
-           packages, you should override your package's version string to
-           express it more sensibly.
-        """
-        if other is None:
-            return False
-
-        # Coerce if other is not a Version
-        # simple equality test first.
-        if self.version == other.version:
-            return False
-
-        for a, b in zip(self.version, other.version):
-            if a == b:
-                continue
-            else:
-                # Numbers are always "newer" than letters.  This is for
-                # consistency with RPM.  See patch #60884 (and details)
-                # from bugzilla #50977 in the RPM project at rpm.org.
-                # Or look at rpmvercmp.c if you want to see how this is
-                # implemented there.
-                if type(a) != type(b):
-                    return type(b) == int
-                else:
-                    return a < b
-
-        # If the common prefix is equal, the one with more segments is bigger.
-        return len(self.version) < len(other.version)
-
-
-    @coerced
-    def __eq__(self, other):
-        return (other is not None and
-                type(other) == Version and self.version == other.version)
-
-
-    def __ne__(self, other):
-        return not (self == other)
+    """Version comparison is designed for consistency with the way RPM
+       does things.  If you need more complicated versions in installed
+       packages, you should override your package's version string to
+       express it more sensibly.  See _segment_key() for details.
+    """
+    __lt__ = _compare_keys(operator.lt)
+    __le__ = _compare_keys(operator.le)
+    __gt__ = _compare_keys(operator.gt)
+    __ge__ = _compare_keys(operator.ge)
+    __eq__ = _compare_keys(operator.eq)
+    __ne__ = _compare_keys(operator.ne)
 
 
     def __hash__(self):
-        return hash(self.version)
+        return hash(self.key)
 
 
     @coerced
@@ -263,6 +297,8 @@ class Version(object):
 
 @total_ordering
 class VersionRange(object):
+    __slots__ = ('start', 'end')
+
     def __init__(self, start, end):
         if isinstance(start, basestring):
             start = Version(start)
@@ -365,9 +401,64 @@ class VersionRange(object):
         return out
 
 
+def _sort_key(version):
+    """Key that sorts Versions and VersionRanges by where they start, with
+       an open start lowest.  This is all a merge needs: elements that start
+       at the same place overlap, so their relative order doesn't matter.
+    """
+    start = version.lowest()
+    return (0,) if start is None else (1, start.key)
+
+
+def _span(start, end):
+    """The Version or VersionRange from start to end.  This normalizes
+       single-value version ranges."""
+    if start is not None and start == end:
+        return start
+    return VersionRange(start, end)
+
+
+def _merged(versions):
+    """Merge Versions and VersionRanges sorted by _sort_key into a sorted,
+       non-redundant list.  This is a single pass: since the input is
+       sorted by start, each element can only overlap the last one kept.
+       Endpoints are compared directly, without going through coerced
+       methods, since this is run on every element of a list.
+    """
+    result = []
+    last = start = end = None
+    for version in versions:
+        lo, hi = version.lowest(), version.highest()
+        if last is not None and (end is None or lo is None or not end < lo):
+            # Overlaps the last one kept, so extend that to cover both.
+            if end is not None and (hi is None or end < hi):
+                end = hi
+            last = _span(start, end)
+            result[-1] = last
+        else:
+            last = _span(lo, hi) if lo == hi else version
+            start, end = lo, hi
+            result.append(last)
+    return result
+
+
+def _flatten(vlist):
+    """Yield the Versions and VersionRanges in an iterable of version-ish
+       things, expanding VersionLists."""
+    for v in vlist:
+        v = ver(v)
+        if type(v) == VersionList:
+            for elt in v.versions:
+                yield elt
+        else:
+            yield v
+
+
 @total_ordering
 class VersionList(object):
     """Sorted, non-redundant list of Versions and VersionRanges."""
+    __slots__ = ('versions',)
+
     def __init__(self, vlist=None):
         self.versions = []
         if vlist is not None:
@@ -378,9 +469,9 @@ class VersionList(object):
                 else:
                     self.versions = [vlist]
             else:
-                vlist = list(vlist)
-                for v in vlist:
-                    self.add(ver(v))
+                # Sort everything once and merge in one pass, rather than
+                # inserting elements one at a time.
+                self.versions = _merged(sorted(_flatten(vlist), key=_sort_key))
 
 
     def add(self, version):
@@ -419,7 +510,11 @@ class VersionList(object):
 
 
     def copy(self):
-        return VersionList(self)
+        # Versions and ranges are never modified in place, and this list
+        # is already sorted and non-redundant, so a shallow copy will do.
+        clone = VersionList()
+        clone.versions = list(self.versions)
+        return clone
 
 
     def lowest(self):
@@ -448,21 +543,27 @@ class VersionList(object):
         if not other or not self:
             return False
 
+        # Walk both sorted lists, stepping past whichever element ends first.
         s = o = 0
         while s < len(self) and o < len(other):
-            if self[s].overlaps(other[o]):
-                return True
-            elif self[s] < other[o]:
+            sv, ov = self.versions[s], other.versions[o]
+            sstart, send = sv.lowest(), sv.highest()
+            ostart, oend = ov.lowest(), ov.highest()
+
+            if send is not None and ostart is not None and send < ostart:
                 s += 1
-            else:
+            elif oend is not None and sstart is not None and oend < sstart:
                 o += 1
+            else:
+                return True
         return False
 
 
     @coerced
     def update(self, other):
-        for v in other.versions:
-            self.add(v)
+        # Timsort finds the two sorted runs and merges them in linear time.
+        self.versions = _merged(
+            sorted(self.versions + other.versions, key=_sort_key))
 
 
     @coerced
@@ -474,11 +575,31 @@ class VersionList(object):
 
     @coerced
     def intersection(self, other):
-        # TODO: make this faster.  This is O(n^2).
+        """Merge the two sorted lists.  Elements of each list are disjoint,
+           so the intersections come out sorted and disjoint, too."""
         result = VersionList()
-        for s in self:
-            for o in other:
-                result.add(s.intersection(o))
+        versions = result.versions
+
+        s = o = 0
+        while s < len(self) and o < len(other):
+            sv, ov = self.versions[s], other.versions[o]
+            sstart, send = sv.lowest(), sv.highest()
+            ostart, oend = ov.lowest(), ov.highest()
+
+            start = none_low.max(sstart, ostart)
+            end = none_high.min(send, oend)
+            if start is None or end is None or not end < start:
+                versions.append(_span(start, end))
+
+            # Step past whichever element ends first, or both if they end
+            # together, since neither can overlap anything else then.
+            if send == oend:
+                s += 1
+                o += 1
+            elif none_high.lt(send, oend):
+                s += 1
+            else:
+                o += 1
         return result
 
 